@@ -0,0 +1,159 @@
+import hashlib
+import io
+import os
+import queue
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from metadata import LRUCache, read_metadata
+
+DEFAULT_THUMB_DIR = os.path.join(os.path.expanduser("~"), ".spotifypy", "thumbs")
+
+ROW_SIZE = 24
+FULL_SIZE = 200
+SIZES = (ROW_SIZE, FULL_SIZE)
+
+FOLDER_ART_NAMES = ("cover", "folder", "front", "album", "albumart")
+FOLDER_ART_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+# Row thumbnails requested but not started yet; older ones get cancelled
+# once the user has scrolled past them
+MAX_PENDING_ROWS = 96
+
+
+class AlbumArtCache:
+    # Cover art for tracks at row and now-playing sizes. Workers extract the
+    # embedded picture (or a folder.jpg-style file), decode and downscale it
+    # with PIL and keep the thumbnails in an on-disk cache. The Tk thread
+    # turns finished images into PhotoImages in deliver() and keeps them in
+    # bounded per-size LRUs.
+    def __init__(self, metadata, cache_dir=DEFAULT_THUMB_DIR, workers=2,
+                 row_budget=512, full_budget=8):
+        self.metadata = metadata
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="album-art")
+        self.photos = {ROW_SIZE: LRUCache(row_budget), FULL_SIZE: LRUCache(full_budget)}
+        self.missing = LRUCache(8192)
+        self.folder_art = LRUCache(1024)
+        self.results = queue.Queue()
+        self.pending = {}
+        self.pending_rows = OrderedDict()
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def photo(self, path, mtime, size):
+        return self.photos[size].get((path, mtime))
+
+    def request(self, path, mtime, size, callback):
+        # callback(photo) runs on the Tk thread; photo is None without art
+        key = (path, mtime)
+        photo = self.photos[size].get(key)
+        if photo is not None or self.missing.get(key):
+            callback(photo)
+            return
+        request = key + (size,)
+        if request in self.pending:
+            self.pending[request][1].append(callback)
+            return
+        future = self.pool.submit(self.load, path, mtime, size)
+        self.pending[request] = (future, [callback])
+        if size == ROW_SIZE:
+            self.pending_rows[request] = future
+            while len(self.pending_rows) > MAX_PENDING_ROWS:
+                stale, stale_future = self.pending_rows.popitem(last=False)
+                if stale_future.cancel():
+                    del self.pending[stale]
+
+    def thumb_path(self, path, mtime, size):
+        # size None names the marker file for tracks without any art
+        digest = hashlib.sha1(f"{path}|{mtime}".encode("utf-8", "surrogateescape")).hexdigest()
+        name = f"{digest}.none" if size is None else f"{digest}_{size}.jpg"
+        return os.path.join(self.cache_dir, digest[:2], name)
+
+    def find_folder_art(self, directory):
+        cached = self.folder_art.get(directory)
+        if cached is not None:
+            return cached
+        found = ""
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    name, ext = os.path.splitext(entry.name.lower())
+                    if name in FOLDER_ART_NAMES and ext in FOLDER_ART_EXTENSIONS:
+                        found = entry.path
+                        break
+        except OSError:
+            pass
+        self.folder_art.put(directory, found)
+        return found
+
+    def source_image(self, path, mtime):
+        from PIL import Image
+        data = self.metadata.art(path, mtime)
+        if data is None:
+            data = read_metadata(path, with_art=True).get("art")
+        if data:
+            return Image.open(io.BytesIO(data))
+        folder_image = self.find_folder_art(os.path.dirname(path))
+        if folder_image:
+            return Image.open(folder_image)
+        return None
+
+    def load(self, path, mtime, size):
+        # Worker: returns a PIL image of the requested size, or None. PIL
+        # is imported by the first worker, not at startup
+        from PIL import Image
+        image = None
+        thumb = self.thumb_path(path, mtime, size)
+        no_art = self.thumb_path(path, mtime, None)
+        try:
+            if os.path.exists(thumb):
+                image = Image.open(thumb)
+                image.load()
+            elif not os.path.exists(no_art):
+                source = self.source_image(path, mtime)
+                if source is not None:
+                    image = self.make_thumbnails(source, path, mtime)[size]
+                else:
+                    os.makedirs(os.path.dirname(no_art), exist_ok=True)
+                    open(no_art, "wb").close()
+        except Exception:
+            image = None
+        self.results.put(((path, mtime, size), image))
+
+    def make_thumbnails(self, source, path, mtime):
+        # JPEG draft mode decodes at a reduced scale, which is much faster
+        from PIL import Image, ImageOps
+        source.draft("RGB", (FULL_SIZE, FULL_SIZE))
+        full = ImageOps.fit(source.convert("RGB"), (FULL_SIZE, FULL_SIZE))
+        thumbnails = {FULL_SIZE: full, ROW_SIZE: full.resize((ROW_SIZE, ROW_SIZE), Image.LANCZOS)}
+        for size, image in thumbnails.items():
+            thumb = self.thumb_path(path, mtime, size)
+            try:
+                os.makedirs(os.path.dirname(thumb), exist_ok=True)
+                image.save(thumb, "JPEG", quality=85)
+            except OSError:
+                pass
+        return thumbnails
+
+    def deliver(self):
+        # Tk thread: wrap finished images in PhotoImages and run callbacks
+        while True:
+            try:
+                request, image = self.results.get_nowait()
+            except queue.Empty:
+                return
+            path, mtime, size = request
+            self.pending_rows.pop(request, None)
+            _, callbacks = self.pending.pop(request, (None, []))
+            photo = None
+            if image is None:
+                self.missing.put((path, mtime), True)
+            else:
+                from PIL import ImageTk
+                photo = ImageTk.PhotoImage(image)
+                self.photos[size].put((path, mtime), photo)
+            for callback in callbacks:
+                callback(photo)
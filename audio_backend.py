@@ -0,0 +1,210 @@
+import threading
+import time
+
+from instrumentation import metrics
+from streaming import namehint, open_stream
+
+
+class NullAudioBackend:
+    # Plays nothing but keeps a simulated clock, so the player core can run
+    # headless (benchmarks, machines without an audio device). finish()
+    # simulates the current track reaching its end.
+    end_events = True
+
+    def __init__(self):
+        self.path = None
+        self.queued = None
+        self.started = None
+        self.paused_at = None
+        self.volume = 1.0
+        self.pending_ends = 0
+
+    def load(self, path, stream=None):
+        # stream: as for PygameAudioBackend; nothing reads it here
+        if stream is not None:
+            stream.close()
+        self.path = path
+        self.queued = None
+        self.started = None
+
+    def play(self, start=0.0):
+        self.started = time.monotonic() - start
+        self.paused_at = None
+
+    def pause(self):
+        if self.started is not None and self.paused_at is None:
+            self.paused_at = time.monotonic()
+
+    def unpause(self):
+        if self.paused_at is not None:
+            self.started += time.monotonic() - self.paused_at
+            self.paused_at = None
+
+    def stop(self):
+        self.started = None
+        self.paused_at = None
+        self.queued = None
+
+    def seek(self, path, seconds, splice=None, stream=None):
+        # Like the pygame backend, the clock restarts at the seek target
+        if stream is not None:
+            stream.close()
+        self.queued = None
+        self.play()
+
+    def queue(self, path, stream=None):
+        if stream is not None:
+            stream.close()
+        self.queued = path
+
+    def set_volume(self, volume):
+        self.volume = volume
+
+    def get_pos(self):
+        if self.started is None:
+            return 0.0
+        return (self.paused_at or time.monotonic()) - self.started
+
+    def take_end_events(self):
+        count, self.pending_ends = self.pending_ends, 0
+        return count
+
+    def finish(self):
+        self.pending_ends += 1
+        if self.queued is not None:
+            self.path, self.queued = self.queued, None
+            self.started = time.monotonic()
+        else:
+            self.started = None
+
+
+class PygameAudioBackend:
+    # pygame.mixer.music behind the same interface as NullAudioBackend.
+    # Tracks are handed to pygame as buffered streams (local files and
+    # http(s) URLs alike), so playback starts after the first chunk and
+    # memory stays bounded however long the file is. pygame keeps a
+    # reference to each stream for as long as it plays it. load(), seek()
+    # and queue() take an already open stream (see prepare_stream()), so
+    # remote tracks can be connected to off the Tk thread.
+    #
+    # Importing pygame and opening the audio device take a noticeable part
+    # of startup, so start() does both on a thread and the first call that
+    # needs the mixer waits for it (or does it then, without start()).
+    # Until then there is nothing to pause or stop, and the volume is
+    # applied once the mixer is open.
+    def __init__(self):
+        self.pygame = None
+        self.music = None
+        self.MUSIC_END = None
+        # Assumed until the mixer is open; pygame 2 always has them
+        self.end_events = True
+        self.volume = None
+        self.init_thread = None
+        self.init_error = None
+
+    def start(self):
+        if self.init_thread is None:
+            self.init_thread = threading.Thread(target=self.init_mixer, daemon=True)
+            self.init_thread.start()
+
+    def init_mixer(self):
+        try:
+            # Imported here so headless runs don't need pygame installed
+            import pygame
+            pygame.mixer.init()
+            self.pygame = pygame
+        except Exception as e:
+            self.init_error = e
+
+    def ensure_ready(self):
+        # Tk thread: waits for the mixer, then finishes the setup that has
+        # to happen on this thread. Raises if there's no audio.
+        if self.music is not None:
+            return
+        self.start()
+        self.init_thread.join()
+        if self.pygame is None:
+            self.init_thread = None  # Try again next time
+            raise RuntimeError(f"Audio could not be initialised: {self.init_error}")
+        # Posted when a track finishes (or the queued one starts)
+        self.MUSIC_END = self.pygame.USEREVENT + 1
+        self.music = self.pygame.mixer.music
+        self.end_events = self.enable_end_events()
+        if self.volume is not None:
+            self.music.set_volume(self.volume)
+
+    def enable_end_events(self):
+        # pygame delivers music end events through its event queue, which
+        # only works once the display module is initialised (no window is
+        # opened)
+        try:
+            self.pygame.display.init()
+        except self.pygame.error:
+            return False
+        self.music.set_endevent(self.MUSIC_END)
+        return True
+
+    def clear_end_events(self):
+        # stop() fires the end event too; that isn't a track ending
+        if self.end_events and self.music is not None:
+            self.pygame.event.clear(self.MUSIC_END)
+
+    def take_end_events(self):
+        if not self.end_events or self.music is None:
+            return 0
+        return len(self.pygame.event.get(self.MUSIC_END))
+
+    @metrics.timed("audio.load")
+    def load(self, path, stream=None):
+        # load() also drops whatever was queued. A file deleted since the
+        # library last saw it raises OSError here (the watcher removes it)
+        self.ensure_ready()
+        self.music.load(stream or open_stream(path), namehint(path))
+
+    def play(self, start=0.0):
+        self.ensure_ready()
+        self.music.play(start=start)
+        self.clear_end_events()
+
+    def pause(self):
+        if self.music is not None:
+            self.music.pause()
+
+    def unpause(self):
+        if self.music is not None:
+            self.music.unpause()
+
+    def stop(self):
+        if self.music is not None:
+            self.music.stop()
+            self.clear_end_events()
+
+    @metrics.timed("audio.seek")
+    def seek(self, path, seconds, splice=None, stream=None):
+        # splice is (head_end, offset) from the track's seek index: the
+        # track is reopened from that frame/page boundary, which costs the
+        # same anywhere in the file; stream is that reopened stream if the
+        # caller already has it. Without either, the decoder seeks itself.
+        # get_pos() restarts from 0 either way. Both drop the queue.
+        self.ensure_ready()
+        if stream is not None or splice:
+            self.music.load(stream or open_stream(path, *splice), namehint(path))
+            self.music.play()
+        else:
+            self.music.play(start=seconds)
+        self.clear_end_events()
+
+    @metrics.timed("audio.queue")
+    def queue(self, path, stream=None):
+        self.ensure_ready()
+        self.music.queue(stream or open_stream(path), namehint(path))
+
+    def set_volume(self, volume):
+        self.volume = volume
+        if self.music is not None:
+            self.music.set_volume(volume)
+
+    def get_pos(self):
+        if self.music is None:
+            return 0.0
+        return self.music.get_pos() / 1000  # Convert to seconds
@@ -0,0 +1,171 @@
+# Benchmarks for library-scale operations on the headless player core.
+#
+#   python bench.py                          # 1k / 10k / 100k tracks
+#   python bench.py --sizes 1000,10000 --save baseline.json
+#   python bench.py --compare baseline.json  # exit 1 on regressions
+#
+# Libraries are synthetic (no audio files are touched) and playback goes
+# through NullAudioBackend, so this runs without a display or sound card.
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+
+from audio_backend import NullAudioBackend
+from library_store import LibraryStore
+from player_core import PlayerCore
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+IMPORT_BATCH = 500
+NAV_STEPS = 2000
+LIKE_TOGGLES = 500
+FILTER_SWITCHES = 20
+
+SYLLABLES = ("ka", "lo", "mi", "ra", "ne", "to", "su", "va", "de", "qui",
+             "zon", "bel", "tri", "mar", "os", "lyn", "sha", "dor", "fe", "go")
+
+
+def word(rng):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def synthetic_infos(count, seed=0):
+    rng = random.Random(seed)
+    artists = [word(rng).title() for _ in range(max(1, count // 20))]
+    infos = []
+    for i in range(count):
+        artist = rng.choice(artists)
+        album = " ".join(word(rng) for _ in range(rng.randint(1, 3))).title()
+        title = " ".join(word(rng) for _ in range(rng.randint(1, 4))).title()
+        infos.append({
+            "path": f"/bench/{artist}/{album}/{i:06d} {title}.mp3",
+            "size": rng.randint(2_000_000, 12_000_000),
+            "mtime": 1_700_000_000.0 + i,
+            "duration": rng.uniform(90, 420),
+            "title": title,
+            "artist": artist,
+            "album": album,
+        })
+    return infos
+
+
+def per_op(func, count):
+    # Returns the mean time per call in milliseconds
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    return (time.perf_counter() - start) * 1000 / count
+
+
+def timings(func, inputs):
+    samples = []
+    for value in inputs:
+        start = time.perf_counter()
+        func(value)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "median": statistics.median(samples),
+        "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "max": samples[-1],
+    }
+
+
+def bench_library(count, seed=0):
+    infos = synthetic_infos(count, seed)
+    rng = random.Random(seed + 1)
+    core = PlayerCore(LibraryStore(":memory:"), NullAudioBackend())
+    # Preloader threads would only add scheduling noise to the timings
+    core.set_gapless(False)
+    results = {}
+
+    # Import in the same batch size the folder importer hands to the UI
+    start = time.perf_counter()
+    for i in range(0, count, IMPORT_BATCH):
+        core.add_tracks(infos[i:i + IMPORT_BATCH])
+    results["import_total_ms"] = (time.perf_counter() - start) * 1000
+
+    # Search keystrokes: type words from the library one letter at a time
+    keystrokes = []
+    for _ in range(10):
+        info = rng.choice(infos)
+        query = f"{info['artist']} {info['title']}".lower()[:12]
+        keystrokes.extend(query[:n] for n in range(1, len(query) + 1))
+    stats = summarize(timings(lambda q: core.search(q, 200), keystrokes))
+    results.update({f"search_keystroke_{k}_ms": v for k, v in stats.items()})
+
+    # Filter switches between the liked view and the full library
+    for track in list(core.registry.tracks.values())[::10]:
+        track.liked = True
+    switches = [i % 2 for i in range(FILTER_SWITCHES)]
+    stats = summarize(timings(
+        lambda liked: core.show_liked() if liked else core.set_filtered_view(None), switches))
+    results.update({f"filter_switch_{k}_ms": v for k, v in stats.items()})
+
+    # Navigation
+    core.play_index(count // 2)
+    results["next_track_ms"] = per_op(core.next_track, NAV_STEPS)
+    results["prev_track_ms"] = per_op(core.prev_track, NAV_STEPS)
+    core.toggle_shuffle()
+    results["next_track_shuffle_ms"] = per_op(core.next_track, NAV_STEPS)
+    core.toggle_shuffle()
+
+    # Like toggles, including the library write
+    results["like_toggle_ms"] = per_op(core.toggle_like, LIKE_TOGGLES)
+
+    core.library.close()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    # Returns the (size, metric, now, before) entries that got slower
+    regressions = []
+    for size, metrics in results.items():
+        for name, value in metrics.items():
+            before = baseline.get(size, {}).get(name)
+            # Ignore sub-0.05 ms noise
+            if before is not None and value > max(before * tolerance, before + 0.05):
+                regressions.append((size, name, value, before))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark library-scale player operations")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated library sizes")
+    parser.add_argument("--save", help="write results as JSON")
+    parser.add_argument("--compare", help="baseline JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=1.5,
+                        help="allowed slowdown factor against the baseline")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for size in (int(s) for s in args.sizes.split(",")):
+        results[str(size)] = bench_library(size)
+        print(f"{size} tracks")
+        for name, value in results[str(size)].items():
+            print(f"  {name:32} {value:10.3f}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for size, name, value, before in regressions:
+            print(f"REGRESSION {size} {name}: {value:.3f} ms (baseline {before:.3f} ms)")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+import threading
+
+from metadata import read_metadata
+from streaming import is_url, prepare_stream
+
+# How much of the upcoming file is read ahead of the transition
+HEAD_BYTES = 1024 * 1024
+
+
+class TrackPreloader:
+    # Reads the head of the upcoming track on a background thread so that
+    # handing it to pygame.mixer.music.queue only hits the page cache, and
+    # probes its duration if the library doesn't know it yet. Remote tracks
+    # are connected to here, so queue() gets an open stream and doesn't
+    # wait on the server. The worker publishes (track, duration, stream)
+    # under the lock, only if no newer preload() or cancel() came in
+    # meanwhile; take() hands it over once. stream is None for local files.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.track = None
+        self.result = None
+        self.generation = 0
+
+    def preload(self, track):
+        with self.lock:
+            self.generation += 1
+            self.track = track
+            self.discard()
+            generation = self.generation
+        threading.Thread(target=self.run, args=(track, generation), daemon=True).start()
+
+    def cancel(self):
+        with self.lock:
+            self.generation += 1
+            self.track = None
+            self.discard()
+
+    def discard(self):
+        # Caller holds the lock
+        if self.result is not None and self.result[2] is not None:
+            self.result[2].close()
+        self.result = None
+
+    def take(self):
+        # (track, duration, stream) of the finished preload, or None
+        with self.lock:
+            result, self.result = self.result, None
+        return result
+
+    def run(self, track, generation):
+        duration = track.duration
+        stream = None
+        try:
+            if is_url(track.path):
+                stream = prepare_stream(track.path)
+            else:
+                with open(track.path, "rb") as f:
+                    f.read(HEAD_BYTES)
+            if duration is None:
+                duration = read_metadata(track.path)["duration"]
+        except Exception:
+            if is_url(track.path) and stream is None:
+                return  # Not queued; playing it reports the error
+        with self.lock:
+            # A newer preload (or cancel) supersedes this one
+            if generation == self.generation:
+                self.result = (track, duration, stream)
+                return
+        if stream is not None:
+            stream.close()
@@ -0,0 +1,134 @@
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from metadata import read_metadata
+from streaming import is_url
+
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.ogg')
+
+# Number of probed tracks handed to the UI at once
+BATCH_SIZE = 500
+
+
+def scan_audio_files(folder_path, cancelled):
+    # Recursive os.scandir walk; yields (path, stat) for every audio file
+    pending = [folder_path]
+    while pending and not cancelled.is_set():
+        directory = pending.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif entry.name.lower().endswith(AUDIO_EXTENSIONS):
+                            yield entry.path, entry.stat()
+                    except OSError:
+                        continue
+        except OSError:
+            # Unreadable directory, skip it and keep going
+            continue
+
+
+def probe_track(path, stat=None):
+    return read_metadata(path, stat)
+
+
+class FolderImporter:
+    # Imports folder trees on a worker thread. Metadata probing runs in a
+    # thread pool and probed tracks are queued in batches for the UI thread,
+    # which drains them with poll() from a root.after loop.
+    #
+    # When known maps path -> (size, mtime) from the library index, only new
+    # or changed files are probed, and known files that no longer exist are
+    # collected in deleted once the scan completes (an incremental rescan).
+    def __init__(self, folder_paths, known=None, workers=8, batch_size=BATCH_SIZE):
+        self.folder_paths = list(folder_paths)
+        self.known = known or {}
+        self.seen = set()
+        self.deleted = []
+        self.workers = workers
+        self.batch_size = batch_size
+        self.results = queue.Queue()
+        self.cancelled = threading.Event()
+        self.found = 0
+        self.probed = 0
+        self.finished = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                chunk = []
+                for path, stat in self.scan():
+                    self.found += 1
+                    if self.known.get(path) == (stat.st_size, stat.st_mtime):
+                        self.probed += 1
+                        continue
+                    chunk.append((path, stat))
+                    if len(chunk) >= self.batch_size:
+                        self.probe_chunk(pool, chunk)
+                        chunk = []
+                if chunk and not self.cancelled.is_set():
+                    self.probe_chunk(pool, chunk)
+        finally:
+            # Sentinel: tells the UI the import is over
+            self.results.put(None)
+
+    def scan(self):
+        for folder_path in self.folder_paths:
+            for path, stat in scan_audio_files(folder_path, self.cancelled):
+                self.seen.add(path)
+                yield path, stat
+        if not self.known or self.cancelled.is_set():
+            return
+        # Known files outside the scanned roots (or in unreadable folders)
+        # are checked individually before being reported as deleted
+        for path in self.known:
+            if path in self.seen or is_url(path):
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                self.deleted.append(path)
+                continue
+            self.seen.add(path)
+            yield path, stat
+
+    def probe_chunk(self, pool, chunk):
+        batch = []
+        for path, stat in chunk:
+            if self.cancelled.is_set():
+                return
+            batch.append(pool.submit(probe_track, path, stat))
+        infos = []
+        for future in batch:
+            try:
+                infos.append(future.result())
+            except Exception:
+                continue  # Gone or unreadable; still counts as probed
+        self.probed += len(batch)
+        self.results.put(infos)
+
+    def poll(self):
+        # Returns the batches queued so far; sets finished once the
+        # worker is done and everything has been drained
+        batches = []
+        while True:
+            try:
+                batch = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if batch is None:
+                self.finished = True
+                break
+            batches.append(batch)
+        return batches
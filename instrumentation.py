@@ -0,0 +1,284 @@
+import csv
+import functools
+import json
+import time
+
+# Histogram bucket i counts durations of [2^(i-1), 2^i) microseconds
+BUCKETS = 32
+
+# Tk heartbeat: expected interval, and lateness that counts as a stall
+HEARTBEAT_MS = 100
+STALL_MS = 150
+
+OVERLAY_REFRESH_MS = 500
+OVERLAY_ROWS = 14
+
+
+class Histogram:
+    # Latency distribution with power-of-two microsecond buckets: recording
+    # is a bit_length() and two additions, and percentiles come out within
+    # a factor of two, which is enough to see where time goes. Updates
+    # from worker threads aren't locked; a rare lost count is acceptable.
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * BUCKETS
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[min(int(seconds * 1e6).bit_length(), BUCKETS - 1)] += 1
+
+    def percentile(self, fraction):
+        # Upper bound of the bucket holding the percentile, in seconds
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(self.max, (1 << i) / 1e6)
+        return self.max
+
+    def summary(self):
+        ms = 1000
+        return {"count": self.count,
+                "mean_ms": self.total / self.count * ms if self.count else 0.0,
+                "p50_ms": self.percentile(0.5) * ms,
+                "p95_ms": self.percentile(0.95) * ms,
+                "p99_ms": self.percentile(0.99) * ms,
+                "max_ms": self.max * ms}
+
+
+class Timer:
+    # Context manager for metrics.measure()
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.add(time.perf_counter() - self.start)
+        return False
+
+
+class NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class Metrics:
+    # Named latency histograms, counters and gauges. Gauges are callables
+    # read only when a snapshot is taken (widget counts, cache hit rates),
+    # so they cost nothing in between. With enabled off, timers and
+    # counters do nothing.
+    def __init__(self):
+        self.enabled = True
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.started = time.time()
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        return histogram
+
+    def record(self, name, seconds):
+        if self.enabled:
+            self.histogram(name).add(seconds)
+
+    def measure(self, name):
+        # with metrics.measure("name"): ...
+        return Timer(self.histogram(name)) if self.enabled else NULL_TIMER
+
+    def timed(self, name):
+        # Decorator recording every call of the function under name
+        def decorator(func):
+            histogram = self.histogram(name)
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    histogram.add(time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def gauge(self, name, func):
+        self.gauges[name] = func
+
+    def cache_gauges(self, name, cache):
+        # Hit rate and size of an LRUCache
+        self.gauge(f"{name}.hit_rate",
+                   lambda: cache.hits / (cache.hits + cache.misses) if cache.hits + cache.misses else 0.0)
+        self.gauge(f"{name}.size", lambda: len(cache))
+
+    def reset(self):
+        self.histograms = {name: Histogram() for name in self.histograms}
+        self.counters = {}
+        self.started = time.time()
+
+    def snapshot(self):
+        gauges = {}
+        for name, func in self.gauges.items():
+            try:
+                gauges[name] = func()
+            except Exception:
+                gauges[name] = None
+        return {"since": self.started,
+                "elapsed_s": time.time() - self.started,
+                "timings": {name: h.summary() for name, h in self.histograms.items() if h.count},
+                "counters": dict(self.counters),
+                "gauges": gauges}
+
+    def dump(self, path):
+        # .csv gets one row per metric, anything else JSON
+        snapshot = self.snapshot()
+        if not path.lower().endswith(".csv"):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f, indent=2)
+            return
+        fields = ("name", "kind", "count", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms",
+                  "value")
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fields)
+            writer.writeheader()
+            for name, summary in sorted(snapshot["timings"].items()):
+                writer.writerow({"name": name, "kind": "timing", **summary})
+            for name, value in sorted(snapshot["counters"].items()):
+                writer.writerow({"name": name, "kind": "counter", "value": value})
+            for name, value in sorted(snapshot["gauges"].items()):
+                writer.writerow({"name": name, "kind": "gauge", "value": value})
+
+
+# Shared by every module
+metrics = Metrics()
+
+
+class StallDetector:
+    # Schedules a heartbeat every HEARTBEAT_MS with after(). How late it
+    # fires is how long the event loop was busy: every lag is recorded in
+    # "tk.heartbeat_lag", and lags over STALL_MS also count as stalls.
+    def __init__(self, root, metrics=metrics, interval_ms=HEARTBEAT_MS, stall_ms=STALL_MS):
+        self.root = root
+        self.metrics = metrics
+        self.interval = interval_ms / 1000
+        self.stall = stall_ms / 1000
+        self.expected = None
+        self.after_id = None
+
+    def start(self):
+        self.expected = time.perf_counter() + self.interval
+        self.after_id = self.root.after(int(self.interval * 1000), self.beat)
+
+    def stop(self):
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
+
+    def beat(self):
+        now = time.perf_counter()
+        lag = max(0.0, now - self.expected)
+        self.metrics.record("tk.heartbeat_lag", lag)
+        if lag > self.stall:
+            self.metrics.count("tk.stalls")
+            self.metrics.record("tk.stall", lag)
+        self.expected = now + self.interval
+        self.after_id = self.root.after(int(self.interval * 1000), self.beat)
+
+
+class StartupProfile:
+    # Milestones of one startup, in seconds since start (a perf_counter()
+    # value taken as early as possible). Each is also recorded in metrics
+    # as "startup.<name>".
+    def __init__(self, start=None, metrics=metrics):
+        self.start = time.perf_counter() if start is None else start
+        self.metrics = metrics
+        self.marks = []
+
+    def mark(self, name):
+        elapsed = time.perf_counter() - self.start
+        self.marks.append((name, elapsed))
+        self.metrics.record(f"startup.{name}", elapsed)
+
+    def report(self):
+        lines = []
+        previous = 0.0
+        for name, elapsed in self.marks:
+            lines.append(f"{name:16} {elapsed * 1000:8.1f} ms  (+{(elapsed - previous) * 1000:.1f})")
+            previous = elapsed
+        return "\n".join(lines)
+
+
+def widget_count(widget):
+    count = 1
+    for child in widget.winfo_children():
+        count += widget_count(child)
+    return count
+
+
+class PerfOverlay:
+    # Text panel over the window's top right corner with the slowest
+    # operations (by p95), counters and gauges. Refreshes only while shown.
+    def __init__(self, root, metrics=metrics):
+        # Imported here so headless users (the core, bench.py) don't load Tk
+        import tkinter as tk
+        self.root = root
+        self.metrics = metrics
+        self.label = tk.Label(root, bg="#000000", fg="#1DB954", font=("Courier", 9),
+                              justify="left", anchor="nw", padx=6, pady=4)
+        self.after_id = None
+
+    def shown(self):
+        return self.after_id is not None
+
+    def toggle(self):
+        if self.shown():
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
+            self.label.place_forget()
+        else:
+            self.label.place(relx=1.0, x=-10, y=10, anchor="ne")
+            self.label.lift()
+            self.refresh()
+
+    def refresh(self):
+        snapshot = self.metrics.snapshot()
+        lines = [f"{'operation':28} {'n':>6} {'p50':>7} {'p95':>7} {'max':>7}"]
+        timings = sorted(snapshot["timings"].items(), key=lambda item: -item[1]["p95_ms"])
+        for name, t in timings[:OVERLAY_ROWS]:
+            lines.append(f"{name[:28]:28} {t['count']:>6} {t['p50_ms']:>7.1f} "
+                         f"{t['p95_ms']:>7.1f} {t['max_ms']:>7.1f}")
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"{name[:28]:28} {value:>6}")
+        for name, value in sorted(snapshot["gauges"].items()):
+            text = f"{value:.2f}" if isinstance(value, float) else str(value)
+            lines.append(f"{name[:28]:28} {text:>6}")
+        self.label.config(text="\n".join(lines))
+        self.after_id = self.root.after(OVERLAY_REFRESH_MS, self.refresh)
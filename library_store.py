@@ -0,0 +1,221 @@
+import os
+import sqlite3
+from array import array
+
+DEFAULT_LIBRARY_PATH = os.path.join(os.path.expanduser("~"), ".spotifypy", "library.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER,
+    mtime REAL,
+    duration REAL,
+    title TEXT,
+    artist TEXT,
+    album TEXT,
+    liked INTEGER NOT NULL DEFAULT 0,
+    gain REAL,
+    peak REAL
+);
+CREATE TABLE IF NOT EXISTS roots (
+    path TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS playlists (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    chunks BLOB
+);
+CREATE TABLE IF NOT EXISTS playlist_chunks (
+    id INTEGER PRIMARY KEY,
+    playlist_id INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS playlist_chunks_playlist ON playlist_chunks (playlist_id);
+CREATE TABLE IF NOT EXISTS seek_index (
+    track_id INTEGER PRIMARY KEY,
+    mtime REAL,
+    data BLOB
+);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value BLOB
+);
+"""
+
+TRACK_COLUMNS = ("id", "path", "size", "mtime", "duration", "title", "artist", "album", "liked",
+                 "gain", "peak")
+
+# Columns added after the first release: (name, type)
+ADDED_TRACK_COLUMNS = (("gain", "REAL"), ("peak", "REAL"))
+
+
+class LibraryStore:
+    # Persistent library index backed by SQLite. Track rows carry the
+    # (size, mtime) pair used to skip unchanged files on rescans; the
+    # playlist is stored as a packed array of track ids. Named playlists
+    # are split into chunk rows of packed ids, with the chunk order kept as
+    # a packed array of row ids on the playlist row. gain/peak hold the
+    # ReplayGain values from the loudness analysis, NULL until analysed.
+    def __init__(self, db_path=DEFAULT_LIBRARY_PATH):
+        self.path = db_path
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db = sqlite3.connect(db_path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self.add_columns()
+
+    def add_columns(self):
+        # Libraries created before a column existed get it added
+        present = {row[1] for row in self.db.execute("PRAGMA table_info(tracks)")}
+        with self.db:
+            for name, kind in ADDED_TRACK_COLUMNS:
+                if name not in present:
+                    self.db.execute(f"ALTER TABLE tracks ADD COLUMN {name} {kind}")
+
+    def close(self):
+        self.db.close()
+
+    def load_tracks(self, batch_size):
+        # Yields the track rows in id order as lists of at most batch_size dicts
+        cursor = self.db.execute(f"SELECT {', '.join(TRACK_COLUMNS)} FROM tracks ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield [dict(zip(TRACK_COLUMNS, row)) for row in rows]
+
+    def known_files(self):
+        cursor = self.db.execute("SELECT path, size, mtime FROM tracks")
+        return {path: (size, mtime) for path, size, mtime in cursor}
+
+    def upsert_tracks(self, infos):
+        # Inserts or refreshes the tracks; returns {path: track id}. A changed
+        # mtime clears the loudness values so the file is analysed again.
+        with self.db:
+            self.db.executemany(
+                """INSERT INTO tracks (path, size, mtime, duration, title, artist, album)
+                   VALUES (:path, :size, :mtime, :duration, :title, :artist, :album)
+                   ON CONFLICT(path) DO UPDATE SET
+                       size = excluded.size, mtime = excluded.mtime,
+                       duration = excluded.duration, title = excluded.title,
+                       artist = excluded.artist, album = excluded.album,
+                       gain = CASE WHEN excluded.mtime IS mtime THEN gain END,
+                       peak = CASE WHEN excluded.mtime IS mtime THEN peak END""",
+                [{"title": None, "artist": None, "album": None, **info} for info in infos])
+        paths = [info["path"] for info in infos]
+        ids = {}
+        for start in range(0, len(paths), 500):
+            chunk = paths[start:start + 500]
+            placeholders = ", ".join("?" * len(chunk))
+            cursor = self.db.execute(
+                f"SELECT path, id FROM tracks WHERE path IN ({placeholders})", chunk)
+            ids.update(cursor)
+        return ids
+
+    def delete_tracks(self, track_ids):
+        with self.db:
+            self.db.executemany("DELETE FROM tracks WHERE id = ?", [(i,) for i in track_ids])
+            self.db.executemany("DELETE FROM seek_index WHERE track_id = ?", [(i,) for i in track_ids])
+
+    def set_liked(self, track_id, liked):
+        with self.db:
+            self.db.execute("UPDATE tracks SET liked = ? WHERE id = ?", (int(liked), track_id))
+
+    def unanalyzed_tracks(self):
+        # (id, path) of local tracks without loudness values
+        return self.db.execute(
+            "SELECT id, path FROM tracks WHERE gain IS NULL "
+            "AND path NOT LIKE 'http://%' AND path NOT LIKE 'https://%'").fetchall()
+
+    def set_loudness(self, results):
+        # results: [(track id, gain dB, peak)]
+        with self.db:
+            self.db.executemany("UPDATE tracks SET gain = ?, peak = ? WHERE id = ?",
+                                [(gain, peak, track_id) for track_id, gain, peak in results])
+
+    def add_root(self, folder_path):
+        with self.db:
+            self.db.execute("INSERT OR IGNORE INTO roots (path) VALUES (?)", (folder_path,))
+
+    def roots(self):
+        return [path for (path,) in self.db.execute("SELECT path FROM roots")]
+
+    def load_seek_index(self, track_id, mtime):
+        # Returns the stored index blob, or None if missing or outdated
+        row = self.db.execute("SELECT mtime, data FROM seek_index WHERE track_id = ?",
+                              (track_id,)).fetchone()
+        if row is None or row[0] != mtime:
+            return None
+        return row[1]
+
+    def save_seek_index(self, track_id, mtime, data):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO seek_index (track_id, mtime, data) VALUES (?, ?, ?)",
+                            (track_id, mtime, data))
+
+    def load_playlists(self):
+        return self.db.execute("SELECT id, name FROM playlists").fetchall()
+
+    def create_playlist(self, name):
+        with self.db:
+            cursor = self.db.execute("INSERT INTO playlists (name, chunks) VALUES (?, ?)", (name, b""))
+        return cursor.lastrowid
+
+    def rename_playlist(self, playlist_id, name):
+        with self.db:
+            self.db.execute("UPDATE playlists SET name = ? WHERE id = ?", (name, playlist_id))
+
+    def delete_playlist(self, playlist_id):
+        with self.db:
+            self.db.execute("DELETE FROM playlist_chunks WHERE playlist_id = ?", (playlist_id,))
+            self.db.execute("DELETE FROM playlists WHERE id = ?", (playlist_id,))
+
+    def load_playlist_chunks(self, playlist_id):
+        # Returns [(chunk row id, packed ids)] in playlist order
+        row = self.db.execute("SELECT chunks FROM playlists WHERE id = ?", (playlist_id,)).fetchone()
+        order = array('q')
+        if row and row[0]:
+            order.frombytes(row[0])
+        blobs = dict(self.db.execute("SELECT id, data FROM playlist_chunks WHERE playlist_id = ?",
+                                     (playlist_id,)))
+        return [(row_id, blobs[row_id]) for row_id in order if row_id in blobs]
+
+    def save_playlist_chunks(self, playlist_id, chunks, dirty, deleted, order_changed):
+        # chunks and dirty are [row id, ids] records; new records (row id
+        # None) get their row id filled in
+        with self.db:
+            self.db.executemany("DELETE FROM playlist_chunks WHERE id = ?", [(i,) for i in deleted])
+            for record in dirty:
+                if record[0] is None:
+                    cursor = self.db.execute(
+                        "INSERT INTO playlist_chunks (playlist_id, data) VALUES (?, ?)",
+                        (playlist_id, record[1].tobytes()))
+                    record[0] = cursor.lastrowid
+                else:
+                    self.db.execute("UPDATE playlist_chunks SET data = ? WHERE id = ?",
+                                    (record[1].tobytes(), record[0]))
+            if order_changed:
+                order = array('q', (record[0] for record in chunks))
+                self.db.execute("UPDATE playlists SET chunks = ? WHERE id = ?",
+                                (order.tobytes(), playlist_id))
+
+    def get_state(self, key, default=None):
+        row = self.db.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_state(self, key, value):
+        with self.db:
+            self.db.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, value))
+
+    def load_playlist(self):
+        blob = self.get_state("playlist")
+        ids = array('q')
+        if blob:
+            ids.frombytes(blob)
+        return ids
+
+    def save_playlist(self, track_ids):
+        self.set_state("playlist", array('q', track_ids).tobytes())
@@ -0,0 +1,377 @@
+import math
+import multiprocessing
+import os
+import queue
+import threading
+import wave
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+try:
+    from scipy import signal
+except ImportError:
+    signal = None
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+# ReplayGain 2.0 reference level
+REFERENCE_LUFS = -18.0
+
+# EBU R128 / ITU-R BS.1770 gating
+SEGMENT_SECONDS = 0.1  # Gating blocks are 4 segments (400 ms, 75% overlap)
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+
+# Segments decoded and weighted at a time
+SEGMENTS_PER_BLOCK = 100
+
+# Without soundfile, compressed formats are decoded whole by pygame, so
+# very long files are skipped rather than held in memory
+MAX_PYGAME_SECONDS = 20 * 60
+PYGAME_RATE = 48000
+
+# Results written to the library per transaction
+COMMIT_BATCH = 50
+
+REPLAYGAIN_TAGS = {
+    "gain": ("TXXX:REPLAYGAIN_TRACK_GAIN", "TXXX:replaygain_track_gain", "replaygain_track_gain",
+             "----:com.apple.iTunes:replaygain_track_gain"),
+    "peak": ("TXXX:REPLAYGAIN_TRACK_PEAK", "TXXX:replaygain_track_peak", "replaygain_track_peak",
+             "----:com.apple.iTunes:replaygain_track_peak"),
+}
+
+
+def k_weighting(rate):
+    # BS.1770 pre-filter (high shelf) and RLB high-pass as biquad
+    # coefficients for any sample rate, as in libebur128
+    f0, gain, q = 1681.974450955533, 3.999843853973347, 0.7071752369554196
+    k = math.tan(math.pi * f0 / rate)
+    vh = 10 ** (gain / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf_b = np.array([(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0,
+                        (vh - vb * k / q + k * k) / a0])
+    shelf_a = np.array([1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0])
+
+    f0, q = 38.13547087602444, 0.5003270373238773
+    k = math.tan(math.pi * f0 / rate)
+    a0 = 1 + k / q + k * k
+    highpass_b = np.array([1.0, -2.0, 1.0])
+    highpass_a = np.array([1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0])
+    return (shelf_b, shelf_a), (highpass_b, highpass_a)
+
+
+def power_response(filters, size, rate):
+    # |H|^2 of the cascaded biquads at the rfft bins of a size-sample frame
+    z = np.exp(-2j * np.pi * np.fft.rfftfreq(size, 1 / rate) / rate)
+    response = np.ones(len(z))
+    for b, a in filters:
+        h = (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+        response *= np.abs(h) ** 2
+    return response
+
+
+class LoudnessMeter:
+    # Integrated loudness (LUFS) and sample peak of a stream of float
+    # sample blocks shaped (frames, channels). K-weighted mean squares are
+    # computed per 100 ms segment; gating blocks are averaged from them at
+    # the end. With scipy the K filter runs in the time domain, otherwise
+    # each segment's power spectrum is weighted by the filter's response.
+    def __init__(self, rate):
+        self.rate = rate
+        self.segment = max(1, int(rate * SEGMENT_SECONDS))
+        self.filters = k_weighting(rate)
+        self.state = None
+        self.weights = None
+        if signal is None:
+            weights = power_response(self.filters, self.segment, rate)
+            # Parseval over the one-sided spectrum
+            weights[1:(self.segment + 1) // 2] *= 2
+            self.weights = weights / (self.segment * self.segment)
+        self.powers = []
+        self.pending = None
+        self.peak = 0.0
+
+    def add(self, samples):
+        if not len(samples):
+            return
+        self.peak = max(self.peak, float(np.max(np.abs(samples))))
+        if self.pending is not None:
+            samples = np.concatenate((self.pending, samples))
+        whole = len(samples) // self.segment * self.segment
+        self.pending = samples[whole:]
+        if whole:
+            self.powers.append(self.segment_powers(samples[:whole]))
+
+    def segment_powers(self, samples):
+        # Mean square per segment, summed over channels (all weighted 1.0,
+        # which is right for mono and stereo)
+        if signal is not None:
+            if self.state is None:
+                self.state = [np.zeros((2, samples.shape[1])) for _ in self.filters]
+            for i, (b, a) in enumerate(self.filters):
+                samples, self.state[i] = signal.lfilter(b, a, samples, axis=0, zi=self.state[i])
+            segments = samples.reshape(-1, self.segment, samples.shape[1])
+            return np.mean(segments * segments, axis=1).sum(axis=1)
+        segments = samples.reshape(-1, self.segment, samples.shape[1])
+        spectrum = np.fft.rfft(segments, axis=1)
+        power = spectrum.real ** 2 + spectrum.imag ** 2
+        return np.einsum("sfc,f->s", power, self.weights)
+
+    def integrated(self):
+        if not self.powers:
+            return None
+        powers = np.concatenate(self.powers)
+        if len(powers) < 4:
+            return None
+        # 400 ms blocks with 75% overlap: means of 4 consecutive segments
+        cumulative = np.concatenate(([0.0], np.cumsum(powers)))
+        blocks = (cumulative[4:] - cumulative[:-4]) / 4
+        with np.errstate(divide="ignore"):
+            loudness = -0.691 + 10 * np.log10(blocks)
+        gated = blocks[loudness > ABSOLUTE_GATE]
+        if not len(gated):
+            return None
+        threshold = -0.691 + 10 * np.log10(np.mean(gated)) + RELATIVE_GATE
+        gated = blocks[(loudness > ABSOLUTE_GATE) & (loudness > threshold)]
+        return -0.691 + 10 * np.log10(np.mean(gated))
+
+
+def wave_blocks(path, frames, start=0):
+    with wave.open(path, "rb") as f:
+        rate, channels, width = f.getframerate(), f.getnchannels(), f.getsampwidth()
+        yield rate
+        if start:
+            f.setpos(min(int(start * rate), f.getnframes()))
+        while True:
+            raw = f.readframes(frames)
+            if not raw:
+                return
+            if width == 3:
+                # 24-bit: pad each sample to 32 bits
+                data = np.frombuffer(raw, np.uint8).reshape(-1, 3)
+                data = np.pad(data, ((0, 0), (1, 0))).view("<i4").ravel()
+                yield data.reshape(-1, channels) / 2 ** 31
+            elif width == 1:
+                yield (np.frombuffer(raw, np.uint8).reshape(-1, channels) - 128.0) / 128
+            else:
+                dtype = {2: "<i2", 4: "<i4"}[width]
+                yield np.frombuffer(raw, dtype).reshape(-1, channels) / 2 ** (8 * width - 1)
+
+
+def soundfile_blocks(path, frames, start=0):
+    with soundfile.SoundFile(path) as f:
+        yield f.samplerate
+        if start:
+            f.seek(min(int(start * f.samplerate), f.frames))
+        for block in f.blocks(frames, dtype="float32", always_2d=True):
+            yield block
+
+
+def pygame_blocks(path, frames, start=0):
+    # Decodes the whole file; only used for formats nothing else reads
+    import pygame
+    if not pygame.mixer.get_init():
+        pygame.mixer.init(frequency=PYGAME_RATE, size=-16, channels=2)
+    rate, _, channels = pygame.mixer.get_init()
+    sound = pygame.mixer.Sound(path)
+    if sound.get_length() > MAX_PYGAME_SECONDS:
+        raise ValueError("Too long to decode in memory")
+    samples = np.frombuffer(sound.get_raw(), "<i2").reshape(-1, channels)
+    yield rate
+    for offset in range(int(start * rate), len(samples), frames):
+        yield samples[offset:offset + frames] / 32768.0
+
+
+def decode_blocks(path, start=0, frames=None, whole_file=True):
+    # Returns a generator of the sample rate, then float blocks shaped
+    # (frames, channels) from start seconds on. With whole_file False,
+    # formats that only pygame can read (it decodes the whole file into
+    # memory, through the mixer) raise ValueError instead
+    frames = frames or int(48000 * SEGMENT_SECONDS) * SEGMENTS_PER_BLOCK
+    if path.lower().endswith(".wav"):
+        try:
+            with wave.open(path, "rb"):
+                pass
+            return wave_blocks(path, frames, start)
+        except (wave.Error, EOFError):
+            pass  # Compressed WAV: let another decoder try
+    if soundfile is not None:
+        return soundfile_blocks(path, frames, start)
+    if not whole_file:
+        raise ValueError(f"No incremental decoder for {os.path.basename(path)}")
+    return pygame_blocks(path, frames, start)
+
+
+def tag_float(value):
+    value = str(value[0] if isinstance(value, list) else value)
+    return float(value.strip().split()[0])
+
+
+def replaygain_tags(path):
+    # Returns (gain dB, peak) from ReplayGain or R128 tags, or None
+    import mutagen
+    try:
+        audio = mutagen.File(path)
+    except Exception:
+        return None
+    tags = audio.tags if audio is not None else None
+    if not tags:
+        return None
+    found = {}
+    for key, names in REPLAYGAIN_TAGS.items():
+        for name in names:
+            try:
+                frame = tags[name]
+            except (KeyError, ValueError, TypeError):
+                continue
+            value = getattr(frame, "text", frame)
+            if isinstance(value, list) and value and isinstance(value[0], bytes):
+                value = value[0].decode("latin-1")
+            try:
+                found[key] = tag_float(value)
+            except (ValueError, IndexError):
+                continue
+            break
+    if "gain" in found:
+        return found["gain"], found.get("peak")
+    try:
+        # Opus: Q7.8 dB relative to -23 LUFS
+        r128 = tags["R128_TRACK_GAIN"]
+        return int(tag_float(r128)) / 256 + (REFERENCE_LUFS + 23), None
+    except (KeyError, ValueError, TypeError, IndexError):
+        return None
+
+
+def file_state(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime
+
+
+def analyze_track(path):
+    # Worker process entry point: returns (gain dB, peak) or None.
+    # Workers decode without opening an audio device.
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    tagged = replaygain_tags(path)
+    if tagged is not None:
+        return tagged
+    blocks = decode_blocks(path)
+    rate = next(blocks)
+    meter = LoudnessMeter(rate)
+    for block in blocks:
+        meter.add(block)
+    loudness = meter.integrated()
+    if loudness is None:
+        return 0.0, meter.peak  # Silence: leave the level alone
+    return float(REFERENCE_LUFS - loudness), meter.peak
+
+
+class LoudnessAnalyzer:
+    # Works through the library's unanalysed tracks (gain IS NULL) in a
+    # process pool using every core. A coordinator thread keeps a bounded
+    # number of files in flight and writes results to the library through
+    # its own connection as they finish, so an interrupted run resumes
+    # where it stopped. Results are also queued for poll(), which hands
+    # them to the player so the in-memory tracks pick them up.
+    def __init__(self, db_path, workers=None):
+        self.db_path = db_path
+        self.workers = workers or os.cpu_count() or 1
+        self.results = queue.Queue()
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.pool = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        self.wake.set()
+
+    def stop(self):
+        # Files being analysed finish; the queued ones are dropped
+        self.stopped.set()
+        self.wake.set()
+        pool = self.pool
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def run(self):
+        # Imported here: the store is opened on this thread
+        from library_store import LibraryStore
+        store = LibraryStore(self.db_path)
+        # spawn: forking a process that runs Tk and audio threads is unsafe
+        context = multiprocessing.get_context("spawn")
+        pool = self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        try:
+            while not self.stopped.is_set():
+                self.wake.wait()
+                self.wake.clear()
+                self.analyze_pending(store, pool)
+        except RuntimeError:
+            # A worker died (BrokenProcessPool) or stop() shut the pool
+            # down; unfinished tracks are retried on the next start()
+            pass
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+            store.close()
+            self.thread = None
+
+    def analyze_pending(self, store, pool):
+        pending = iter(store.unanalyzed_tracks())
+        running = {}
+        finished = []
+        try:
+            while not self.stopped.is_set():
+                while len(running) < 2 * self.workers:
+                    track = next(pending, None)
+                    if track is None:
+                        break
+                    track_id, path = track
+                    state = file_state(path)
+                    running[pool.submit(analyze_track, path)] = track_id, path, state
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    track_id, path, state = running.pop(future)
+                    if future.cancelled():
+                        continue  # Dropped by stop(); analysed next time
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool:
+                        raise
+                    except Exception:
+                        result = None
+                    if file_state(path) != state:
+                        continue  # Rewritten meanwhile; analysed again next time
+                    # Undecodable files get a neutral gain so they aren't retried
+                    gain, peak = result or (0.0, None)
+                    finished.append((track_id, gain, peak))
+                    self.results.put((track_id, gain, peak))
+                if len(finished) >= COMMIT_BATCH:
+                    store.set_loudness(finished)
+                    finished = []
+        finally:
+            for future in running:
+                future.cancel()
+            if finished:
+                store.set_loudness(finished)
+
+    def poll(self):
+        # Returns the (track id, gain, peak) results since the last call
+        results = []
+        while True:
+            try:
+                results.append(self.results.get_nowait())
+            except queue.Empty:
+                return results
@@ -1,43 +1,141 @@
+import time
+# Taken before the other imports so --profile-startup counts them too
+STARTED = time.perf_counter()
+import argparse
 import os
-import pygame
 import tkinter as tk
-from tkinter import filedialog, ttk, messagebox
-from PIL import Image, ImageTk
-import time
-import random
-from mutagen.mp3 import MP3
+from tkinter import filedialog, ttk, messagebox, simpledialog
+from virtual_list import VirtualTrackList
+from importer import FolderImporter, probe_track
+from library_store import LibraryStore
+from player_core import PlayerCore
+from audio_backend import PygameAudioBackend
+from metadata import MetadataService
+from album_art import AlbumArtCache, ROW_SIZE, FULL_SIZE
+from streaming import is_url, stream_info
+from playlists import PlaylistImporter
+from waveform import WaveformBar, WaveformCache
+from instrumentation import PerfOverlay, StallDetector, StartupProfile, metrics, widget_count
+
+SEEK_STEP = 5
+SEARCH_DEBOUNCE_MS = 50
+SEARCH_RESULT_LIMIT = 200
+END_EVENT_POLL_MS = 20
+METADATA_POLL_MS = 50
+# Pause between library restore steps; nonzero so Tk redraws in between
+RESTORE_STEP_MS = 1
 
 class SpotifyLikePlayer:
-    def __init__(self, root):
+    # Startup shows the window first: the constructor only builds widgets.
+    # Once the window is mapped (on_first_frame) the audio device opens in
+    # the background and the library is restored a step at a time, so the
+    # window stays responsive while a large library loads.
+    def __init__(self, root, startup=None, profile_startup=False):
         self.root = root
+        self.startup = startup or StartupProfile()
+        # --profile-startup: print the milestones once interactive and quit
+        self.profile_startup = profile_startup
+        self.restoring = None
+        self.started = False
+        self.session_restored = False
         self.root.title("Spotify-like Player")
         self.root.geometry("1000x800")
         self.root.configure(bg="#121212")
         
-        # Initialize pygame mixer
-        pygame.mixer.init()
-        
-        # Player state
-        self.paused = False
-        self.stopped = True
-        self.current_track = ""
-        self.playlist = []
-        self.filtered_playlist = []
-        self.current_index = 0
-        self.volume = 0.7
-        self.repeat = False
-        self.shuffle = False
-        self.liked_songs = set()
+        # Player core (library, queue, search) driving the pygame mixer;
+        # the mixer opens after the first frame
+        self.library = LibraryStore()
+        self.core = PlayerCore(self.library, PygameAudioBackend())
+        self.core.add_listener(self.on_core_event)
+        
+        # UI state
+        self.importer = None
+        self.search_results = []
+        self.search_after_id = None
+        self.metadata = MetadataService()
+        self.art = AlbumArtCache(self.metadata)
+        self.waveforms = WaveformCache()
         
         # UI Setup
         self.setup_ui()
+        self.root.protocol("WM_DELETE_WINDOW", self.quit)
         
         # Bind keyboard shortcuts
         self.root.bind("<space>", lambda e: self.toggle_play_pause())
         self.root.bind("<Left>", lambda e: self.prev_track())
         self.root.bind("<Right>", lambda e: self.next_track())
+        self.root.bind("<Shift-Left>", lambda e: self.seek_by(-SEEK_STEP))
+        self.root.bind("<Shift-Right>", lambda e: self.seek_by(SEEK_STEP))
         self.root.bind("<Up>", lambda e: self.volume_up())
         self.root.bind("<Down>", lambda e: self.volume_down())
+        self.root.bind("<Control-Up>", lambda e: self.move_current_track(-1))
+        self.root.bind("<Control-Down>", lambda e: self.move_current_track(1))
+        self.root.bind("<Delete>", lambda e: self.remove_current_track())
+        self.root.bind("<F12>", lambda e: self.toggle_perf_overlay())
+        
+        # Instrumentation: event loop stalls, widget count, cache hit rates
+        self.perf_overlay = PerfOverlay(self.root)
+        self.stall_detector = StallDetector(self.root)
+        self.stall_detector.start()
+        metrics.gauge("tk.widgets", lambda: widget_count(self.root))
+        metrics.cache_gauges("cache.metadata", self.metadata.cache)
+        metrics.cache_gauges("cache.art_rows", self.art.photos[ROW_SIZE])
+        metrics.cache_gauges("cache.art_full", self.art.photos[FULL_SIZE])
+        metrics.cache_gauges("cache.seek_index", self.core.seek_indexes.cache)
+        metrics.cache_gauges("cache.waveforms", self.waveforms.memory)
+        self.startup.mark("ui_built")
+    
+    def on_first_frame(self):
+        # The window is up: draw it, then load everything else behind it
+        self.started = True
+        self.root.update_idletasks()
+        self.startup.mark("first_frame")
+        self.core.audio.start()
+        self.restoring = self.core.restore_steps()
+        self.root.after(RESTORE_STEP_MS, self.restore_step)
+    
+    def restore_step(self):
+        try:
+            next(self.restoring)
+        except StopIteration:
+            self.restoring = None
+            self.finish_startup()
+            return
+        self.root.after(RESTORE_STEP_MS, self.restore_step)
+    
+    def finish_startup(self):
+        # Background work that follows the restored library
+        self.core.analyze_loudness()
+        if self.core.watcher is None:  # Not already started by Open Folder
+            self.core.watch_library()
+        self.root.after_idle(self.on_interactive)
+    
+    def on_interactive(self):
+        self.startup.mark("interactive")
+        if self.profile_startup:
+            print(self.startup.report())
+            self.root.destroy()
+    
+    def quit(self):
+        # The session is only saved once it was restored, or closing early
+        # would overwrite it with the defaults
+        if self.session_restored:
+            try:
+                self.core.save_session()
+            except Exception:
+                pass  # Never keep the window from closing
+        # Background work stops here: otherwise the exit waits for every
+        # queued metadata, art, waveform and loudness job
+        self.stall_detector.stop()
+        if self.importer:
+            self.importer.cancel()
+        if self.visualizer is not None:
+            self.visualizer.analyzer.close()
+        self.core.shutdown()
+        self.metadata.shutdown()
+        self.art.shutdown()
+        self.waveforms.shutdown()
+        self.root.destroy()
         
     def setup_ui(self):
         # Configure styles
@@ -64,6 +162,21 @@ class SpotifyLikePlayer:
         self.liked_btn = self.create_sidebar_button("Liked Songs", self.show_liked_songs)
         self.playlists_btn = self.create_sidebar_button("Playlists", self.show_playlists)
         
+        # Import progress (shown while a folder import is running)
+        self.import_frame = tk.Frame(self.sidebar_frame, bg="#000000")
+        
+        self.import_label = tk.Label(self.import_frame, text="", font=("Helvetica", 10),
+                                     bg="#000000", fg="#b3b3b3", wraplength=180, justify="left")
+        self.import_label.pack(fill="x", padx=10)
+        
+        self.import_progress = ttk.Progressbar(self.import_frame, orient="horizontal",
+                                               length=180, mode="determinate")
+        self.import_progress.pack(fill="x", padx=10, pady=5)
+        
+        self.import_cancel_btn = tk.Button(self.import_frame, text="Cancel", font=("Helvetica", 10),
+                                           bg="#535353", fg="white", bd=0, command=self.cancel_import)
+        self.import_cancel_btn.pack(pady=5)
+        
         # Search frame (initially hidden)
         self.search_frame = tk.Frame(self.main_frame, bg="#121212")
         
@@ -71,11 +184,43 @@ class SpotifyLikePlayer:
                                    insertbackground="white", font=("Helvetica", 14),
                                    relief="flat")
         self.search_entry.pack(fill="x", padx=20, pady=20)
-        self.search_entry.bind("<KeyRelease>", self.search_songs)
+        self.search_entry.bind("<KeyRelease>", self.schedule_search)
         
         self.search_results_frame = tk.Frame(self.search_frame, bg="#121212")
         self.search_results_frame.pack(fill="both", expand=True, padx=20, pady=10)
         
+        self.search_status = tk.Label(self.search_results_frame, text="", 
+                                      bg="#121212", fg="white")
+        self.search_status.pack(anchor="w")
+        
+        self.search_results_view = VirtualTrackList(
+            self.search_results_frame, lambda i: self.play_from_search(self.search_results[i]),
+            thumbnail=self.row_thumbnail)
+        self.search_results_view.pack(fill="both", expand=True)
+        
+        # Playlists frame (initially hidden)
+        self.playlists_frame = tk.Frame(self.main_frame, bg="#121212")
+        
+        self.playlists_title = tk.Label(self.playlists_frame, text="Playlists", 
+                                        font=("Helvetica", 18), bg="#121212", fg="white")
+        self.playlists_title.pack(anchor="w", padx=20, pady=20)
+        
+        self.playlists_list = tk.Listbox(self.playlists_frame, bg="#121212", fg="white",
+                                         selectbackground="#1DB954", font=("Helvetica", 12),
+                                         relief="flat", highlightthickness=0, activestyle="none")
+        self.playlists_list.pack(fill="both", expand=True, padx=20)
+        self.playlists_list.bind("<Double-Button-1>", lambda e: self.open_selected_playlist())
+        self.playlists_list.bind("<Return>", lambda e: self.open_selected_playlist())
+        
+        self.playlist_buttons = tk.Frame(self.playlists_frame, bg="#121212")
+        self.playlist_buttons.pack(fill="x", padx=20, pady=10)
+        for text, command in (("New", self.new_playlist), ("Open", self.open_selected_playlist),
+                              ("Add Current Track", self.add_current_to_playlist),
+                              ("Import", self.import_playlist), ("Export", self.export_playlist),
+                              ("Rename", self.rename_playlist), ("Delete", self.delete_playlist)):
+            tk.Button(self.playlist_buttons, text=text, font=("Helvetica", 10), bg="#535353",
+                      fg="white", bd=0, padx=8, pady=4, command=command).pack(side="left", padx=3)
+        
         # Main content frame
         self.content_frame = tk.Frame(self.main_frame, bg="#121212")
         
@@ -83,12 +228,20 @@ class SpotifyLikePlayer:
         self.track_info_frame = tk.Frame(self.content_frame, bg="#121212")
         self.track_info_frame.pack(pady=20)
         
-        # Album art placeholder (using a default image)
-        self.album_art_img = Image.new('RGB', (200, 200), color='#535353')
-        self.album_art_photo = ImageTk.PhotoImage(self.album_art_img)
+        # Album art placeholder (plain Tk image; PIL loads with the first cover)
+        self.album_art_photo = tk.PhotoImage(width=FULL_SIZE, height=FULL_SIZE)
+        self.album_art_photo.put("#535353", to=(0, 0, FULL_SIZE, FULL_SIZE))
         self.album_art = tk.Label(self.track_info_frame, image=self.album_art_photo, bg="#121212")
         self.album_art.pack(pady=10)
         
+        # Spectrum visualizer (View > Show Visualizer); only draws while
+        # shown, and created when first shown
+        self.visualizer = None
+        self.content_frame.bind("<Map>", lambda e: self.update_visualizer())
+        self.content_frame.bind("<Unmap>", lambda e: self.update_visualizer())
+        self.root.bind("<Map>", self.on_root_map)
+        self.root.bind("<Unmap>", self.on_root_map)
+        
         self.current_track_label = tk.Label(self.track_info_frame, text="No track selected", 
                                            font=("Helvetica", 14), bg="#121212", fg="white")
         self.current_track_label.pack()
@@ -106,10 +259,15 @@ class SpotifyLikePlayer:
         self.progress_frame = tk.Frame(self.content_frame, bg="#121212")
         self.progress_frame.pack(fill="x", padx=20, pady=10)
         
-        self.progress_bar = ttk.Progressbar(self.progress_frame, orient="horizontal", 
-                                          length=600, mode="determinate")
+        self.progress_bar = WaveformBar(self.progress_frame)
         self.progress_bar.pack(fill="x")
         
+        # Click or drag on the progress bar to seek
+        self.seek_target = None
+        self.progress_bar.bind("<Button-1>", self.drag_seek)
+        self.progress_bar.bind("<B1-Motion>", self.drag_seek)
+        self.progress_bar.bind("<ButtonRelease-1>", self.release_seek)
+        
         self.time_labels = tk.Frame(self.progress_frame, bg="#121212")
         self.time_labels.pack(fill="x")
         
@@ -137,7 +295,7 @@ class SpotifyLikePlayer:
         self.vol_down_btn = self.create_control_button("🔉", self.volume_down, size=20)
         self.vol_down_btn.pack(side="left", padx=5)
         
-        self.volume_slider = ttk.Scale(self.volume_frame, from_=0, to=1, value=self.volume, 
+        self.volume_slider = ttk.Scale(self.volume_frame, from_=0, to=1, value=self.core.volume, 
                                       command=self.set_volume, orient="horizontal", length=100)
         self.volume_slider.pack(side="left", padx=5)
         
@@ -152,31 +310,47 @@ class SpotifyLikePlayer:
                                       font=("Helvetica", 12), bg="#121212", fg="white")
         self.playlist_label.pack(anchor="w")
         
-        # Create a scrollable frame for playlist
-        self.playlist_canvas = tk.Canvas(self.playlist_frame, bg="#121212", highlightthickness=0)
-        self.playlist_scrollbar = ttk.Scrollbar(self.playlist_frame, orient="vertical", 
-                                              command=self.playlist_canvas.yview)
-        self.playlist_scrollable_frame = tk.Frame(self.playlist_canvas, bg="#121212")
-        
-        self.playlist_scrollable_frame.bind(
-            "<Configure>",
-            lambda e: self.playlist_canvas.configure(
-                scrollregion=self.playlist_canvas.bbox("all")
-            )
-        )
-        
-        self.playlist_canvas.create_window((0, 0), window=self.playlist_scrollable_frame, anchor="nw")
-        self.playlist_canvas.configure(yscrollcommand=self.playlist_scrollbar.set)
-        
-        self.playlist_canvas.pack(side="left", fill="both", expand=True)
-        self.playlist_scrollbar.pack(side="right", fill="y")
+        # Virtualized track list: only the rows in view get widgets
+        self.playlist_view = VirtualTrackList(self.playlist_frame, self.load_track,
+                                              thumbnail=self.row_thumbnail)
+        self.playlist_view.pack(fill="both", expand=True)
         
         # Menu
         self.menubar = tk.Menu(self.root)
         self.filemenu = tk.Menu(self.menubar, tearoff=0)
         self.filemenu.add_command(label="Open File", command=self.add_file)
         self.filemenu.add_command(label="Open Folder", command=self.add_folder)
+        self.filemenu.add_command(label="Open URL", command=self.add_url)
+        self.filemenu.add_command(label="Rescan Library", command=self.rescan_library)
+        self.filemenu.add_command(label="Build Waveforms", command=self.build_waveforms)
         self.menubar.add_cascade(label="File", menu=self.filemenu)
+        
+        self.playbackmenu = tk.Menu(self.menubar, tearoff=0)
+        self.gapless = tk.BooleanVar(value=self.core.gapless)
+        self.playbackmenu.add_checkbutton(label="Gapless Playback", variable=self.gapless,
+                                          command=self.toggle_gapless,
+                                          state="normal" if self.core.audio.end_events else "disabled")
+        self.shufflemenu = tk.Menu(self.playbackmenu, tearoff=0)
+        self.shuffle_mode = tk.StringVar(value=self.core.shuffle_mode)
+        for label, mode in (("Random", "plain"), ("Spread Artists", "artist"), ("Favor Liked", "liked")):
+            self.shufflemenu.add_radiobutton(label=label, value=mode, variable=self.shuffle_mode,
+                                             command=self.set_shuffle_mode)
+        self.playbackmenu.add_cascade(label="Shuffle Mode", menu=self.shufflemenu)
+        self.normalize = tk.BooleanVar(value=self.core.normalize)
+        self.playbackmenu.add_checkbutton(label="Normalize Volume", variable=self.normalize,
+                                          command=self.toggle_normalize)
+        self.menubar.add_cascade(label="Playback", menu=self.playbackmenu)
+        
+        self.viewmenu = tk.Menu(self.menubar, tearoff=0)
+        self.show_visualizer = tk.BooleanVar(value=False)
+        self.viewmenu.add_checkbutton(label="Show Visualizer", variable=self.show_visualizer,
+                                      command=self.toggle_visualizer)
+        self.viewmenu.add_separator()
+        self.show_perf = tk.BooleanVar(value=False)
+        self.viewmenu.add_checkbutton(label="Performance Overlay", variable=self.show_perf,
+                                      command=self.toggle_perf_overlay, accelerator="F12")
+        self.viewmenu.add_command(label="Save Performance Data...", command=self.save_perf_data)
+        self.menubar.add_cascade(label="View", menu=self.viewmenu)
         self.root.config(menu=self.menubar)
         
         # Show home by default
@@ -184,6 +358,8 @@ class SpotifyLikePlayer:
         
         # Update progress bar
         self.update_progress()
+        self.poll_core()
+        self.poll_metadata()
     
     def create_sidebar_button(self, text, command):
         btn = tk.Button(self.sidebar_frame, text=text, font=("Helvetica", 12), 
@@ -217,260 +393,556 @@ class SpotifyLikePlayer:
     def show_library(self):
         self.hide_all_frames()
         self.content_frame.pack(fill="both", expand=True)
-        # Implement library view
+        self.core.set_filtered_view(None)
     
     def show_liked_songs(self):
         self.hide_all_frames()
         self.content_frame.pack(fill="both", expand=True)
         # Show only liked songs
-        self.filtered_playlist = [track for track in self.playlist if track in self.liked_songs]
-        self.update_playlist_display()
+        self.core.show_liked()
     
     def show_playlists(self):
         self.hide_all_frames()
-        self.content_frame.pack(fill="both", expand=True)
-        # Implement playlists view
+        self.playlists_frame.pack(fill="both", expand=True)
+        self.refresh_playlists()
+        self.playlists_list.focus()
+    
+    def refresh_playlists(self):
+        self.playlist_choices = self.core.playlists.sorted()
+        self.playlists_list.delete(0, "end")
+        for playlist in self.playlist_choices:
+            self.playlists_list.insert("end", playlist.name)
+    
+    def selected_playlist(self):
+        selection = self.playlists_list.curselection()
+        if not selection:
+            messagebox.showinfo("Playlists", "Select a playlist first")
+            return None
+        return self.playlist_choices[selection[0]]
+    
+    def ask_playlist_name(self, title, initial=""):
+        name = simpledialog.askstring(title, "Playlist name:", initialvalue=initial, parent=self.root)
+        if not name or not name.strip():
+            return None
+        name = name.strip()
+        if self.core.playlists.by_name(name):
+            messagebox.showerror("Error", f"A playlist named {name} already exists")
+            return None
+        return name
+    
+    def new_playlist(self):
+        name = self.ask_playlist_name("New Playlist")
+        if name:
+            self.core.playlists.create(name)
+            self.refresh_playlists()
+    
+    def open_selected_playlist(self):
+        playlist = self.selected_playlist()
+        if playlist:
+            self.hide_all_frames()
+            self.content_frame.pack(fill="both", expand=True)
+            self.core.open_playlist(playlist)
+    
+    def add_current_to_playlist(self):
+        playlist = self.selected_playlist()
+        if playlist and self.core.current_track:
+            self.core.add_to_playlist(playlist, [self.core.current_track.id])
+    
+    def rename_playlist(self):
+        playlist = self.selected_playlist()
+        if playlist:
+            name = self.ask_playlist_name("Rename Playlist", playlist.name)
+            if name:
+                self.core.playlists.rename(playlist, name)
+                self.refresh_playlists()
+                self.update_playlist_display()
+    
+    def delete_playlist(self):
+        playlist = self.selected_playlist()
+        if playlist and messagebox.askyesno("Delete Playlist", f"Delete {playlist.name}?"):
+            self.core.delete_playlist(playlist)
+            self.refresh_playlists()
+    
+    def export_playlist(self):
+        playlist = self.selected_playlist()
+        if not playlist:
+            return
+        path = filedialog.asksaveasfilename(defaultextension=".m3u8", initialfile=playlist.name,
+                                            filetypes=[("M3U8 Playlist", "*.m3u8"),
+                                                       ("M3U Playlist", "*.m3u"),
+                                                       ("PLS Playlist", "*.pls")])
+        if path:
+            try:
+                self.core.export_playlist(playlist, path)
+            except OSError as e:
+                messagebox.showerror("Error", f"Could not export playlist: {e}")
+    
+    def import_playlist(self):
+        if self.importer:
+            messagebox.showinfo("Import", "An import is already running")
+            return
+        path = filedialog.askopenfilename(filetypes=[("Playlists", "*.m3u *.m3u8 *.pls")])
+        if not path:
+            return
+        # The playlist is only created once entries come in (or the file
+        # turns out to be empty), so a file that can't be read leaves none
+        self.importer = PlaylistImporter(path, self.core.registry.ids)
+        self.importer.start()
+        self.import_label.config(text="Reading playlist...")
+        self.import_progress["maximum"] = 1
+        self.import_progress["value"] = 0
+        self.import_frame.pack(side="bottom", fill="x", pady=10)
+        self.poll_playlist_import(path, None)
+
+    def create_imported_playlist(self, path):
+        # Named after the file, numbered if that name is taken
+        base = os.path.splitext(os.path.basename(path))[0]
+        name, number = base, 2
+        while self.core.playlists.by_name(name):
+            name, number = f"{base} ({number})", number + 1
+        playlist = self.core.playlists.create(name)
+        self.refresh_playlists()
+        return playlist
+
+    def poll_playlist_import(self, path, playlist):
+        importer = self.importer
+        for locations, infos in importer.poll():
+            if playlist is None:
+                playlist = self.create_imported_playlist(path)
+            self.core.add_paths_to_playlist(playlist, locations, infos)
+
+        if importer.finished:
+            self.import_frame.pack_forget()
+            self.importer = None
+            if importer.error or importer.cancelled.is_set():
+                # Nothing is kept from a read that failed part way
+                if playlist is not None:
+                    self.core.delete_playlist(playlist)
+                    self.refresh_playlists()
+                if importer.error:
+                    messagebox.showerror("Error", f"Could not read playlist: {importer.error}")
+                return
+            if playlist is None:
+                self.create_imported_playlist(path)
+            if importer.missing:
+                messagebox.showinfo("Import", f"{importer.missing} playlist entries were not found")
+            return
+
+        self.import_label.config(text=f"Importing playlist: {importer.read} entries")
+        self.import_progress["maximum"] = max(1, importer.size)
+        self.import_progress["value"] = importer.done
+        self.root.after(100, self.poll_playlist_import, path, playlist)
+    
+    def track_keys_active(self):
+        # The track shortcuts only apply on the player page, and not while
+        # typing or picking in the search box or the playlists list
+        return self.content_frame.winfo_ismapped() and \
+            self.root.focus_get() not in (self.search_entry, self.playlists_list)
+    
+    def move_current_track(self, step):
+        # Ctrl+Up/Down moves the playing track within the open playlist
+        core = self.core
+        if core.active_playlist and core.current_track and self.track_keys_active():
+            position = core.current_view_row()
+            if position is not None:
+                core.move_in_playlist(core.active_playlist, position, position + step)
+    
+    def remove_current_track(self):
+        # Delete takes the playing track out of the open playlist
+        core = self.core
+        if core.active_playlist and core.current_track and self.track_keys_active():
+            position = core.current_view_row()
+            if position is not None:
+                core.remove_from_playlist(core.active_playlist, position)
     
     def hide_all_frames(self):
-        for frame in [self.content_frame, self.search_frame]:
+        for frame in [self.content_frame, self.search_frame, self.playlists_frame]:
             frame.pack_forget()
     
+    def schedule_search(self, event=None):
+        # Debounce: only search once typing pauses
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+        self.search_after_id = self.root.after(SEARCH_DEBOUNCE_MS, self.search_songs)
+    
+    @metrics.timed("ui.search_songs")
     def search_songs(self, event=None):
-        query = self.search_entry.get().lower()
-        
-        # Clear previous results
-        for widget in self.search_results_frame.winfo_children():
-            widget.destroy()
-        
-        if not query:
-            return
-            
-        # Filter playlist
-        self.filtered_playlist = [track for track in self.playlist 
-                                 if query in os.path.basename(track).lower()]
-        
-        # Display results
-        if not self.filtered_playlist:
-            no_results = tk.Label(self.search_results_frame, text="No results found", 
-                                 bg="#121212", fg="white")
-            no_results.pack(pady=20)
+        self.search_after_id = None
+        query = self.search_entry.get()
+        
+        self.search_results, total = self.core.search(query, SEARCH_RESULT_LIMIT)
+        self.search_results_view.set_items(self.search_results, self.core.describe)
+        
+        if not query.strip():
+            self.search_status.config(text="")
+        elif not total:
+            self.search_status.config(text="No results found")
+        elif self.core.search_index.approximate:
+            self.search_status.config(text=f"Top {len(self.search_results)} of about {total} results")
+        elif total > len(self.search_results):
+            self.search_status.config(text=f"Top {len(self.search_results)} of {total} results")
         else:
-            for i, track in enumerate(self.filtered_playlist):
-                frame = tk.Frame(self.search_results_frame, bg="#121212")
-                frame.pack(fill="x", pady=5)
-                
-                # Track number
-                tk.Label(frame, text=str(i+1), bg="#121212", fg="white", width=3).pack(side="left")
-                
-                # Track name
-                tk.Label(frame, text=os.path.basename(track), bg="#121212", fg="white", 
-                       width=40, anchor="w").pack(side="left")
-                
-                # Play button
-                play_btn = tk.Button(frame, text="▶", font=("Helvetica", 10), 
-                                   bg="#121212", fg="white", bd=0,
-                                   command=lambda t=track: self.play_from_search(t))
-                play_btn.pack(side="right", padx=10)
-    
-    def play_from_search(self, track_path):
-        # Find the track in main playlist
-        try:
-            index = self.playlist.index(track_path)
-            self.load_track(index)
-            self.show_home()  # Switch back to main view
-        except ValueError:
+            self.search_status.config(text=f"{total} results")
+    
+    def play_from_search(self, track_id):
+        if track_id not in self.core.registry:
             messagebox.showerror("Error", "Track not found in playlist")
+            return
+        # Search results play in the context of the full playlist
+        self.core.set_filtered_view(None)
+        self.core.play_track(track_id)
+        self.show_home()  # Switch back to main view
     
     def add_file(self):
         file_path = filedialog.askopenfilename(filetypes=[("Audio Files", "*.mp3 *.wav *.ogg")])
         if file_path:
-            self.add_track_to_playlist(file_path)
+            self.core.add_tracks([probe_track(file_path)])
+    
+    def add_url(self):
+        url = simpledialog.askstring("Open URL", "Stream URL (http or https):", parent=self.root)
+        if not url:
+            return
+        url = url.strip()
+        if not is_url(url):
+            messagebox.showerror("Error", "Only http:// and https:// URLs can be streamed")
+            return
+        self.core.add_tracks([stream_info(url)])
     
     def add_folder(self):
         folder_path = filedialog.askdirectory()
         if folder_path:
-            for file in os.listdir(folder_path):
-                if file.lower().endswith(('.mp3', '.wav', '.ogg')):
-                    file_path = os.path.join(folder_path, file)
-                    self.add_track_to_playlist(file_path)
+            self.library.add_root(folder_path)
+            self.start_import(FolderImporter([folder_path]))
+            self.core.watch_folder(folder_path)
+    
+    def rescan_library(self):
+        roots = self.library.roots()
+        if roots:
+            self.start_import(FolderImporter(roots, known=self.library.known_files()))
+    
+    def start_import(self, importer):
+        if self.importer:
+            messagebox.showinfo("Import", "A folder import is already running")
+            return
+        self.importer = importer
+        self.importer.start()
+        self.import_label.config(text="Scanning folder...")
+        self.import_progress["value"] = 0
+        self.import_frame.pack(side="bottom", fill="x", pady=10)
+        self.poll_import()
     
-    def add_track_to_playlist(self, file_path):
-        self.playlist.append(file_path)
-        self.update_playlist_display()
+    def poll_import(self):
+        importer = self.importer
+        if importer is None:
+            return
+        
+        # Hand every batch probed since the last poll to the playlist at once
+        infos = []
+        for batch in importer.poll():
+            infos.extend(batch)
+        if infos:
+            self.core.add_tracks(infos)
+        
+        if importer.finished:
+            if importer.deleted and not importer.cancelled.is_set():
+                self.core.remove_paths(importer.deleted)
+            self.import_frame.pack_forget()
+            self.importer = None
+            return
         
-        if len(self.playlist) == 1:  # First track added
-            self.load_track(0)
+        self.import_progress["maximum"] = max(1, importer.found)
+        self.import_progress["value"] = importer.probed
+        self.import_label.config(text=f"Importing {importer.probed} of {importer.found} found")
+        self.root.after(100, self.poll_import)
+    
+    def cancel_import(self):
+        if self.importer:
+            self.importer.cancel()
+            self.import_label.config(text="Cancelling...")
     
+    def on_core_event(self, event, track):
+        if event == "track":
+            self.show_track(track)
+        elif event == "playback":
+            self.play_btn.config(text="⏸" if not (self.core.stopped or self.core.paused) else "⏯")
+        elif event == "view":
+            self.update_playlist_display()
+        elif event == "liked":
+            self.show_liked_state(track)
+        elif event == "metadata" and track is self.core.current_track:
+            self.show_track_info(track)
+        elif event == "error":
+            messagebox.showerror("Error", f"Could not play {os.path.basename(track.path)}")
+        elif event == "rescan" and self.importer is None:
+            self.rescan_library()
+        elif event == "session":
+            self.show_session()
+        elif event == "restored":
+            self.startup.mark("library_restored")
+            if self.search_entry.get():
+                self.search_songs()  # Searched while the index was incomplete
+    
+    def show_session(self):
+        # Settings restored from the last session
+        self.session_restored = True
+        core = self.core
+        self.volume_slider.set(core.volume)
+        self.repeat_btn.config(bg="#1DB954" if core.repeat else "#535353")
+        self.shuffle_btn.config(bg="#1DB954" if core.shuffle else "#535353")
+        self.shuffle_mode.set(core.shuffle_mode)
+        self.gapless.set(core.gapless)
+        self.normalize.set(core.normalize)
+    
+    @metrics.timed("ui.update_playlist_display")
     def update_playlist_display(self):
-        # Clear current display
-        for widget in self.playlist_scrollable_frame.winfo_children():
-            widget.destroy()
-        
         # Display current playlist (or filtered playlist)
-        display_list = self.filtered_playlist if hasattr(self, 'filtered_playlist') and self.filtered_playlist else self.playlist
-        
-        for i, track in enumerate(display_list):
-            frame = tk.Frame(self.playlist_scrollable_frame, bg="#121212")
-            frame.pack(fill="x", pady=2)
-            
-            # Track number
-            tk.Label(frame, text=str(i+1), bg="#121212", fg="white", width=3).pack(side="left")
-            
-            # Track name
-            tk.Label(frame, text=os.path.basename(track), bg="#121212", fg="white", 
-                   width=40, anchor="w").pack(side="left")
-            
-            # Play button
-            play_btn = tk.Button(frame, text="▶", font=("Helvetica", 10), 
-                               bg="#121212", fg="white", bd=0,
-                               command=lambda idx=i: self.load_track(idx))
-            play_btn.pack(side="right", padx=10)
+        core = self.core
+        if core.active_playlist:
+            title = core.active_playlist.name
+        elif core.filtered_ids is not None:
+            title = "Liked Songs"
+        else:
+            title = "Your Library"
+        self.playlist_label.config(text=title)
+        self.playlist_view.set_items(core.current_view(), core.describe)
     
+    @metrics.timed("ui.load_track")
     def load_track(self, index):
-        if not self.playlist:
-            return
-            
-        # Use filtered playlist if available, otherwise main playlist
-        playlist_to_use = self.filtered_playlist if self.filtered_playlist else self.playlist
-        
-        if 0 <= index < len(playlist_to_use):
-            # Find the index in the main playlist
-            track_path = playlist_to_use[index]
-            self.current_index = self.playlist.index(track_path)
-            self.current_track = track_path
-            
-            # Update UI
-            track_name = os.path.basename(self.current_track)
-            self.current_track_label.config(text=track_name)
-            self.current_artist_label.config(text="Artist")  # Would extract from metadata in a real app
-            
-            # Update like button
-            if self.current_track in self.liked_songs:
-                self.like_btn.config(text="♥", fg="#1DB954")
-            else:
-                self.like_btn.config(text="♡", fg="white")
-            
-            # Load and play the track
-            pygame.mixer.music.load(self.current_track)
-            pygame.mixer.music.play()
-            self.stopped = False
-            self.paused = False
-            self.play_btn.config(text="⏸")
-            
-            # Update track length
-            try:
-                audio = MP3(self.current_track)
-                self.track_duration = audio.info.length
-            except:
-                # Fallback if mutagen can't read the file
-                sound = pygame.mixer.Sound(self.current_track)
-                self.track_duration = sound.get_length()
-                
-            self.track_length.config(text=self.format_time(self.track_duration))
+        # index is a position in the displayed view
+        self.core.play_index(index)
     
-    def toggle_play_pause(self):
-        if not self.playlist:
+    def show_track(self, track):
+        # Update UI
+        self.show_track_info(track)
+        self.show_album_art(track)
+        self.show_liked_state(track)
+        self.show_waveform(track)
+        
+        # Tags and length come from the metadata workers if still unknown
+        if track.duration is None or not (track.title or track.artist):
+            self.metadata.request(track.path, track.mtime,
+                                  lambda info, track_id=track.id: self.core.apply_metadata(track_id, info))
+    
+    def show_liked_state(self, track):
+        if track is not self.core.current_track:
             return
-            
-        if self.stopped:
-            self.load_track(self.current_index)
-        elif self.paused:
-            pygame.mixer.music.unpause()
-            self.paused = False
-            self.play_btn.config(text="⏸")
+        if track.liked:
+            self.like_btn.config(text="♥", fg="#1DB954")
         else:
-            pygame.mixer.music.pause()
-            self.paused = True
-            self.play_btn.config(text="⏯")
+            self.like_btn.config(text="♡", fg="white")
+    
+    def show_track_info(self, track):
+        self.current_track_label.config(text=track.title or os.path.basename(track.path))
+        self.current_artist_label.config(text=track.artist or "Unknown Artist")
+        if track.duration is None:
+            self.track_length.config(text="-:--")
+        else:
+            self.track_length.config(text=self.format_time(track.duration))
+    
+    def show_waveform(self, track):
+        def set_peaks(peaks):
+            if track is self.core.current_track:
+                self.progress_bar.set_peaks(peaks)
+        # A new track starts unplayed, not at the next progress tick
+        self.progress_bar.set_fraction(0)
+        self.progress_bar.set_peaks(None)
+        self.waveforms.request(track.path, track.mtime, set_peaks)
+    
+    def build_waveforms(self):
+        # Waveforms already on disk are skipped, so this also resumes
+        tracks = [(track.path, track.mtime) for track in self.core.registry.tracks.values()]
+        if not self.waveforms.build_all(tracks):
+            messagebox.showinfo("Build Waveforms", "Waveforms are already being built.")
+    
+    def show_album_art(self, track):
+        def set_art(photo):
+            if track is self.core.current_track:
+                image = photo or self.album_art_photo
+                self.album_art.config(image=image)
+                self.album_art.image = image
+        
+        self.album_art.config(image=self.album_art_photo)
+        self.art.request(track.path, track.mtime, FULL_SIZE, set_art)
+    
+    def row_thumbnail(self, track_id):
+        # Only called for visible rows; misses are decoded in the background
+        track = self.core.registry.get(track_id)
+        if track is None:
+            return None
+        photo = self.art.photo(track.path, track.mtime, ROW_SIZE)
+        if photo is None:
+            self.art.request(track.path, track.mtime, ROW_SIZE, self.on_row_thumbnail)
+        return photo
+    
+    def on_row_thumbnail(self, photo):
+        if photo is not None:
+            self.playlist_view.refresh_soon()
+            self.search_results_view.refresh_soon()
+    
+    def poll_metadata(self):
+        # Deliver finished metadata and album art to the UI
+        self.metadata.deliver()
+        self.art.deliver()
+        self.waveforms.deliver()
+        self.root.after(METADATA_POLL_MS, self.poll_metadata)
+    
+    def poll_core(self):
+        # Gapless queueing and track ends reported by the audio backend
+        self.core.poll()
+        self.root.after(END_EVENT_POLL_MS, self.poll_core)
+    
+    def toggle_play_pause(self):
+        self.core.toggle_play_pause()
     
     def stop(self):
-        pygame.mixer.music.stop()
-        self.stopped = True
-        self.paused = False
-        self.play_btn.config(text="⏯")
+        self.core.stop()
     
     def prev_track(self):
-        if not self.playlist:
-            return
-            
-        if self.shuffle:
-            self.current_index = random.randint(0, len(self.playlist) - 1)
-        else:
-            self.current_index = (self.current_index - 1) % len(self.playlist)
-        self.load_track(self.current_index)
+        self.core.prev_track()
     
     def next_track(self):
-        if not self.playlist:
-            return
-            
-        if self.shuffle:
-            self.current_index = random.randint(0, len(self.playlist) - 1)
-        else:
-            self.current_index = (self.current_index + 1) % len(self.playlist)
-        self.load_track(self.current_index)
+        self.core.next_track()
     
     def set_volume(self, val):
-        self.volume = float(val)
-        pygame.mixer.music.set_volume(self.volume)
+        self.core.set_volume(float(val))
     
     def volume_up(self):
-        new_vol = min(1.0, self.volume + 0.1)
+        new_vol = min(1.0, self.core.volume + 0.1)
         self.volume_slider.set(new_vol)
         self.set_volume(new_vol)
     
     def volume_down(self):
-        new_vol = max(0.0, self.volume - 0.1)
+        new_vol = max(0.0, self.core.volume - 0.1)
         self.volume_slider.set(new_vol)
         self.set_volume(new_vol)
     
     def toggle_repeat(self):
-        self.repeat = not self.repeat
-        if self.repeat:
+        self.core.toggle_repeat()
+        if self.core.repeat:
             self.repeat_btn.config(bg="#1DB954")
-            pygame.mixer.music.set_endevent(pygame.USEREVENT)
         else:
             self.repeat_btn.config(bg="#535353")
-            pygame.mixer.music.set_endevent()
     
     def toggle_shuffle(self):
-        self.shuffle = not self.shuffle
-        if self.shuffle:
+        self.core.toggle_shuffle()
+        if self.core.shuffle:
             self.shuffle_btn.config(bg="#1DB954")
         else:
             self.shuffle_btn.config(bg="#535353")
     
+    def set_shuffle_mode(self):
+        self.core.set_shuffle_mode(self.shuffle_mode.get())
+    
+    def toggle_gapless(self):
+        self.core.set_gapless(self.gapless.get())
+    
+    def toggle_normalize(self):
+        self.core.set_normalize(self.normalize.get())
+    
+    def toggle_perf_overlay(self):
+        self.perf_overlay.toggle()
+        self.show_perf.set(self.perf_overlay.shown())
+    
+    def save_perf_data(self):
+        path = filedialog.asksaveasfilename(defaultextension=".json",
+                                            filetypes=[("JSON", "*.json"), ("CSV", "*.csv")])
+        if not path:
+            return
+        try:
+            metrics.dump(path)
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not save performance data: {e}")
+    
+    def toggle_visualizer(self):
+        if self.visualizer is None:
+            # numpy comes with it, so not at startup
+            from visualizer import SpectrumView
+            self.visualizer = SpectrumView(self.track_info_frame, self.visualizer_source)
+        if self.show_visualizer.get():
+            self.visualizer.pack(after=self.album_art, pady=(0, 10))
+        else:
+            self.visualizer.pack_forget()
+        self.update_visualizer()
+    
+    def on_root_map(self, event):
+        # Bindings on the root also fire for its children
+        if event.widget is self.root:
+            if not self.started:
+                self.on_first_frame()
+            self.update_visualizer()
+    
+    def update_visualizer(self):
+        # Runs only while enabled and on screen (not minimized, not behind
+        # another page)
+        if self.visualizer is None:
+            return
+        shown = self.show_visualizer.get() and self.content_frame.winfo_ismapped() and \
+            self.root.state() != "iconic"
+        self.visualizer.set_active(shown)
+    
+    def visualizer_source(self):
+        core = self.core
+        track = core.current_track
+        playing = track is not None and not (core.stopped or core.paused)
+        return (track.path if track else None,
+                core.current_position() if playing else 0.0, playing)
+    
     def toggle_like(self):
-        if self.current_track:
-            if self.current_track in self.liked_songs:
-                self.liked_songs.remove(self.current_track)
-                self.like_btn.config(text="♡", fg="white")
-            else:
-                self.liked_songs.add(self.current_track)
-                self.like_btn.config(text="♥", fg="#1DB954")
+        self.core.toggle_like()
     
     def format_time(self, seconds):
         minutes = int(seconds // 60)
         seconds = int(seconds % 60)
         return f"{minutes}:{seconds:02d}"
     
+    def show_position(self, position):
+        track = self.core.current_track
+        if track and track.duration:
+            self.progress_bar.set_fraction(position / track.duration)
+        self.current_time.config(text=self.format_time(position))
+    
+    def drag_seek(self, event):
+        track = self.core.current_track
+        if self.core.stopped or not track or not track.duration:
+            return
+        fraction = min(1.0, max(0.0, event.x / max(1, self.progress_bar.winfo_width())))
+        self.seek_target = fraction * track.duration
+        self.show_position(self.seek_target)
+    
+    def release_seek(self, event):
+        if self.seek_target is not None:
+            self.core.seek(self.seek_target)
+            self.seek_target = None
+            self.show_position(self.core.current_position())
+    
+    def seek_by(self, seconds):
+        # Shift+Left/Right; left alone while selecting text in the search box
+        if self.core.stopped or not self.track_keys_active():
+            return
+        self.core.seek(self.core.current_position() + seconds)
+        self.show_position(self.core.current_position())
+    
     def update_progress(self):
-        if not self.stopped and not self.paused:
-            current_pos = pygame.mixer.music.get_pos() / 1000  # Convert to seconds
+        core = self.core
+        track = core.current_track
+        # While dragging the bar shows the drag position
+        if self.seek_target is None and not core.stopped and not core.paused and track and track.duration:
+            current_pos = core.current_position()
             if current_pos > 0:
-                progress = (current_pos / self.track_duration) * 100
-                self.progress_bar["value"] = progress
-                self.current_time.config(text=self.format_time(current_pos))
+                self.show_position(current_pos)
                 
-                # Check if track ended
-                if current_pos >= self.track_duration - 0.1:
-                    if self.repeat:
-                        self.load_track(self.current_index)
-                    else:
-                        self.next_track()
+                # Check if track ended (end events handle this when available)
+                core.check_track_end()
         
         self.root.after(1000, self.update_progress)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Spotify-like music player")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print time to first frame and to interactive, then quit")
+    args = parser.parse_args()
+    startup = StartupProfile(STARTED)
+    startup.mark("imports")
     root = tk.Tk()
-    app = SpotifyLikePlayer(root)
+    app = SpotifyLikePlayer(root, startup, profile_startup=args.profile_startup)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,194 @@
+import base64
+import os
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import metrics
+from streaming import is_url, open_stream
+
+# Tag names for title/artist/album in ID3 (MP3, WAV), Vorbis comments
+# (OGG, FLAC) and MP4 atoms
+TEXT_TAGS = {
+    "title": ("TIT2", "title", "\xa9nam"),
+    "artist": ("TPE1", "artist", "\xa9ART"),
+    "album": ("TALB", "album", "\xa9alb"),
+}
+
+
+class LRUCache:
+    # Thread-safe bounded mapping that evicts the least recently used entry
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value = self.entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+
+def first_text(tags, names):
+    for name in names:
+        try:
+            value = tags[name]
+        except (KeyError, ValueError, TypeError):
+            continue
+        if isinstance(value, list):
+            value = value[0] if value else None
+        if value:
+            return str(value)
+    return None
+
+
+def embedded_art(audio):
+    # Returns the raw bytes of the first embedded cover image, if any
+    pictures = getattr(audio, "pictures", None)
+    if pictures:
+        return pictures[0].data
+    tags = audio.tags
+    if not tags:
+        return None
+    if hasattr(tags, "getall"):
+        frames = tags.getall("APIC")
+        if frames:
+            return frames[0].data
+    try:
+        blocks = tags["metadata_block_picture"]
+    except (KeyError, ValueError, TypeError):
+        blocks = None
+    if blocks:
+        from mutagen.flac import Picture
+        try:
+            return Picture(base64.b64decode(blocks[0])).data
+        except Exception:
+            return None
+    try:
+        covers = tags["covr"]
+    except (KeyError, ValueError, TypeError):
+        covers = None
+    if covers:
+        return bytes(covers[0])
+    return None
+
+
+@metrics.timed("metadata.read")
+def read_metadata(path, stat=None, with_art=False):
+    # Reads duration and tags with mutagen's format-generic File(); nothing
+    # is decoded, so this is cheap enough to run for every track. URLs are
+    # read through a stream, which only fetches the parts mutagen looks at.
+    # mutagen is imported on first use, off the startup path
+    import mutagen
+    if is_url(path):
+        stream = open_stream(path)
+        info = {"path": path, "size": stream.size, "mtime": None}
+    else:
+        stream = None
+        if stat is None:
+            stat = os.stat(path)
+        info = {"path": path, "size": stat.st_size, "mtime": stat.st_mtime}
+    info.update(duration=None, title=None, artist=None, album=None)
+    try:
+        audio = mutagen.File(stream or path)
+    except Exception:
+        audio = None
+    finally:
+        if stream is not None:
+            stream.close()
+    if audio is None:
+        return info
+    if audio.info is not None:
+        info["duration"] = getattr(audio.info, "length", None)
+    if audio.tags:
+        for key, names in TEXT_TAGS.items():
+            info[key] = first_text(audio.tags, names)
+    if with_art:
+        info["art"] = embedded_art(audio)
+    return info
+
+
+class MetadataService:
+    # Reads track metadata on a worker pool. Results are cached by
+    # (path, mtime) and handed back to the UI thread, which drains them
+    # with deliver() from a root.after loop, so track switches never wait
+    # on mutagen.
+    def __init__(self, workers=4, cache_size=4096, art_cache_size=32):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="metadata")
+        self.cache = LRUCache(cache_size)
+        self.art_cache = LRUCache(art_cache_size)
+        self.results = queue.Queue()
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def cached(self, path, mtime):
+        return self.cache.get((path, mtime))
+
+    def art(self, path, mtime):
+        return self.art_cache.get((path, mtime))
+
+    def request(self, path, mtime, callback):
+        key = (path, mtime)
+        info = self.cache.get(key)
+        if info is not None:
+            callback(info)
+            return
+        with self.lock:
+            callbacks = self.pending.get(key)
+            if callbacks is not None:
+                callbacks.append(callback)
+                return
+            self.pending[key] = [callback]
+        self.pool.submit(self.load, key)
+
+    def load(self, key):
+        # Whatever happens, the request is finished here; a failed read
+        # isn't cached, so the next request tries again
+        path, mtime = key
+        info = None
+        try:
+            info = read_metadata(path, with_art=True)
+            art = info.pop("art", None)
+            self.cache.put(key, info)
+            if art:
+                self.art_cache.put(key, art)
+        except Exception:
+            info = None
+        finally:
+            with self.lock:
+                callbacks = self.pending.pop(key, [])
+            self.results.put((callbacks, info))
+
+    def deliver(self):
+        # Runs the callbacks of finished requests on the calling thread
+        while True:
+            try:
+                callbacks, info = self.results.get_nowait()
+            except queue.Empty:
+                return
+            if info is None:
+                continue
+            for callback in callbacks:
+                callback(info)
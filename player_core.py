@@ -0,0 +1,704 @@
+import json
+import os
+from array import array
+
+from audio_backend import NullAudioBackend
+from gapless import TrackPreloader
+from instrumentation import metrics
+from playlists import PlaylistManager, export_playlist
+from search_index import SearchIndex
+from seek_index import SeekIndexService
+from shuffle import ShuffleQueue
+from streaming import StreamOpener, is_url
+from track_registry import TrackRegistry
+from watcher import LibraryWatcher, inside
+
+# "plain" is a uniform shuffle, "artist" avoids back-to-back tracks by the
+# same artist and "liked" brings liked tracks up earlier in each cycle
+SHUFFLE_MODES = ("plain", "artist", "liked")
+
+# Relative chance of a track that isn't liked in "liked" shuffle mode
+UNLIKED_WEIGHT = 0.35
+
+# Tracks added to the search index per restore_steps() step
+RESTORE_CHUNK = 1000
+
+
+class PlayerCore:
+    # Everything the player does that doesn't need a window: the library,
+    # the play queue, shuffle/repeat state and search. Audio goes through a
+    # backend (PygameAudioBackend, NullAudioBackend) and UIs follow along by
+    # registering listeners, which are called as listener(event, track):
+    #
+    #   "track"     a new track became current
+    #   "playback"  playing/paused/stopped changed
+    #   "view"      the library or the active view changed
+    #   "liked"     a track's liked state changed
+    #   "metadata"  a track's tags or duration changed
+    #   "error"     a track couldn't be opened (missing file, network error)
+    #   "rescan"    the folder watcher lost events; the library needs a rescan
+    #   "session"   settings were restored from the last session
+    #   "restored"  the library finished loading and search covers all of it
+    def __init__(self, library, audio=None):
+        self.library = library
+        self.audio = audio or NullAudioBackend()
+        self.listeners = []
+
+        self.registry = TrackRegistry()
+        self.search_index = SearchIndex()
+        self.filtered_ids = None
+        self.filtered_positions = None
+        self.playlists = PlaylistManager(library)
+        self.active_playlist = None
+
+        self.paused = False
+        self.stopped = True
+        self.current_track = None
+        # Row of the current track in the active view, so a track listed
+        # twice is followed from the entry that was played. When that
+        # entry is removed it's the row that took its place and
+        # row_removed is set.
+        self.current_row = None
+        self.row_removed = False
+        self.volume = 0.7
+        # Scale each track by its ReplayGain gain
+        self.normalize = True
+        self.loudness = None
+        self.watcher = None
+        self.repeat = False
+        self.shuffle = False
+        self.shuffle_mode = "plain"
+        self.shuffler = ShuffleQueue()
+        self.position_base = 0.0
+        self.seek_indexes = SeekIndexService(library)
+
+        self.gapless = self.audio.end_events
+        self.preloader = TrackPreloader()
+        self.queued_track = None
+        self.queued_row = None
+        self.next_row = None
+        # Remote tracks are connected to in the background; see poll()
+        self.opener = StreamOpener()
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def notify(self, event, track=None):
+        for listener in self.listeners:
+            listener(event, track)
+
+    # Library
+
+    def restore(self):
+        for _ in self.restore_steps():
+            pass
+
+    def restore_steps(self, chunk=RESTORE_CHUNK):
+        # restore() as a generator, one short step per next(), so a UI can
+        # run its event loop in between: the tracks are loaded chunk rows
+        # at a time, then come the order, playlists and last session, then
+        # the search index is built chunk tracks at a time. Tracks removed
+        # meanwhile are skipped; ones added are indexed by add_tracks().
+        for rows in self.library.load_tracks(chunk):
+            self.registry.load_rows(rows)
+            yield
+        self.registry.load_order(self.library.load_playlist())
+        self.playlists.restore()
+        self.restore_session()
+        self.notify("view")
+        yield
+        tracks = list(self.registry.tracks.values())
+        for start in range(0, len(tracks), chunk):
+            for track in tracks[start:start + chunk]:
+                if track.id in self.registry:
+                    self.index_track(track)
+            yield
+        self.notify("restored")
+
+    def shutdown(self):
+        # Stops the background work before the program exits: the watcher,
+        # the loudness analysis and the seek index builds. Queued jobs are
+        # dropped rather than waited for.
+        self.opener.cancel()
+        self.preloader.cancel()
+        if self.watcher is not None:
+            self.watcher.stop()
+        if self.loudness is not None:
+            self.loudness.stop()
+        self.seek_indexes.shutdown()
+
+    def save_session(self):
+        track = self.current_track
+        self.library.set_state("session", json.dumps({
+            "track": track.id if track else None, "volume": self.volume,
+            "normalize": self.normalize, "gapless": self.gapless, "repeat": self.repeat,
+            "shuffle": self.shuffle, "shuffle_mode": self.shuffle_mode}))
+
+    def restore_session(self):
+        # Settings and the current track from save_session(); the track is
+        # shown but not played
+        try:
+            session = json.loads(self.library.get_state("session") or "{}")
+        except ValueError:
+            session = {}
+        self.volume = session.get("volume", self.volume)
+        self.normalize = session.get("normalize", self.normalize)
+        self.repeat = session.get("repeat", self.repeat)
+        self.set_gapless(session.get("gapless", self.gapless))
+        if session.get("shuffle_mode") in SHUFFLE_MODES:
+            self.set_shuffle_mode(session["shuffle_mode"])
+        track = self.registry.get(session.get("track"))
+        if track is not None:
+            self.current_track = track
+            self.current_row = self.view_position(track.id)
+            self.notify("track", track)
+        if session.get("shuffle") and not self.shuffle:
+            self.toggle_shuffle()
+        self.apply_volume()
+        self.notify("session")
+
+    def analyze_loudness(self):
+        # Starts (or wakes) the background loudness analysis of tracks that
+        # don't have ReplayGain values yet. It needs its own connection to
+        # the library, so in-memory libraries are left alone.
+        if self.library.path == ":memory:":
+            return
+        if self.loudness is None:
+            # Imported here: numpy is slow to load and not needed to start
+            from loudness import LoudnessAnalyzer
+            self.loudness = LoudnessAnalyzer(self.library.path)
+        self.loudness.start()
+
+    def watch_library(self):
+        # Follows changes under the library's root folders from now on
+        self.watcher = LibraryWatcher(self.library.roots())
+        self.watcher.start()
+
+    def watch_folder(self, folder_path):
+        if self.watcher is None:
+            self.watch_library()
+        self.watcher.add_root(folder_path)
+
+    def apply_file_changes(self, infos, removed, removed_folders):
+        # A batch from the watcher: new or changed files, deleted files and
+        # deleted folders (every track below them goes)
+        if removed_folders:
+            removed = list(removed)
+            removed.extend(path for path in self.registry.ids if not is_url(path) and
+                           any(inside(path, folder) for folder in removed_folders))
+        if infos:
+            self.add_tracks(infos)
+        if removed:
+            self.remove_paths(removed)
+
+    def index_track(self, track):
+        name = os.path.splitext(os.path.basename(track.path))[0]
+        self.search_index.add(track.id, name, track.title, track.artist, track.album)
+
+    def describe(self, track_id):
+        return os.path.basename(self.registry.tracks[track_id].path)
+
+    @metrics.timed("core.add_tracks")
+    def add_tracks(self, infos):
+        first_tracks = not self.registry.tracks  # Not len(): that's 0 mid-restore
+        ids = self.library.upsert_tracks(infos)
+        # Tracks already in the library are only refreshed, not re-added
+        added = False
+        for info in infos:
+            track_id = ids[info["path"]]
+            if self.registry.add(track_id, info):
+                added = True
+                if self.shuffle and self.filtered_ids is None:
+                    self.shuffler.add(track_id)
+            self.index_track(self.registry.tracks[track_id])
+        if self.loudness is not None:
+            self.loudness.start()  # New or changed files
+        if not added:
+            return
+        # The stored order isn't rewritten for every batch: new tracks have
+        # the highest ids, and restore puts tracks missing from the stored
+        # order after it in id order, which is where they were added
+        self.notify("view")
+
+        if first_tracks and self.registry:  # First track added
+            self.play_index(0)
+
+    @metrics.timed("core.remove_paths")
+    def remove_paths(self, paths):
+        removed = {self.registry.id_for(path) for path in paths} - {None}
+        if not removed:
+            return
+        for track_id in removed:
+            self.search_index.remove(track_id)
+            self.shuffler.remove(track_id)
+        view = self.current_view()
+        self.drop_rows(lambda row: view[row] in removed)
+        self.registry.remove(removed)
+        self.library.delete_tracks(removed)
+        self.library.save_playlist(self.registry.order)
+        self.playlists.remove_tracks(removed)
+
+        if self.filtered_ids is not None:
+            self.set_filtered_view(array('q', (i for i in self.filtered_ids if i not in removed)),
+                                   self.active_playlist, keep_row=True)
+        else:
+            self.notify("view")
+
+    def apply_metadata(self, track_id, info):
+        track = self.registry.get(track_id)
+        if track is None:
+            return
+        changed = (info["duration"], info["title"], info["artist"], info["album"]) != \
+            (track.duration, track.title, track.artist, track.album)
+        if changed:
+            track.update(info)
+            self.library.upsert_tracks([info])
+            self.index_track(track)
+            self.notify("metadata", track)
+
+    # Views and search
+
+    def set_filtered_view(self, track_ids, playlist=None, keep_row=False):
+        # A filtered view is an array of track ids plus its id -> position map
+        # (first position of each id); None shows (and navigates) the full
+        # playlist. playlist is the named playlist the view shows, if any.
+        # keep_row: the caller already moved current_row to match the new
+        # view (an edit of the same view), otherwise it's looked up.
+        self.filtered_ids = track_ids
+        self.active_playlist = playlist
+        if track_ids is None:
+            self.filtered_positions = None
+        else:
+            self.filtered_positions = positions = {}
+            for i, track_id in enumerate(track_ids):
+                positions.setdefault(track_id, i)
+        if not keep_row:
+            track = self.current_track
+            self.current_row = self.view_position(track.id) if track else None
+            self.row_removed = False
+        if self.shuffle:
+            self.shuffler.set_items(self.current_view())
+        self.notify("view")
+        self.queue_next_track()
+
+    def show_liked(self):
+        self.set_filtered_view(self.registry.liked_ids())
+
+    # Named playlists
+
+    def open_playlist(self, playlist):
+        self.playlists.load(playlist, self.registry.__contains__)
+        self.set_filtered_view(playlist.ids(), playlist)
+
+    def playlist_changed(self, playlist):
+        self.playlists.save(playlist)
+        if playlist is self.active_playlist:
+            self.set_filtered_view(playlist.ids(), playlist, keep_row=True)
+
+    def add_to_playlist(self, playlist, track_ids):
+        self.playlists.load(playlist, self.registry.__contains__)
+        playlist.append(track_ids)
+        self.playlist_changed(playlist)
+
+    def add_paths_to_playlist(self, playlist, locations, infos):
+        # A resolved batch from a PlaylistImporter: infos are the tracks
+        # that aren't in the library yet
+        if infos:
+            self.add_tracks(infos)
+        ids = (self.registry.id_for(location) for location in locations)
+        self.add_to_playlist(playlist, [track_id for track_id in ids if track_id is not None])
+
+    def remove_from_playlist(self, playlist, position):
+        if 0 <= position < len(playlist):
+            if playlist is self.active_playlist:
+                self.drop_rows(position.__eq__)
+            playlist.pop(position)
+            self.playlist_changed(playlist)
+
+    def move_in_playlist(self, playlist, old_position, new_position):
+        if 0 <= old_position < len(playlist) and 0 <= new_position < len(playlist):
+            row = self.current_row
+            if playlist is self.active_playlist and row is not None:
+                if old_position == row and not self.row_removed:
+                    row = new_position
+                else:
+                    row -= old_position < row
+                    row += new_position <= row
+                self.current_row = row
+            playlist.move(old_position, new_position)
+            self.playlist_changed(playlist)
+
+    def delete_playlist(self, playlist):
+        if playlist is self.active_playlist:
+            self.set_filtered_view(None)
+        self.playlists.delete(playlist)
+
+    def export_playlist(self, playlist, path):
+        self.playlists.load(playlist, self.registry.__contains__)
+        tracks = self.registry.tracks
+        export_playlist(path, (tracks[track_id] for track_id in playlist.ids()))
+
+    def current_view(self):
+        return self.filtered_ids if self.filtered_ids is not None else self.registry.order
+
+    def view_position(self, track_id):
+        if self.filtered_positions is not None:
+            return self.filtered_positions.get(track_id)
+        return self.registry.position(track_id)
+
+    def current_view_row(self):
+        # Row of the playing entry in the active view, or None
+        if self.current_row is None or self.row_removed:
+            return None
+        return self.current_row
+
+    def drop_rows(self, removed):
+        # Called before the active view loses the rows where removed(row)
+        # is true: current_row moves up past them. If its own entry goes,
+        # it becomes the row of the entry that takes its place.
+        row = self.current_row
+        if row is None:
+            return
+        row = min(row, len(self.current_view()))
+        if row < len(self.current_view()) and not self.row_removed and removed(row):
+            self.row_removed = True
+        self.current_row = sum(1 for i in range(row) if not removed(i))
+
+    def search(self, query, limit):
+        results, total = self.search_index.search(query, limit)
+        return array('q', results), total
+
+    # Playback
+
+    def play_index(self, index):
+        # index is a position in the active view
+        view = self.current_view()
+        if 0 <= index < len(view):
+            self.play_track(view[index], index)
+
+    @metrics.timed("core.play_track")
+    def play_track(self, track_id, row=None):
+        # row: the track's row in the active view, if known (a track can
+        # be listed twice); otherwise its first row
+        track = self.registry.get(track_id)
+        if track is None:
+            return
+
+        # Load and play the track; load() drops whatever was queued
+        self.queued_track = None
+        self.opener.cancel()
+        if is_url(track.path):
+            # Connecting can take up to the server's timeout: the track is
+            # shown now and starts from poll() once its stream is open
+            self.stop()
+            self.set_current(track, row)
+            self.opener.open(("play", track, 0.0), track.path)
+            return
+        try:
+            self.audio.load(track.path)
+            self.audio.play()
+        except Exception:
+            self.stop()
+            self.notify("error", track)
+            return
+        self.stopped = False
+        self.paused = False
+        self.notify("playback")
+
+        self.set_current(track, row)
+        self.queue_next_track()
+
+    def set_current(self, track, row=None):
+        self.current_track = track
+        self.current_row = row if row is not None else self.view_position(track.id)
+        self.row_removed = False
+        self.position_base = 0.0
+        # Built in the background now, so the first seek can use it
+        self.seek_indexes.get(track)
+        self.shuffler.played(track.id)
+        self.apply_volume()
+        self.notify("track", track)
+
+    def toggle_play_pause(self):
+        if not self.registry:
+            return
+
+        if self.stopped:
+            if self.current_track and self.current_track.id in self.registry:
+                self.play_track(self.current_track.id, self.current_view_row())
+            else:
+                self.play_index(0)
+        elif self.paused:
+            self.audio.unpause()
+            self.paused = False
+            self.notify("playback")
+        else:
+            self.audio.pause()
+            self.paused = True
+            self.notify("playback")
+
+    def stop(self):
+        # stop() drops whatever was queued
+        self.opener.cancel()
+        self.audio.stop()
+        self.queued_track = None
+        self.stopped = True
+        self.paused = False
+        self.notify("playback")
+        self.queue_next_track()
+
+    def next_entry(self, step):
+        # (track id, row) step entries away from the current one; row is
+        # None when shuffling
+        view = self.current_view()
+        if not view:
+            return None, None
+
+        if self.shuffle:
+            if step > 0:
+                return self.shuffler.peek(), None
+            # Back through the shuffle history, or restart the current track
+            previous = self.shuffler.previous()
+            if previous is None and self.current_track:
+                return self.current_track.id, None
+            return previous, None
+
+        row = self.current_row if self.current_track else None
+        if row is None:
+            index = 0
+        elif self.row_removed:
+            # The entry after the removed one already sits at row
+            index = (row if step > 0 else row - 1) % len(view)
+        else:
+            index = (row + step) % len(view)
+        return view[index], index
+
+    def step_track(self, step):
+        track_id, row = self.next_entry(step)
+        if track_id is not None:
+            self.play_track(track_id, row)
+
+    def prev_track(self):
+        self.step_track(-1)
+
+    def next_track(self):
+        self.step_track(1)
+
+    def toggle_repeat(self):
+        self.repeat = not self.repeat
+        self.queue_next_track()
+
+    def toggle_shuffle(self):
+        self.shuffle = not self.shuffle
+        if self.shuffle:
+            # Each time shuffle is switched on starts a fresh cycle; the
+            # shuffler is only kept in sync with the view while it's on
+            self.shuffler.reset(self.current_view())
+            if self.current_track:
+                self.shuffler.played(self.current_track.id)
+        self.queue_next_track()
+
+    def set_shuffle_mode(self, mode):
+        tracks = self.registry.tracks
+        self.shuffle_mode = mode
+        self.shuffler.artist = None
+        self.shuffler.weight = None
+        if mode == "artist":
+            self.shuffler.artist = lambda track_id: getattr(tracks.get(track_id), "artist", None)
+        elif mode == "liked":
+            self.shuffler.weight = lambda track_id: 1.0 if tracks[track_id].liked else UNLIKED_WEIGHT
+        # Re-pick the upcoming track with the new bias
+        self.shuffler.staged = False
+        self.queue_next_track()
+
+    def set_gapless(self, enabled):
+        self.gapless = enabled and self.audio.end_events
+        self.queue_next_track()
+
+    def toggle_like(self):
+        track = self.current_track
+        if track:
+            track.liked = not track.liked
+            self.library.set_liked(track.id, track.liked)
+            self.notify("liked", track)
+
+    def set_volume(self, volume):
+        self.volume = volume
+        self.apply_volume()
+
+    def set_normalize(self, enabled):
+        self.normalize = enabled
+        self.apply_volume()
+
+    def track_volume(self, track):
+        # The user's volume scaled by the track's gain, held back where the
+        # gain would clip the track's peak. The mixer can't amplify, so
+        # positive gains only help below full volume.
+        if not self.normalize or track is None or track.gain is None:
+            return self.volume
+        scale = 10 ** (track.gain / 20)
+        if track.peak:
+            scale = min(scale, 1 / track.peak)
+        return min(1.0, self.volume * scale)
+
+    def apply_volume(self):
+        self.audio.set_volume(self.track_volume(self.current_track))
+
+    def current_position(self):
+        return self.position_base + self.audio.get_pos()
+
+    def seek(self, seconds):
+        track = self.current_track
+        if track is None or self.stopped:
+            return
+        if track.duration:
+            seconds = min(seconds, max(0.0, track.duration - 0.5))
+        seconds = max(0.0, seconds)
+
+        # The seek index is requested when the track starts; until it's
+        # ready the decoder seeks on its own
+        index = self.seek_indexes.get(track)
+        point = index.locate(seconds) if index else None
+        try:
+            if point:
+                seconds, offset = point
+                if is_url(track.path):
+                    # Reopening a remote track is a new request; it
+                    # continues from poll()
+                    self.opener.open(("seek", track, seconds), track.path, index.head_end, offset)
+                    return
+                self.audio.seek(track.path, seconds, (index.head_end, offset))
+            else:
+                self.audio.seek(track.path, seconds)
+        except Exception:
+            self.stop()
+            self.notify("error", track)
+            return
+        self.seeked(seconds)
+
+    def seeked(self, seconds):
+        self.position_base = seconds
+        if self.paused:
+            self.audio.pause()
+
+        # Seeking drops whatever the mixer had queued
+        self.queued_track = None
+        self.queue_next_track()
+
+    # Gapless transitions
+
+    def queue_next_track(self):
+        # Gapless mode: preload the upcoming track and hand it to the
+        # backend's queue so the mixer switches without a gap.
+        # queued_track mirrors what the mixer has queued; a new queue()
+        # call replaces it.
+        self.preloader.cancel()
+        # end_events can turn out False once the audio backend is up
+        if not (self.gapless and self.audio.end_events) or self.stopped:
+            return
+        if self.repeat:
+            track, row = self.current_track, self.current_view_row()
+        else:
+            track_id, row = self.next_entry(1)
+            track = self.registry.get(track_id)
+        self.next_row = row
+        if track is not None and (track is not self.queued_track or row != self.queued_row):
+            self.preloader.preload(track)
+
+    def poll(self):
+        # Called periodically by the UI: queues preloaded tracks, follows
+        # track ends reported by the audio backend and stores finished
+        # seek indexes and loudness values
+        self.seek_indexes.poll()
+        if self.loudness is not None:
+            self.apply_loudness(self.loudness.poll())
+        if self.watcher is not None:
+            for infos, removed, removed_folders in self.watcher.poll():
+                self.apply_file_changes(infos, removed, removed_folders)
+            if self.watcher.overflowed:
+                self.watcher.overflowed = False
+                self.notify("rescan")
+        opened = self.opener.poll()
+        if opened is not None:
+            self.start_opened(*opened)
+        preloaded = self.preloader.take()
+        if preloaded is not None:
+            track, duration, stream = preloaded
+            if track.duration is None:
+                track.duration = duration
+            try:
+                self.audio.queue(track.path, stream)
+                self.queued_track = track
+                self.queued_row = self.next_row
+            except Exception:
+                self.queued_track = None
+
+        for _ in range(self.audio.take_end_events()):
+            self.on_track_end()
+
+    def start_opened(self, tag, stream, error):
+        # A remote stream opened for play_track() or seek(), if that is
+        # still what's wanted
+        action, track, seconds = tag
+        if track is not self.current_track or (action == "seek" and self.stopped):
+            if stream is not None:
+                stream.close()
+            return
+        try:
+            if error is not None:
+                raise error
+            if action == "play":
+                self.audio.load(track.path, stream)
+                self.audio.play()
+            else:
+                self.audio.seek(track.path, seconds, stream=stream)
+        except Exception:
+            self.stop()
+            self.notify("error", track)
+            return
+        if action == "seek":
+            self.seeked(seconds)
+            return
+        # play_track() already made it the current track
+        self.stopped = False
+        self.paused = False
+        self.position_base = 0.0
+        self.notify("playback")
+        self.queue_next_track()
+
+    def apply_loudness(self, results):
+        # The analyser has already stored these in the library
+        for track_id, gain, peak in results:
+            track = self.registry.get(track_id)
+            if track is not None:
+                track.gain = gain
+                track.peak = peak
+                if track is self.current_track:
+                    self.apply_volume()
+
+    def on_track_end(self):
+        if self.stopped:
+            return
+        if self.queued_track is not None:
+            # The mixer already started the queued track
+            track = self.queued_track
+            self.queued_track = None
+            pos = self.audio.get_pos()
+            self.set_current(track, self.queued_row)
+            # Older pygame versions keep counting from the first track
+            if pos > 1:
+                self.position_base = -pos
+            self.queue_next_track()
+        elif self.repeat and self.current_track:
+            self.play_track(self.current_track.id, self.current_view_row())
+        else:
+            self.next_track()
+
+    def check_track_end(self):
+        # Fallback for backends without end events: compare the position
+        # with the track length
+        track = self.current_track
+        if self.audio.end_events or self.stopped or self.paused or not track or not track.duration:
+            return
+        if self.current_position() >= track.duration - 0.1:
+            self.on_track_end()
@@ -0,0 +1,350 @@
+import os
+import queue
+import threading
+from array import array
+from urllib.parse import urlsplit
+
+from importer import probe_track
+from streaming import is_url, stream_info
+
+# Track ids per stored chunk; a chunk that grows past twice this is split
+CHUNK_SIZE = 1024
+
+# Playlist entries resolved against the library at a time
+RESOLVE_BATCH = 500
+
+PLAYLIST_EXTENSIONS = (".m3u", ".m3u8", ".pls")
+
+
+class Playlist:
+    # A named list of track ids kept as a sequence of chunks, each stored
+    # as one array('q') blob. Edits only mark the chunks they touch, so
+    # appending, moving or removing a track rewrites a chunk or two rather
+    # than the whole playlist. Chunks are records of [row id, ids]; the row
+    # id is None until the chunk is first stored.
+    def __init__(self, playlist_id, name):
+        self.id = playlist_id
+        self.name = name
+        self.chunks = None  # Loaded on first use
+        self.dirty = {}
+        self.deleted = []
+        self.order_changed = False
+        self.flat = None
+
+    def __len__(self):
+        return len(self.ids())
+
+    def loaded(self):
+        return self.chunks is not None
+
+    def ids(self):
+        # All track ids in order; cached until the next edit
+        if self.flat is None:
+            self.flat = array('q')
+            for _, ids in self.chunks:
+                self.flat.extend(ids)
+        return self.flat
+
+    def changed(self, record):
+        self.dirty[id(record)] = record
+        self.flat = None
+
+    def locate(self, position):
+        # Returns (chunk index, offset in chunk) for a playlist position
+        for i, (_, ids) in enumerate(self.chunks):
+            if position < len(ids):
+                return i, position
+            position -= len(ids)
+        return len(self.chunks) - 1, len(self.chunks[-1][1])
+
+    def append(self, track_ids):
+        track_ids = array('q', track_ids)
+        if not track_ids:
+            return
+        if not self.chunks:
+            self.chunks.append([None, array('q')])
+            self.order_changed = True
+        last = self.chunks[-1]
+        room = max(0, CHUNK_SIZE - len(last[1]))
+        if room:
+            last[1].extend(track_ids[:room])
+            self.changed(last)
+        for start in range(room, len(track_ids), CHUNK_SIZE):
+            record = [None, track_ids[start:start + CHUNK_SIZE]]
+            self.chunks.append(record)
+            self.changed(record)
+            self.order_changed = True
+
+    def insert(self, position, track_id):
+        if not self.chunks:
+            self.append([track_id])
+            return
+        i, offset = self.locate(position)
+        record = self.chunks[i]
+        record[1].insert(offset, track_id)
+        self.changed(record)
+        if len(record[1]) > 2 * CHUNK_SIZE:
+            # Split the oversized chunk in two
+            tail = [None, record[1][CHUNK_SIZE:]]
+            del record[1][CHUNK_SIZE:]
+            self.chunks.insert(i + 1, tail)
+            self.changed(tail)
+            self.order_changed = True
+
+    def pop(self, position):
+        i, offset = self.locate(position)
+        record = self.chunks[i]
+        track_id = record[1].pop(offset)
+        if record[1]:
+            self.changed(record)
+        else:
+            self.drop_chunk(i)
+        return track_id
+
+    def drop_chunk(self, i):
+        record = self.chunks.pop(i)
+        self.dirty.pop(id(record), None)
+        if record[0] is not None:
+            self.deleted.append(record[0])
+        self.order_changed = True
+        self.flat = None
+
+    def move(self, old_position, new_position):
+        if old_position == new_position:
+            return
+        self.insert(new_position, self.pop(old_position))
+
+    def remove_tracks(self, track_ids):
+        # Drops the given ids wherever they appear
+        for i in reversed(range(len(self.chunks))):
+            record = self.chunks[i]
+            kept = array('q', (t for t in record[1] if t not in track_ids))
+            if len(kept) == len(record[1]):
+                continue
+            if kept:
+                record[1] = kept
+                self.changed(record)
+            else:
+                self.drop_chunk(i)
+
+    def take_changes(self):
+        # Returns (dirty records, deleted row ids, order changed) and resets
+        changes = list(self.dirty.values()), self.deleted, self.order_changed
+        self.dirty = {}
+        self.deleted = []
+        self.order_changed = False
+        return changes
+
+
+class PlaylistManager:
+    # Named playlists in the library store. Only names are read at
+    # startup; a playlist's chunks are loaded the first time it's opened
+    # and written back chunk by chunk by save().
+    def __init__(self, library):
+        self.library = library
+        self.playlists = {}
+
+    def restore(self):
+        self.playlists = {playlist_id: Playlist(playlist_id, name)
+                          for playlist_id, name in self.library.load_playlists()}
+
+    def sorted(self):
+        return sorted(self.playlists.values(), key=lambda p: p.name.casefold())
+
+    def by_name(self, name):
+        for playlist in self.playlists.values():
+            if playlist.name == name:
+                return playlist
+        return None
+
+    def create(self, name):
+        playlist = Playlist(self.library.create_playlist(name), name)
+        playlist.chunks = []
+        self.playlists[playlist.id] = playlist
+        return playlist
+
+    def rename(self, playlist, name):
+        self.library.rename_playlist(playlist.id, name)
+        playlist.name = name
+
+    def delete(self, playlist):
+        self.library.delete_playlist(playlist.id)
+        del self.playlists[playlist.id]
+
+    def load(self, playlist, known):
+        # known(track_id) tells whether a track is still in the library;
+        # ids of removed tracks are dropped on load
+        if playlist.loaded():
+            return playlist
+        playlist.chunks = []
+        for row_id, blob in self.library.load_playlist_chunks(playlist.id):
+            ids = array('q')
+            ids.frombytes(blob)
+            playlist.chunks.append([row_id, ids])
+        missing = {track_id for track_id in playlist.ids() if not known(track_id)}
+        if missing:
+            playlist.remove_tracks(missing)
+            self.save(playlist)
+        return playlist
+
+    def save(self, playlist):
+        dirty, deleted, order_changed = playlist.take_changes()
+        if dirty or deleted or order_changed:
+            self.library.save_playlist_chunks(playlist.id, playlist.chunks, dirty, deleted,
+                                              order_changed)
+
+    def remove_tracks(self, track_ids):
+        # Library removals; playlists not loaded yet are cleaned up on load
+        for playlist in self.playlists.values():
+            if playlist.loaded():
+                playlist.remove_tracks(track_ids)
+                self.save(playlist)
+
+
+def file_location(entry, base_dir):
+    # Resolves a playlist entry to an absolute path or URL
+    if is_url(entry):
+        return entry
+    if entry.startswith("file://"):
+        from urllib.request import url2pathname  # Pulls in http.client; rarely needed
+        return url2pathname(urlsplit(entry).path)
+    if os.sep == "/":
+        entry = entry.replace("\\", "/")  # Playlists written on Windows
+    return os.path.normpath(os.path.join(base_dir, os.path.expanduser(entry)))
+
+
+def decode_line(raw, encoding):
+    if encoding:
+        return raw.decode(encoding, "replace")
+    # Plain .m3u has no declared encoding: UTF-8 if it decodes, else Latin-1
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return raw.decode("latin-1")
+
+
+def read_playlist_entries(path, progress=None):
+    # Yields the entries of an M3U/M3U8/PLS file one line at a time;
+    # progress, if given, is called with the bytes read so far
+    is_pls = path.lower().endswith(".pls")
+    encoding = "utf-8" if path.lower().endswith(".m3u8") else None
+    done = 0
+    with open(path, "rb") as f:
+        for number, raw in enumerate(f):
+            done += len(raw)
+            if progress:
+                progress(done)
+            if number == 0 and raw.startswith(b"\xef\xbb\xbf"):
+                raw = raw[3:]
+            line = decode_line(raw, encoding).strip()
+            if not line:
+                continue
+            if is_pls:
+                key, _, value = line.partition("=")
+                if key.lower().startswith("file") and key[4:].isdigit():
+                    yield value.strip()
+            elif not line.startswith("#"):
+                yield line
+
+
+class PlaylistImporter:
+    # Reads a playlist file on a worker thread. Entries are resolved in
+    # batches: paths already in the library only need a dict lookup, new
+    # files are probed, missing ones are counted and skipped. poll() hands
+    # the batches to the UI thread as (locations, new track infos).
+    def __init__(self, path, known_paths):
+        self.path = path
+        self.known_paths = known_paths
+        self.results = queue.Queue()
+        self.cancelled = threading.Event()
+        self.read = 0
+        self.missing = 0
+        # File size and bytes read so far, for the progress bar
+        self.size = 0
+        self.done = 0
+        self.error = None
+        self.finished = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        base_dir = os.path.dirname(os.path.abspath(self.path))
+        batch = []
+        try:
+            self.size = os.path.getsize(self.path)
+            for entry in read_playlist_entries(self.path, self.advance):
+                if self.cancelled.is_set():
+                    return
+                batch.append(file_location(entry, base_dir))
+                if len(batch) >= RESOLVE_BATCH:
+                    self.resolve(batch)
+                    batch = []
+            if batch:
+                self.resolve(batch)
+        except (OSError, UnicodeError) as e:
+            self.error = e
+        finally:
+            self.results.put(None)
+
+    def advance(self, done):
+        self.done = done
+
+    def resolve(self, batch):
+        locations = []
+        infos = []
+        for location in batch:
+            self.read += 1
+            if location in self.known_paths:
+                locations.append(location)
+            elif is_url(location):
+                infos.append(stream_info(location))
+                locations.append(location)
+            else:
+                try:
+                    infos.append(probe_track(location))
+                except OSError:
+                    self.missing += 1
+                    continue
+                locations.append(location)
+        self.results.put((locations, infos))
+
+    def poll(self):
+        batches = []
+        while True:
+            try:
+                batch = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if batch is None:
+                self.finished = True
+                break
+            batches.append(batch)
+        return batches
+
+
+def export_playlist(path, tracks):
+    # Writes tracks (Track records) as .pls or extended M3U, line by line
+    is_pls = path.lower().endswith(".pls")
+    # No BOM: .m3u8 is UTF-8 by definition and many M3U readers choke on
+    # one; read_playlist_entries tries UTF-8 first for plain .m3u too
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        if is_pls:
+            f.write("[playlist]\n")
+        else:
+            f.write("#EXTM3U\n")
+        count = 0
+        for count, track in enumerate(tracks, 1):
+            length = round(track.duration) if track.duration else -1
+            title = " - ".join(part for part in (track.artist, track.title) if part) or \
+                os.path.splitext(os.path.basename(track.path))[0]
+            if is_pls:
+                f.write(f"File{count}={track.path}\nTitle{count}={title}\nLength{count}={length}\n")
+            else:
+                f.write(f"#EXTINF:{length},{title}\n{track.path}\n")
+        if is_pls:
+            f.write(f"NumberOfEntries={count}\nVersion=2\n")
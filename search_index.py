@@ -0,0 +1,200 @@
+import re
+import unicodedata
+from itertools import islice
+
+NON_WORD = re.compile(r"[\W_]+")
+
+GRAM_SIZE = 3
+
+# Tokens shorter than this only match at the start of a word
+MIN_INFIX = 2
+
+# Above this many (track, word) postings the total is only estimated and
+# the top results are collected without building the full match set
+EXACT_COUNT_LIMIT = 20000
+
+
+def normalize(text):
+    # Lowercase, strip accents and collapse punctuation to single spaces
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return NON_WORD.sub(" ", text.casefold()).strip()
+
+
+def grams(word):
+    # Bigrams and trigrams; two-letter tokens look their bigram up directly
+    result = set()
+    for size in (MIN_INFIX, GRAM_SIZE):
+        result.update(word[i:i + size] for i in range(len(word) - size + 1))
+    return result
+
+
+class SearchIndex:
+    # Inverted index from normalized words to tracks, plus a bigram/trigram
+    # index over the vocabulary to find the words containing a query token
+    # and the set of tracks per word initial for one-letter queries.
+    # Tracks are added and removed incrementally; a query that extends the
+    # previous one only re-checks the words that matched last time.
+    def __init__(self):
+        self.texts = {}
+        self.words = {}
+        self.word_grams = {}
+        self.initials = {}
+        self.last_position = None
+        self.last_token = None
+        self.last_words = []
+        self.approximate = False
+
+    def __len__(self):
+        return len(self.texts)
+
+    def add(self, key, *fields):
+        if key in self.texts:
+            self.remove(key)
+        text = " ".join(normalize(field) for field in fields if field)
+        self.texts[key] = text
+        words = set(text.split())
+        for word in words:
+            keys = self.words.get(word)
+            if keys is None:
+                keys = self.words[word] = set()
+                for gram in grams(word):
+                    self.word_grams.setdefault(gram, set()).add(word)
+            keys.add(key)
+        for initial in {word[0] for word in words}:
+            self.initials.setdefault(initial, set()).add(key)
+        self.last_token = None
+
+    def remove(self, key):
+        text = self.texts.pop(key, None)
+        if text is None:
+            return
+        words = set(text.split())
+        for word in words:
+            keys = self.words.get(word)
+            if keys is None:
+                continue
+            keys.discard(key)
+            if not keys:
+                del self.words[word]
+                for gram in grams(word):
+                    grouped = self.word_grams.get(gram)
+                    if grouped is not None:
+                        grouped.discard(word)
+                        if not grouped:
+                            del self.word_grams[gram]
+        for initial in {word[0] for word in words}:
+            keys = self.initials.get(initial)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.initials[initial]
+        self.last_token = None
+
+    def matching_words(self, token, position):
+        # Reuse the words matched by the previous query's token when the
+        # new token extends it (prefix-only tokens can't be extended)
+        last = self.last_token
+        if position == self.last_position and last and len(last) >= MIN_INFIX and last in token:
+            return [word for word in self.last_words if token in word]
+
+        if len(token) == MIN_INFIX:
+            return list(self.word_grams.get(token, ()))
+
+        postings = []
+        for gram in grams(token):
+            if len(gram) != GRAM_SIZE:
+                continue
+            words = self.word_grams.get(gram)
+            if not words:
+                return []
+            postings.append(words)
+        postings.sort(key=len)
+        result = set(postings[0]).intersection(*postings[1:])
+        return [word for word in result if token in word]
+
+    def search(self, query, limit=200):
+        # Returns (top matches, total number of matches); approximate is
+        # set when the total is an upper-bound estimate
+        self.approximate = False
+        tokens = normalize(query).split()
+        if not tokens:
+            self.last_token = None
+            return [], 0
+
+        # Only the longest token goes through the index; the others are
+        # checked against the candidates' text
+        first = max(range(len(tokens)), key=lambda i: len(tokens[i]))
+        token = tokens[first]
+        words = self.words
+        texts = self.texts
+
+        if len(token) < MIN_INFIX:
+            # Every match starts a word, so all of them rank as strong
+            matches = strong = self.initials.get(token, set())
+            matched = []
+        else:
+            matched = self.matching_words(token, first)
+            self.last_words = matched
+            estimate = sum(map(len, map(words.__getitem__, matched)))
+            if estimate > EXACT_COUNT_LIMIT:
+                self.last_position = first
+                self.last_token = token
+                self.approximate = True
+                return self.first_matches(tokens, first, matched, limit), estimate
+            matches = set().union(*(words[word] for word in matched))
+            # Tracks where every token starts a word rank first
+            strong = set().union(*(words[word] for word in matched if word.startswith(token)))
+        self.last_position = first
+        self.last_token = token
+        self.last_words = matched
+
+        for i, other in enumerate(tokens):
+            if i == first:
+                continue
+            prefix = " " + other
+            if len(other) < MIN_INFIX:
+                matches = {key for key in matches if prefix in " " + texts[key]}
+            else:
+                matches = {key for key in matches if other in texts[key]}
+            strong = {key for key in strong if prefix in " " + texts[key]}
+
+        top = sorted(islice(strong, limit), key=texts.__getitem__)
+        if len(top) < limit:
+            rest = islice(matches - strong, limit - len(top))
+            top.extend(sorted(rest, key=texts.__getitem__))
+        return top, len(matches)
+
+    def first_matches(self, tokens, first, matched, limit):
+        # Collects up to limit matches, word-prefix hits first, without
+        # expanding every posting list
+        texts = self.texts
+        token = tokens[first]
+        others = [other for i, other in enumerate(tokens) if i != first]
+        prefixes = [" " + other for other in others]
+        strong = []
+        weak = []
+        seen = set()
+        for prefix_pass in (True, False):
+            for word in matched:
+                if word.startswith(token) != prefix_pass:
+                    continue
+                for key in self.words[word]:
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    text = " " + texts[key]
+                    if not all(other in text for other in others):
+                        continue
+                    if prefix_pass and all(prefix in text for prefix in prefixes):
+                        strong.append(key)
+                        if len(strong) >= limit:
+                            return sorted(strong, key=texts.__getitem__)
+                    elif len(weak) < limit:
+                        weak.append(key)
+            if len(strong) + len(weak) >= limit:
+                break
+        top = sorted(strong, key=texts.__getitem__)
+        top.extend(sorted(weak[:limit - len(top)], key=texts.__getitem__))
+        return top
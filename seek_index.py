@@ -0,0 +1,359 @@
+import os
+import queue
+import struct
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+from metadata import LRUCache
+from streaming import is_url, open_source
+
+# Spacing of index points. An MP3 seek lands at most this far before the
+# target (frames are ~26 ms); an Ogg seek can only land on a page boundary,
+# which may be up to a page (often around a second at low bitrates) before
+# it. Either way the position reported afterwards is the exact landing
+# time. Long files get a wider spacing so an index stays under MAX_POINTS.
+POINT_SPACING = 0.1
+MAX_POINTS = 8192
+
+SCAN_BLOCK = 1024 * 1024
+
+# MPEG audio bitrates in kbit/s by (MPEG-1, layer) and (MPEG-2/2.5, layer)
+MPEG1_BITRATES = {
+    1: (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    2: (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    3: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+}
+MPEG2_BITRATES = {
+    1: (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    3: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MPEG1_SAMPLE_RATES = (44100, 48000, 32000)
+
+HEADER = struct.Struct("<dqI")
+
+
+class SeekIndex:
+    # Byte offsets of frame (MP3) or page (Ogg) boundaries at roughly
+    # POINT_SPACING intervals, with the exact time each one starts at.
+    # Playback resumes from a point by splicing the stream there: the
+    # first head_end bytes (Ogg's codec headers) followed by the data from
+    # the point's offset. Point i is the last boundary at or before
+    # i * spacing, so lookups are a single array access, and the time it
+    # returns is where playback really resumes.
+    def __init__(self, spacing, head_end=0, offsets=None, times=None):
+        self.spacing = spacing
+        self.head_end = head_end
+        self.offsets = offsets if offsets is not None else array('q')
+        self.times = times if times is not None else array('d')
+        self.last = None
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def add(self, offset, start_time):
+        # Boundaries are added in order; the points before this boundary's
+        # start time get the previous one
+        last = self.last
+        if last is not None:
+            while len(self.offsets) * self.spacing < start_time:
+                self.offsets.append(last[0])
+                self.times.append(last[1])
+        self.last = (offset, start_time)
+
+    def finish(self):
+        if self.last is not None:
+            self.offsets.append(self.last[0])
+            self.times.append(self.last[1])
+            self.last = None
+        return self
+
+    def locate(self, seconds):
+        # Returns (start time, byte offset) of the point to play from
+        if not self.offsets:
+            return None
+        i = max(0, min(int(seconds / self.spacing + 1e-9), len(self.offsets) - 1))
+        return self.times[i], self.offsets[i]
+
+    def to_blob(self):
+        return HEADER.pack(self.spacing, self.head_end, len(self.offsets)) + \
+            self.offsets.tobytes() + self.times.tobytes()
+
+    @classmethod
+    def from_blob(cls, blob):
+        spacing, head_end, count = HEADER.unpack_from(blob)
+        offsets = array('q')
+        times = array('d')
+        start = HEADER.size
+        offsets.frombytes(blob[start:start + count * 8])
+        times.frombytes(blob[start + count * 8:start + count * 16])
+        return cls(spacing, head_end, offsets, times)
+
+
+class BlockReader:
+    # Sequential scanner over a source with small random peeks
+    def __init__(self, source):
+        self.source = source
+        self.block_start = 0
+        self.block = b""
+
+    def peek(self, offset, length):
+        end = offset + length
+        if offset < self.block_start or end > self.block_start + len(self.block):
+            self.block_start = offset
+            self.block = self.source.read_at(offset, max(length, SCAN_BLOCK))
+        start = offset - self.block_start
+        return self.block[start:start + length]
+
+
+def mpeg_frame(header):
+    # Returns (frame length, samples per frame, sample rate) for a 4-byte
+    # MPEG audio frame header, or None if it isn't one
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = (header[1] >> 3) & 3  # 3: MPEG-1, 2: MPEG-2, 0: MPEG-2.5
+    layer = 4 - ((header[1] >> 1) & 3)
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 3
+    padding = (header[2] >> 1) & 1
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    if version == 3:
+        bitrate = MPEG1_BITRATES[layer][bitrate_index] * 1000
+        sample_rate = MPEG1_SAMPLE_RATES[rate_index]
+    else:
+        bitrate = MPEG2_BITRATES[layer][bitrate_index] * 1000
+        sample_rate = MPEG1_SAMPLE_RATES[rate_index] // (2 if version == 2 else 4)
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate
+    if layer == 3 and version != 3:
+        return 72 * bitrate // sample_rate + padding, 576, sample_rate
+    return 144 * bitrate // sample_rate + padding, 1152, sample_rate
+
+
+def id3_size(head):
+    if head[:3] != b"ID3" or len(head) < 10:
+        return 0
+    size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+    footer = 10 if head[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def xing_frame(frame):
+    # Returns (frame count, TOC bytes or None) from a Xing/Info frame
+    for marker in (b"Xing", b"Info"):
+        at = frame.find(marker, 4, 64)
+        if at < 0:
+            continue
+        flags = struct.unpack_from(">I", frame, at + 4)[0]
+        at += 8
+        frames = None
+        if flags & 1:
+            frames = struct.unpack_from(">I", frame, at)[0]
+            at += 4
+        if flags & 2:
+            at += 4
+        toc = frame[at:at + 100] if flags & 4 else None
+        return frames, toc
+    return None
+
+
+def find_sync(reader, offset, end):
+    # Next offset holding two consecutive valid frame headers
+    while offset < end - 4:
+        block = reader.peek(offset, SCAN_BLOCK)
+        at = block.find(b"\xff", 0)
+        while at >= 0:
+            frame = mpeg_frame(block[at:at + 4]) if at + 4 <= len(block) else \
+                mpeg_frame(reader.peek(offset + at, 4))
+            if frame and mpeg_frame(reader.peek(offset + at + frame[0], 4)):
+                return offset + at
+            at = block.find(b"\xff", at + 1)
+        if len(block) < SCAN_BLOCK:
+            return None
+        offset += len(block) - 3
+    return None
+
+
+def spacing_for(duration):
+    return max(POINT_SPACING, (duration or 0) / MAX_POINTS)
+
+
+def scan_mp3(source, full_scan=True, duration=None):
+    # Walks the frame headers (full_scan) or, for remote files, builds the
+    # index from the Xing TOC alone
+    reader = BlockReader(source)
+    size = source.size
+    if not size:
+        return None
+    start = find_sync(reader, id3_size(reader.peek(0, 10)), size)
+    if start is None:
+        return None
+    frame = mpeg_frame(reader.peek(start, 4))
+    xing = xing_frame(reader.peek(start, frame[0]))
+    if xing:
+        # The Xing/Info frame carries no audio
+        data_start = start + frame[0]
+    else:
+        data_start = start
+
+    if not full_scan:
+        frames, toc = xing or (None, None)
+        if not (frames and toc and size):
+            return None
+        duration = frames * frame[1] / frame[2]
+        # The TOC maps each percent of the duration to 1/256ths of the file
+        index = SeekIndex(duration / 100)
+        for percent in range(100):
+            offset = data_start + toc[percent] * (size - data_start) // 256
+            # percent * spacing, not duration * percent / 100: the latter
+            # can round above the point's time and shift every later point
+            index.add(offset, percent * index.spacing)
+        return index.finish()
+
+    index = SeekIndex(spacing_for(duration))
+    offset = data_start
+    samples = 0
+    while offset < size:
+        header = reader.peek(offset, 4)
+        frame = mpeg_frame(header)
+        if frame is None:
+            if header[:3] == b"TAG" or header[:4] == b"APET":
+                break  # Trailing ID3v1/APE tag
+            offset = find_sync(reader, offset + 1, size)
+            if offset is None:
+                break
+            continue
+        length, frame_samples, sample_rate = frame
+        index.add(offset, samples / sample_rate)
+        samples += frame_samples
+        offset += length
+    return index.finish()
+
+
+def ogg_pages(reader, size):
+    # Yields (offset, granule position, first packet bytes) per page
+    offset = 0
+    while offset + 27 <= size:
+        header = reader.peek(offset, 27)
+        if header[:4] != b"OggS":
+            # Lost sync: look for the next capture pattern
+            block = reader.peek(offset + 1, SCAN_BLOCK)
+            at = block.find(b"OggS")
+            if at < 0:
+                return
+            offset += 1 + at
+            continue
+        granule = struct.unpack_from("<q", header, 6)[0]
+        segments = header[26]
+        lacing = reader.peek(offset + 27, segments)
+        body = offset + 27 + segments
+        yield offset, granule, reader.peek(body, 64)
+        offset = body + sum(lacing)
+
+
+def scan_ogg(source, duration=None):
+    reader = BlockReader(source)
+    sample_rate = None
+    pre_skip = 0
+    head_end = None
+    index = SeekIndex(spacing_for(duration))
+    previous = 0
+    for offset, granule, packet in ogg_pages(reader, source.size):
+        if sample_rate is None:
+            if packet.startswith(b"\x01vorbis"):
+                sample_rate = struct.unpack_from("<I", packet, 12)[0]
+            elif packet.startswith(b"OpusHead"):
+                sample_rate = 48000  # Opus granules always count 48 kHz samples
+                # Samples the decoder drops at the start; granules include them
+                pre_skip = struct.unpack_from("<H", packet, 10)[0]
+            else:
+                return None
+            continue
+        if head_end is None:
+            # Header pages have granule 0 (or -1 while a packet spans pages)
+            if granule <= 0:
+                continue
+            head_end = offset
+        # A page's audio starts where the previous page's granule ended
+        index.add(offset, max(0, previous - pre_skip) / sample_rate)
+        if granule > 0:
+            previous = granule
+    if head_end is None:
+        return None
+    index.head_end = head_end
+    return index.finish()
+
+
+def build_seek_index(path, duration=None):
+    # Returns a SeekIndex for MP3 and Ogg (Vorbis/Opus) files, else None
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in (".mp3", ".ogg", ".oga", ".opus"):
+        return None
+    source = open_source(path)
+    try:
+        if extension == ".mp3":
+            # Remote files only use the Xing TOC instead of downloading all
+            return scan_mp3(source, not is_url(path), duration)
+        if is_url(path):
+            return None
+        return scan_ogg(source, duration)
+    finally:
+        source.close()
+
+
+class SeekIndexService:
+    # Builds seek indexes on a worker thread, lazily, for tracks that start
+    # playing (PlayerCore.set_current asks for each one). Finished indexes come back through poll() on the caller's
+    # thread, which keeps them in an LRU and stores them in the library
+    # next to the track's metadata.
+    def __init__(self, library, cache_size=64):
+        self.library = library
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="seek-index")
+        self.cache = LRUCache(cache_size)
+        self.results = queue.Queue()
+        self.pending = set()
+        self.lock = threading.Lock()
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def get(self, track):
+        # Returns the track's index if it's already known, else None (and
+        # starts building it)
+        key = (track.id, track.mtime)
+        index = self.cache.get(key)
+        if index is not None:
+            return index or None
+        blob = self.library.load_seek_index(track.id, track.mtime)
+        if blob is not None:
+            index = SeekIndex.from_blob(blob) if blob else False
+            self.cache.put(key, index)
+            return index or None
+        with self.lock:
+            if key in self.pending:
+                return None
+            self.pending.add(key)
+        self.pool.submit(self.build, key, track.path, track.duration)
+        return None
+
+    def build(self, key, path, duration):
+        try:
+            index = build_seek_index(path, duration)
+        except Exception:
+            index = None
+        self.results.put((key, index))
+
+    def poll(self):
+        while True:
+            try:
+                key, index = self.results.get_nowait()
+            except queue.Empty:
+                return
+            with self.lock:
+                self.pending.discard(key)
+            # False marks formats without an index so they aren't rescanned
+            self.cache.put(key, index or False)
+            track_id, mtime = key
+            self.library.save_seek_index(track_id, mtime, index.to_blob() if index else b"")
@@ -0,0 +1,163 @@
+import random
+from array import array
+
+# Random picks tried per draw before settling for the first usable one in
+# artist-spread / weighted mode
+MAX_TRIES = 8
+
+HISTORY_LIMIT = 1000
+
+
+class ShuffleQueue:
+    # Shuffled play order over a set of track ids. The ids live in one
+    # array: pool[:cursor] are the tracks played this cycle and
+    # pool[cursor:] the unplayed remainder. Each draw is one Fisher-Yates
+    # step (swap a random remaining id into pool[cursor]), so the order is
+    # generated lazily and every track plays once per cycle.
+    #
+    # history is the back stack (its last entry is the current track) and
+    # forward holds what "previous" stepped back over, so next/prev retrace
+    # the same order. Optional callables bias the draws:
+    #   artist(id) -> key   avoid the same artist twice in a row
+    #   weight(id) -> 0..1  likelier to come up earlier in the cycle
+    def __init__(self, rng=None, artist=None, weight=None):
+        self.rng = rng or random.Random()
+        self.artist = artist
+        self.weight = weight
+        self.pool = array('q')
+        self.slots = {}
+        self.cursor = 0
+        # pool[cursor] was already picked by peek()
+        self.staged = False
+        self.history = array('q')
+        self.forward = array('q')
+
+    def __len__(self):
+        return len(self.pool)
+
+    def reset(self, track_ids):
+        # Start a new cycle over track_ids
+        self.pool = array('q', track_ids)
+        self.slots = {track_id: i for i, track_id in enumerate(self.pool)}
+        self.cursor = 0
+        self.staged = False
+        self.forward = array('q')
+
+    def set_items(self, track_ids):
+        # Switch to another set of ids (e.g. a filtered view), keeping the
+        # played/unplayed state of the ids in both
+        played = set(self.pool[:self.cursor])
+        kept = array('q', (track_id for track_id in track_ids if track_id in played))
+        self.cursor = len(kept)
+        kept.extend(track_id for track_id in track_ids if track_id not in played)
+        self.pool = kept
+        self.slots = {track_id: i for i, track_id in enumerate(kept)}
+        self.staged = False
+        self.forward = array('q', (track_id for track_id in self.forward if track_id in self.slots))
+
+    def add(self, track_id):
+        # New tracks join the unplayed remainder; draws are uniform over it
+        # so appending is enough
+        if track_id not in self.slots:
+            self.slots[track_id] = len(self.pool)
+            self.pool.append(track_id)
+
+    def remove(self, track_id):
+        slot = self.slots.pop(track_id, None)
+        if slot is None:
+            return
+        pool = self.pool
+        if slot <= self.cursor:
+            self.staged = False
+        if slot < self.cursor:
+            # Keep the played prefix contiguous: its last id fills the hole
+            # and the hole moves to the boundary
+            self.cursor -= 1
+            self.move(self.cursor, slot)
+            slot = self.cursor
+        last = len(pool) - 1
+        if slot != last:
+            self.move(last, slot)
+        pool.pop()
+
+    def move(self, source, target):
+        track_id = self.pool[source]
+        self.pool[target] = track_id
+        self.slots[track_id] = target
+
+    def swap(self, i, j):
+        pool = self.pool
+        pool[i], pool[j] = pool[j], pool[i]
+        self.slots[pool[i]] = i
+        self.slots[pool[j]] = j
+
+    def stage(self):
+        # One Fisher-Yates step: choose the id that plays next
+        pool = self.pool
+        if self.cursor >= len(pool):
+            self.cursor = 0  # Cycle finished, start the next one
+        start, end = self.cursor, len(pool)
+        last = self.history[-1] if self.history else None
+        last_artist = self.artist(last) if self.artist and last is not None else None
+
+        chosen = None
+        for _ in range(MAX_TRIES if (self.artist or self.weight) else 1):
+            j = self.rng.randrange(start, end)
+            track_id = pool[j]
+            if track_id == last and end - start > 1:
+                continue
+            if chosen is None:
+                chosen = j
+            if last_artist is not None and self.artist(track_id) == last_artist:
+                continue
+            if self.weight and self.rng.random() > self.weight(track_id):
+                continue
+            chosen = j
+            break
+        if chosen is None:
+            # Every try hit the current track; any other remaining id will do
+            chosen = start if pool[start] != last else start + 1
+        self.swap(start, chosen)
+        self.staged = True
+
+    def peek(self):
+        # The id that plays next (stable until played() or a change)
+        forward = self.forward
+        while forward and forward[-1] not in self.slots:
+            forward.pop()
+        if forward:
+            return forward[-1]
+        if not self.pool:
+            return None
+        if not self.staged:
+            self.stage()
+        return self.pool[self.cursor]
+
+    def previous(self):
+        # Steps back through the history; returns None at its start
+        history = self.history
+        if len(history) < 2:
+            return None
+        self.forward.append(history.pop())
+        # Skip tracks that were removed or aren't in the current set
+        while history and history[-1] not in self.slots:
+            history.pop()
+        return history[-1] if history else None
+
+    def played(self, track_id):
+        # Called for every track that starts playing, however it was chosen
+        history = self.history
+        if not history or history[-1] != track_id:
+            if self.forward and self.forward[-1] == track_id:
+                self.forward.pop()
+            else:
+                self.forward = array('q')
+            history.append(track_id)
+            if len(history) > 2 * HISTORY_LIMIT:
+                del history[:-HISTORY_LIMIT]
+
+        slot = self.slots.get(track_id)
+        if slot is not None and slot >= self.cursor:
+            self.swap(self.cursor, slot)
+            self.cursor += 1
+            self.staged = False
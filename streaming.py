@@ -0,0 +1,415 @@
+import io
+import mmap
+import os
+import threading
+import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNK_SIZE = 256 * 1024
+# Chunks fetched ahead of the read position
+READ_AHEAD = 8
+# Upper bound on buffered chunks per stream (memory = MAX_CHUNKS * CHUNK_SIZE)
+MAX_CHUNKS = 16
+
+# Local files at least this big are memory-mapped instead of read
+MMAP_MIN_SIZE = 64 * 1024 * 1024
+
+HTTP_TIMEOUT = 10
+MAX_REDIRECTS = 5
+
+read_ahead_pool = None
+
+
+def is_url(location):
+    return location.startswith(("http://", "https://"))
+
+
+def namehint(location):
+    # File extension pygame uses to pick a decoder for file objects
+    if is_url(location):
+        location = urllib.parse.urlsplit(location).path
+    return os.path.splitext(location)[1].lstrip(".").lower()
+
+
+def stream_info(url):
+    # Library entry for a remote track; tags and length are filled in later
+    # by the metadata workers
+    return {"path": url, "size": None, "mtime": None, "duration": None,
+            "title": None, "artist": None, "album": None}
+
+
+class FileSource:
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.lock = threading.Lock()
+
+    def read_at(self, offset, length):
+        if hasattr(os, "pread"):
+            return os.pread(self.file.fileno(), length, offset)
+        with self.lock:
+            self.file.seek(offset)
+            return self.file.read(length)
+
+    def close(self):
+        self.file.close()
+
+
+class MmapSource:
+    # Reads are slices of the mapping; the OS page cache does the buffering
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = len(self.map)
+
+    def read_at(self, offset, length):
+        return self.map[offset:offset + length]
+
+    def close(self):
+        self.map.close()
+
+
+class HttpSource:
+    # Fetches byte ranges over a kept-alive connection. Servers that ignore
+    # Range headers are read sequentially instead; seeking backwards then
+    # restarts the download.
+    def __init__(self, url, timeout=HTTP_TIMEOUT):
+        self.timeout = timeout
+        self.connection = None
+        self.lock = threading.Lock()
+        self.set_url(url)
+        self.ranges = True
+        self.response = None
+        self.offset = 0
+
+        # One-byte probe for the size and range support
+        with self.lock:
+            response = self.request({"Range": "bytes=0-0"})
+            if response.status == 206:
+                self.size = int(response.getheader("Content-Range").rsplit("/", 1)[1])
+                response.read()
+            else:
+                self.use_sequential(response)
+
+    def set_url(self, url):
+        parts = urllib.parse.urlsplit(url)
+        self.scheme = parts.scheme
+        self.host = parts.netloc
+        self.target = parts.path or "/"
+        if parts.query:
+            self.target += "?" + parts.query
+
+    def connect(self):
+        # http.client is only needed once a URL is played
+        import http.client
+        if self.connection is not None:
+            self.connection.close()
+        if self.scheme == "https":
+            self.connection = http.client.HTTPSConnection(self.host, timeout=self.timeout)
+        else:
+            self.connection = http.client.HTTPConnection(self.host, timeout=self.timeout)
+
+    def request(self, headers):
+        # Follows redirects and retries once on a dropped keep-alive
+        # connection; raises OSError on HTTP errors
+        import http.client
+        for _ in range(MAX_REDIRECTS + 1):
+            for attempt in (0, 1):
+                if self.connection is None or attempt:
+                    self.connect()
+                try:
+                    self.connection.request("GET", self.target, headers=headers)
+                    response = self.connection.getresponse()
+                    break
+                except (http.client.HTTPException, OSError) as e:
+                    if attempt:
+                        raise OSError(f"{self.host}: {e}") from e
+            if response.status in (301, 302, 303, 307, 308):
+                response.read()
+                self.set_url(urllib.parse.urljoin(f"{self.scheme}://{self.host}{self.target}",
+                                                  response.getheader("Location")))
+                self.connect()
+                continue
+            if response.status >= 400 and response.status != 416:
+                response.read()
+                raise OSError(f"HTTP {response.status} {response.reason}")
+            return response
+        raise OSError("Too many redirects")
+
+    def use_sequential(self, response):
+        self.ranges = False
+        length = response.getheader("Content-Length")
+        self.size = int(length) if length else None
+        self.response = response
+        self.offset = 0
+
+    def read_at(self, offset, length):
+        with self.lock:
+            if self.ranges:
+                response = self.request({"Range": f"bytes={offset}-{offset + length - 1}"})
+                if response.status == 416:
+                    response.read()
+                    return b""
+                if response.status == 206:
+                    return response.read()
+                # The server stopped honouring ranges
+                self.use_sequential(response)
+            return self.read_sequential(offset, length)
+
+    def read_sequential(self, offset, length):
+        if self.response is None or offset < self.offset:
+            self.response = self.request({})
+            self.offset = 0
+        while self.offset < offset:
+            skipped = self.response.read(min(offset - self.offset, CHUNK_SIZE))
+            if not skipped:
+                return b""
+            self.offset += len(skipped)
+        data = self.response.read(length)
+        self.offset += len(data)
+        return data
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+
+class SplicedSource:
+    # The first head_end bytes of a source followed by everything from
+    # start on; used to resume playback at a frame/page boundary
+    def __init__(self, source, head_end, start):
+        self.source = source
+        self.head_end = head_end
+        self.start = start
+        self.size = None if source.size is None else head_end + source.size - start
+
+    def read_at(self, offset, length):
+        if offset >= self.head_end:
+            return self.source.read_at(self.start + offset - self.head_end, length)
+        head = self.source.read_at(offset, min(length, self.head_end - offset))
+        if len(head) < length:
+            head += self.source.read_at(self.start, length - len(head))
+        return head
+
+    def close(self):
+        self.source.close()
+
+
+def open_source(location):
+    if is_url(location):
+        return HttpSource(location)
+    if os.path.getsize(location) >= MMAP_MIN_SIZE:
+        try:
+            return MmapSource(location)
+        except (OSError, ValueError):
+            pass
+    return FileSource(location)
+
+
+def open_stream(location, head_end=0, start=0):
+    # With start, the stream is spliced (see SplicedSource)
+    source = open_source(location)
+    if start:
+        source = SplicedSource(source, head_end, start)
+    return BufferedStream(source)
+
+
+def prepare_stream(location, head_end=0, start=0):
+    # open_stream() with the first chunk fetched and the read-ahead
+    # started, so a decoder reading the headers doesn't wait on the
+    # network. Blocks up to the request timeout: run it off the Tk thread.
+    stream = open_stream(location, head_end, start)
+    try:
+        stream.read(1)
+        stream.seek(0)
+    except BaseException:
+        stream.close()
+        raise
+    return stream
+
+
+class StreamOpener:
+    # Opens remote streams on a background thread. Only the latest open()
+    # counts: a superseded or cancelled stream is closed, and poll() (Tk
+    # thread) returns (tag, stream, error) for the latest one, once.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.result = None
+
+    def open(self, tag, location, head_end=0, start=0):
+        with self.lock:
+            self.generation += 1
+            self.discard()
+            generation = self.generation
+        threading.Thread(target=self.run, args=(generation, tag, location, head_end, start),
+                         daemon=True).start()
+
+    def cancel(self):
+        with self.lock:
+            self.generation += 1
+            self.discard()
+
+    def discard(self):
+        # Caller holds the lock
+        if self.result is not None and self.result[1] is not None:
+            self.result[1].close()
+        self.result = None
+
+    def run(self, generation, tag, location, head_end, start):
+        stream = error = None
+        try:
+            stream = prepare_stream(location, head_end, start)
+        except Exception as e:
+            error = e
+        with self.lock:
+            if generation == self.generation:
+                self.result = (tag, stream, error)
+                return
+        if stream is not None:
+            stream.close()
+
+    def poll(self):
+        with self.lock:
+            result, self.result = self.result, None
+        return result
+
+
+class BufferedStream(io.RawIOBase):
+    # Read-only, seekable file object over a source. Data is cached in
+    # fixed-size chunks (at most max_chunks, least recently used evicted)
+    # and each read schedules a background fetch of the next read_ahead
+    # chunks, so the decoder rarely waits on the disk or network. The
+    # fetch runs as a task on a shared pool rather than a thread per
+    # stream, so an abandoned stream is simply garbage collected.
+    def __init__(self, source, chunk_size=CHUNK_SIZE, read_ahead=READ_AHEAD,
+                 max_chunks=MAX_CHUNKS):
+        super().__init__()
+        self.source = source
+        self.size = source.size
+        self.chunk_size = chunk_size
+        self.read_ahead = read_ahead
+        self.max_chunks = max(max_chunks, read_ahead + 2)
+        self.chunks = OrderedDict()
+        self.loading = set()
+        self.condition = threading.Condition()
+        self.position = 0
+        self.prefetching = False
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            if self.size is None:
+                raise OSError("Stream size is unknown")
+            offset += self.size
+        self.position = max(0, offset)
+        return self.position
+
+    def readinto(self, buffer):
+        # Fills the whole buffer unless the stream ends; decoders reading
+        # through pygame treat a short read as end of file
+        if self.closed:
+            raise ValueError("I/O operation on closed stream")
+        buffer = memoryview(buffer).cast("B")
+        filled = 0
+        while filled < len(buffer):
+            if self.size is not None and self.position >= self.size:
+                break
+            index, start = divmod(self.position, self.chunk_size)
+            data = self.chunk(index)
+            count = min(len(buffer) - filled, len(data) - start)
+            if count <= 0:
+                break
+            buffer[filled:filled + count] = memoryview(data)[start:start + count]
+            filled += count
+            self.position += count
+        self.schedule_read_ahead()
+        return filled
+
+    def chunk(self, index):
+        with self.condition:
+            while True:
+                data = self.chunks.get(index)
+                if data is not None:
+                    self.chunks.move_to_end(index)
+                    return data
+                if index not in self.loading:
+                    self.loading.add(index)
+                    break
+                # The read-ahead task is already fetching it
+                self.condition.wait()
+        return self.fetch(index)
+
+    def fetch(self, index):
+        # Caller has put index in loading
+        try:
+            data = self.source.read_at(index * self.chunk_size, self.chunk_size)
+        except BaseException:
+            with self.condition:
+                self.loading.discard(index)
+                self.condition.notify_all()
+            raise
+        with self.condition:
+            self.loading.discard(index)
+            self.chunks[index] = data
+            while len(self.chunks) > self.max_chunks:
+                self.chunks.popitem(last=False)
+            self.condition.notify_all()
+        return data
+
+    def missing_chunk(self):
+        # Next chunk in the read-ahead window that isn't buffered or loading
+        first = self.position // self.chunk_size
+        last = first + self.read_ahead
+        if self.size is not None:
+            last = min(last, (self.size - 1) // self.chunk_size)
+        for index in range(first, last + 1):
+            if index not in self.chunks and index not in self.loading:
+                return index
+        return None
+
+    def schedule_read_ahead(self):
+        global read_ahead_pool
+        with self.condition:
+            if self.prefetching or self.closed or self.missing_chunk() is None:
+                return
+            self.prefetching = True
+        if read_ahead_pool is None:
+            read_ahead_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="read-ahead")
+        read_ahead_pool.submit(self.fill_read_ahead)
+
+    def fill_read_ahead(self):
+        try:
+            while not self.closed:
+                with self.condition:
+                    index = self.missing_chunk()
+                    if index is None:
+                        return
+                    self.loading.add(index)
+                if not self.fetch(index):
+                    return  # End of stream
+        except Exception:
+            pass  # The reader hits the same error and reports it
+        finally:
+            self.prefetching = False
+
+    def close(self):
+        if not self.closed:
+            super().close()
+            self.source.close()
+            with self.condition:
+                self.chunks.clear()
+                self.condition.notify_all()
@@ -0,0 +1,60 @@
+import http.server
+import io
+import os
+import re
+import sys
+import threading
+
+import pytest
+
+# The modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class RangeHandler(http.server.SimpleHTTPRequestHandler):
+    # Serves Range requests with 206/416, like most real servers; keep-alive
+    # too
+    protocol_version = "HTTP/1.1"
+
+    def send_head(self):
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        path = self.translate_path(self.path)
+        if not match or not os.path.isfile(path):
+            return super().send_head()
+        size = os.path.getsize(path)
+        start = int(match.group(1))
+        end = min(int(match.group(2) or size - 1), size - 1)
+        if start >= size:
+            self.send_error(416)
+            return None
+        with open(path, "rb") as f:
+            f.seek(start)
+            data = f.read(end - start + 1)
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        return io.BytesIO(data)
+
+
+@pytest.fixture
+def http_server():
+    # start(directory, ranges=True) serves directory on a free local port
+    # and returns its base URL; with ranges False Range headers are
+    # ignored, like servers that only stream
+    servers = []
+
+    def start(directory, ranges=True):
+        handler_class = RangeHandler if ranges else http.server.SimpleHTTPRequestHandler
+        server = http.server.ThreadingHTTPServer(
+            ("127.0.0.1", 0), lambda *args: handler_class(*args, directory=str(directory)))
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,60 @@
+import os
+
+import importer
+from importer import FolderImporter
+
+
+def make_tree(root):
+    paths = []
+    for folder in ("a", "a/b", "c"):
+        os.makedirs(root / folder, exist_ok=True)
+        for name in ("1.mp3", "2.ogg", "3.wav", "cover.jpg"):
+            path = root / folder / name
+            path.write_bytes(b"")
+            if not name.endswith(".jpg"):
+                paths.append(str(path))
+    return sorted(paths)
+
+
+def run(folder_importer):
+    folder_importer.run()
+    return [info for batch in folder_importer.poll() for info in batch]
+
+
+def test_import_finds_every_audio_file(tmp_path):
+    paths = make_tree(tmp_path)
+    folder_importer = FolderImporter([str(tmp_path)], batch_size=4)
+    infos = run(folder_importer)
+    assert folder_importer.finished
+    assert sorted(info["path"] for info in infos) == paths
+    assert folder_importer.found == folder_importer.probed == len(paths)
+
+
+def test_failed_probes_are_skipped_and_counted(tmp_path, monkeypatch):
+    paths = make_tree(tmp_path)
+
+    def probe(path, stat=None):
+        if path.endswith(".ogg"):
+            raise ValueError("bad header")
+        if path.endswith(".wav"):
+            raise OSError("gone")
+        return {"path": path}
+
+    monkeypatch.setattr(importer, "probe_track", probe)
+    folder_importer = FolderImporter([str(tmp_path)], batch_size=4)
+    infos = run(folder_importer)
+    assert sorted(info["path"] for info in infos) == [p for p in paths if p.endswith(".mp3")]
+    assert folder_importer.probed == folder_importer.found == len(paths)
+
+
+def test_rescan_only_probes_changed_files(tmp_path):
+    paths = make_tree(tmp_path)
+    known = {path: (0, os.stat(path).st_mtime) for path in paths}
+    changed = paths[0]
+    with open(changed, "wb") as f:
+        f.write(b"new")
+    known[str(tmp_path / "removed.mp3")] = (0, 0.0)
+    folder_importer = FolderImporter([str(tmp_path)], known=known)
+    infos = run(folder_importer)
+    assert [info["path"] for info in infos] == [changed]
+    assert folder_importer.deleted == [str(tmp_path / "removed.mp3")]
@@ -0,0 +1,96 @@
+import csv
+import json
+import time
+
+from instrumentation import Histogram, Metrics, StallDetector, StartupProfile
+
+
+class FakeRoot:
+    # Stands in for Tk: after() callbacks run when the test calls them
+    def __init__(self):
+        self.callbacks = {}
+
+    def after(self, ms, callback):
+        after_id = len(self.callbacks)
+        self.callbacks[after_id] = callback
+        return after_id
+
+    def after_cancel(self, after_id):
+        del self.callbacks[after_id]
+
+
+def test_histogram_percentiles():
+    histogram = Histogram()
+    for _ in range(90):
+        histogram.add(0.001)
+    for _ in range(10):
+        histogram.add(0.1)
+    summary = histogram.summary()
+    assert summary["count"] == 100 and summary["max_ms"] == 100
+    # Within the factor of two the buckets allow
+    assert 1 <= summary["p50_ms"] <= 2
+    assert 100 <= summary["p99_ms"] <= 200 and summary["p99_ms"] <= summary["max_ms"]
+    assert abs(summary["mean_ms"] - 10.9) < 1e-9
+
+
+def test_timers_and_counters():
+    metrics = Metrics()
+
+    @metrics.timed("work")
+    def work(value):
+        return value * 2
+
+    assert work(2) == 4
+    with metrics.measure("block"):
+        pass
+    metrics.count("hits")
+    metrics.count("hits", 2)
+    metrics.gauge("broken", lambda: 1 / 0)
+    snapshot = metrics.snapshot()
+    assert snapshot["timings"]["work"]["count"] == 1 and snapshot["timings"]["block"]["count"] == 1
+    assert snapshot["counters"] == {"hits": 3} and snapshot["gauges"] == {"broken": None}
+
+    metrics.enabled = False
+    work(1)
+    metrics.count("hits")
+    assert metrics.histograms["work"].count == 1 and metrics.counters["hits"] == 3
+    metrics.reset()
+    assert metrics.snapshot()["timings"] == {} and metrics.counters == {}
+
+
+def test_dump_json_and_csv(tmp_path):
+    metrics = Metrics()
+    metrics.record("load", 0.01)
+    metrics.count("errors")
+    metrics.gauge("size", lambda: 7)
+    metrics.dump(str(tmp_path / "metrics.json"))
+    metrics.dump(str(tmp_path / "metrics.csv"))
+    with open(tmp_path / "metrics.json", encoding="utf-8") as f:
+        assert json.load(f)["counters"] == {"errors": 1}
+    with open(tmp_path / "metrics.csv", encoding="utf-8", newline="") as f:
+        rows = {row["name"]: row for row in csv.DictReader(f)}
+    assert rows["load"]["kind"] == "timing" and rows["load"]["count"] == "1"
+    assert rows["errors"]["value"] == "1" and rows["size"]["value"] == "7"
+
+
+def test_stalls_are_counted():
+    metrics = Metrics()
+    root = FakeRoot()
+    detector = StallDetector(root, metrics, interval_ms=10, stall_ms=50)
+    detector.start()
+    time.sleep(0.1)
+    root.callbacks[detector.after_id]()
+    root.callbacks[detector.after_id]()  # On time
+    assert metrics.counters["tk.stalls"] == 1 and metrics.histograms["tk.heartbeat_lag"].count == 2
+    detector.stop()
+    assert detector.after_id is None and len(root.callbacks) == 2
+
+
+def test_startup_profile():
+    metrics = Metrics()
+    profile = StartupProfile(time.perf_counter() - 0.5, metrics)
+    profile.mark("window")
+    profile.mark("library")
+    report = profile.report().splitlines()
+    assert [line.split()[0] for line in report] == ["window", "library"]
+    assert metrics.histograms["startup.window"].max >= 0.5
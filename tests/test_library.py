@@ -0,0 +1,79 @@
+from array import array
+
+from library_store import LibraryStore
+from player_core import PlayerCore
+from track_registry import TrackRegistry
+
+
+def track_info(path, **fields):
+    info = {"path": path, "size": 1, "mtime": 1.0, "duration": 180.0,
+            "title": None, "artist": None, "album": None}
+    info.update(fields)
+    return info
+
+
+def test_added_tracks_follow_the_stored_order(tmp_path):
+    path = str(tmp_path / "library.db")
+    library = LibraryStore(path)
+    core = PlayerCore(library)
+    core.add_tracks([track_info(f"/music/{i}.mp3") for i in range(5)])
+    first = list(core.registry.order)
+    library.save_playlist(first[::-1])
+    core.add_tracks([track_info(f"/music/new{i}.mp3") for i in range(3)])
+    added = [core.registry.id_for(f"/music/new{i}.mp3") for i in range(3)]
+    library.close()
+
+    core = PlayerCore(LibraryStore(path))
+    core.restore()
+    assert list(core.registry.order) == first[::-1] + added
+
+
+def test_restore_loads_in_steps(tmp_path):
+    library = LibraryStore(str(tmp_path / "library.db"))
+    ids = library.upsert_tracks([track_info(f"/music/{i}.mp3") for i in range(25)])
+    stored = array('q', sorted(ids.values(), reverse=True)[:10])
+    library.save_playlist(stored)
+
+    core = PlayerCore(library)
+    steps = core.restore_steps(chunk=10)
+    next(steps)
+    assert len(core.registry.tracks) == 10  # One chunk of rows per step
+    # A track added mid-restore keeps its record and goes after the rest
+    core.add_tracks([track_info("/music/new.mp3", title="New")])
+    assert core.stopped  # Not taken for the first track of an empty library
+    for _ in steps:
+        pass
+    order = list(core.registry.order)
+    new_id = core.registry.id_for("/music/new.mp3")
+    assert order[:10] == list(stored)
+    assert order[10:] == sorted(set(ids.values()) - set(stored)) + [new_id]
+    assert core.registry.get(new_id).title == "New"
+    assert all(core.registry.position(track_id) == i for i, track_id in enumerate(order))
+    assert core.search("new", 10)[0].tolist() == [new_id]
+
+
+def test_registry_round_trip(tmp_path):
+    library = LibraryStore(str(tmp_path / "library.db"))
+    infos = [track_info(f"/music/{i}.mp3", title=f"Song {i}") for i in range(6)]
+    ids = library.upsert_tracks(infos)
+    registry = TrackRegistry()
+    for info in infos:
+        assert registry.add(ids[info["path"]], info)
+    renamed = track_info("/music/0.mp3", title="Renamed")
+    library.upsert_tracks([renamed])
+    assert not registry.add(ids["/music/0.mp3"], renamed)
+    removed = [ids["/music/1.mp3"], ids["/music/4.mp3"]]
+    registry.remove(removed)
+    library.delete_tracks(removed)
+    library.set_liked(ids["/music/2.mp3"], True)
+    library.save_playlist(list(registry.order)[::-1])
+
+    loaded = TrackRegistry()
+    for rows in library.load_tracks(2):
+        loaded.load_rows(rows)
+    loaded.load_order(library.load_playlist())
+    assert list(loaded.order) == list(registry.order)[::-1]
+    assert all(loaded.position(track_id) == i for i, track_id in enumerate(loaded.order))
+    assert loaded.id_for("/music/1.mp3") is None and ids["/music/4.mp3"] not in loaded
+    assert loaded.get(ids["/music/0.mp3"]).title == "Renamed"
+    assert list(loaded.liked_ids()) == [ids["/music/2.mp3"]]
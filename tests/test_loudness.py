@@ -0,0 +1,67 @@
+import os
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import loudness
+from library_store import LibraryStore
+from loudness import LoudnessAnalyzer, analyze_track
+
+
+def write_tone(path, amplitude, seconds=3.0, rate=48000):
+    t = np.arange(int(seconds * rate)) / rate
+    samples = (np.sin(2 * np.pi * 1000 * t) * amplitude * 32767).astype("<i2")
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(samples.tobytes())
+
+
+def test_quieter_tracks_get_more_gain(tmp_path):
+    write_tone(tmp_path / "loud.wav", 0.8)
+    write_tone(tmp_path / "quiet.wav", 0.08)
+    loud_gain, loud_peak = analyze_track(str(tmp_path / "loud.wav"))
+    quiet_gain, quiet_peak = analyze_track(str(tmp_path / "quiet.wav"))
+    # A tenth of the amplitude is 20 dB quieter
+    assert abs((quiet_gain - loud_gain) - 20) < 0.1
+    assert abs(loud_peak - 0.8) < 0.01 and abs(quiet_peak - 0.08) < 0.01
+
+
+def analyze(tmp_path, names):
+    store = LibraryStore(str(tmp_path / "library.db"))
+    ids = store.upsert_tracks([{"path": str(tmp_path / name), "size": 1, "mtime": 1.0, "duration": None,
+                          "title": None, "artist": None, "album": None} for name in names])
+    analyzer = LoudnessAnalyzer(store.path, workers=1)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        analyzer.analyze_pending(store, pool)
+    return store, ids, analyzer.poll()
+
+
+def test_results_are_stored(tmp_path):
+    write_tone(tmp_path / "a.wav", 0.5)
+    (tmp_path / "broken.wav").write_bytes(b"not audio")
+    store, ids, results = analyze(tmp_path, ["a.wav", "broken.wav"])
+    assert len(results) == 2
+    assert not store.unanalyzed_tracks()
+    gains = {track_id: gain for track_id, gain, _ in results}
+    assert gains[ids[str(tmp_path / "broken.wav")]] == 0.0  # Neutral, so not retried
+    assert gains[ids[str(tmp_path / "a.wav")]] < 0
+
+
+def test_file_rewritten_during_analysis_is_not_stored(tmp_path, monkeypatch):
+    write_tone(tmp_path / "a.wav", 0.5)
+    write_tone(tmp_path / "b.wav", 0.5)
+
+    def rewriting(path):
+        result = analyze_track(path)
+        if path.endswith("b.wav"):
+            write_tone(path, 0.1, seconds=4.0)
+            os.utime(path, (1, 1))
+        return result
+
+    monkeypatch.setattr(loudness, "analyze_track", rewriting)
+    store, _, results = analyze(tmp_path, ["a.wav", "b.wav"])
+    assert len(results) == 1
+    assert [path for _, path in store.unanalyzed_tracks()] == [str(tmp_path / "b.wav")]
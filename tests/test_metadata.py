@@ -0,0 +1,29 @@
+import time
+
+import metadata
+from metadata import MetadataService
+
+
+def test_failed_read_finishes_the_request(monkeypatch):
+    calls = []
+
+    def read_metadata(path, with_art=False):
+        calls.append(path)
+        if len(calls) == 1:
+            raise ValueError("not a tag mutagen understands")
+        return {"path": path, "duration": 1.5}
+
+    monkeypatch.setattr(metadata, "read_metadata", read_metadata)
+    service = MetadataService(workers=1)
+    delivered = []
+    for _ in range(2):
+        service.request("/music/a.mp3", 1.0, delivered.append)
+        deadline = time.monotonic() + 5
+        while service.results.empty():
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        service.deliver()
+    # The failure left nothing pending, so the second request read again
+    assert len(calls) == 2
+    assert [info["duration"] for info in delivered] == [1.5]
+    service.shutdown()
@@ -0,0 +1,149 @@
+import time
+
+import pytest
+
+from audio_backend import NullAudioBackend
+from gapless import TrackPreloader
+from library_store import LibraryStore
+from player_core import PlayerCore
+from track_registry import Track
+
+
+def make_core(count=4, gapless=False):
+    core = PlayerCore(LibraryStore(":memory:"), NullAudioBackend())
+    core.set_gapless(gapless)
+    core.add_tracks([{"path": f"/music/{i}.mp3", "size": 1, "mtime": 1.0, "duration": 60.0,
+                      "title": f"Song {i}", "artist": None, "album": None} for i in range(count)])
+    return core, list(core.registry.order)
+
+
+def wait_for(condition, poll=None):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+        if poll:
+            poll()
+
+
+def current(core):
+    return core.registry.order.index(core.current_track.id)
+
+
+def test_first_import_starts_playing():
+    core, ids = make_core()
+    assert core.current_track.id == ids[0]
+    assert not core.stopped and core.audio.path == "/music/0.mp3"
+
+
+def test_track_end_advances_and_wraps():
+    core, ids = make_core(3)
+    for expected in (1, 2, 0):
+        core.audio.finish()
+        core.poll()
+        assert current(core) == expected
+        assert core.audio.path == f"/music/{expected}.mp3"
+
+
+def test_repeat_replays_the_track():
+    core, ids = make_core(3)
+    core.toggle_repeat()
+    core.audio.finish()
+    core.poll()
+    assert current(core) == 0 and not core.stopped
+
+
+@pytest.mark.parametrize("start, step, expected", [(0, -1, 3), (3, 1, 0), (1, 1, 2), (1, -1, 0)])
+def test_next_and_previous_at_both_ends(start, step, expected):
+    core, ids = make_core()
+    core.play_index(start)
+    core.step_track(step)
+    assert current(core) == expected
+
+
+def test_pause_and_stop():
+    core, ids = make_core()
+    core.toggle_play_pause()
+    assert core.paused
+    core.toggle_play_pause()
+    assert not core.paused
+    core.stop()
+    assert core.stopped and core.audio.started is None
+    core.toggle_play_pause()  # Plays the current track again
+    assert not core.stopped and current(core) == 0
+
+
+def test_gapless_queue_handoff():
+    core, ids = make_core(3, gapless=True)
+    wait_for(lambda: core.queued_track is not None, core.poll)
+    assert core.queued_track.id == ids[1] and core.audio.queued == "/music/1.mp3"
+    core.audio.finish()
+    core.poll()
+    # The mixer had already switched; the core follows and queues the next
+    assert current(core) == 1 and core.audio.path == "/music/1.mp3"
+    wait_for(lambda: core.queued_track is not None, core.poll)
+    assert core.queued_track.id == ids[2]
+
+
+def test_gapless_requeues_after_a_change():
+    core, ids = make_core(3, gapless=True)
+    wait_for(lambda: core.queued_track is not None, core.poll)
+    core.toggle_repeat()
+    assert core.queued_track.id == ids[1]  # Until the new preload is in
+    wait_for(lambda: core.queued_track.id == ids[0], core.poll)
+    core.audio.finish()
+    core.poll()
+    assert current(core) == 0
+
+
+def test_removing_the_current_track_during_playback():
+    core, ids = make_core(4)
+    core.play_index(1)
+    core.remove_paths(["/music/1.mp3"])
+    assert ids[1] not in core.registry
+    # The file keeps playing; the track after it comes next
+    assert core.current_track.id == ids[1] and not core.stopped
+    core.audio.finish()
+    core.poll()
+    assert core.current_track.id == ids[2]
+    core.prev_track()
+    assert core.current_track.id == ids[0]
+
+
+def test_removing_the_current_track_in_a_filtered_view():
+    core, ids = make_core(4)
+    for track_id in ids[1:3]:
+        core.registry.tracks[track_id].liked = True
+    core.show_liked()
+    core.play_index(0)
+    core.remove_paths(["/music/1.mp3"])
+    assert list(core.current_view()) == [ids[2]]
+    core.next_track()
+    assert core.current_track.id == ids[2]
+
+
+def test_preloader_hands_over_only_the_latest_track(tmp_path):
+    first, second = (tmp_path / "a.mp3", tmp_path / "b.mp3")
+    for path in (first, second):
+        path.write_bytes(b"\0" * 100)
+    preloader = TrackPreloader()
+    preloader.preload(Track(1, str(first), duration=10.0))
+    preloader.preload(Track(2, str(second), duration=20.0))
+    results = []
+    wait_for(lambda: results.append(preloader.take()) or results[-1] is not None)
+    track, duration, stream = results[-1]
+    assert (track.id, duration, stream) == (2, 20.0, None)
+    assert preloader.take() is None
+    preloader.preload(Track(3, str(first), duration=10.0))
+    preloader.cancel()
+    time.sleep(0.05)
+    assert preloader.take() is None
+
+
+def test_shutdown_stops_background_work():
+    core, ids = make_core()
+    core.watch_folder("/music")
+    core.shutdown()
+    assert core.watcher.stopped.is_set()
+    with pytest.raises(RuntimeError):
+        core.seek_indexes.pool.submit(print)
@@ -0,0 +1,172 @@
+import os
+import random
+import time
+
+from library_store import LibraryStore
+from player_core import PlayerCore
+from playlists import (PlaylistImporter, PlaylistManager, export_playlist, file_location,
+                       read_playlist_entries)
+from track_registry import Track
+
+
+def test_export_writes_utf8_without_bom(tmp_path):
+    tracks = [Track(1, "/music/Beyoncé/Halo.mp3", duration=261.4, title="Halo", artist="Beyoncé")]
+    for name in ("list.m3u", "list.m3u8", "list.pls"):
+        path = str(tmp_path / name)
+        export_playlist(path, tracks)
+        data = open(path, "rb").read()
+        assert not data.startswith(b"\xef\xbb\xbf")
+        assert "Beyoncé".encode("utf-8") in data
+        assert list(read_playlist_entries(path)) == ["/music/Beyoncé/Halo.mp3"]
+
+
+def test_import_reports_bytes_read(tmp_path):
+    path = tmp_path / "list.m3u"
+    path.write_text("#EXTM3U\n" + "".join(f"missing{i}.mp3\n" for i in range(20)))
+    importer = PlaylistImporter(str(path), {})
+    importer.run()
+    assert importer.size == importer.done == path.stat().st_size
+    assert importer.read == importer.missing == 20
+
+
+def test_file_location(tmp_path):
+    base = str(tmp_path)
+    assert file_location("http://host/a.mp3", base) == "http://host/a.mp3"
+    assert file_location("file:///music/a%20b.mp3", base) == os.path.normpath("/music/a b.mp3")
+    assert file_location("sub/a.mp3", base) == os.path.join(base, "sub", "a.mp3")
+
+
+def reloaded(library, playlist):
+    manager = PlaylistManager(library)
+    manager.restore()
+    return list(manager.load(manager.playlists[playlist.id], lambda track_id: True).ids())
+
+
+def test_chunked_playlist_round_trip(monkeypatch):
+    monkeypatch.setattr("playlists.CHUNK_SIZE", 4)
+    rng = random.Random(13)
+    library = LibraryStore(":memory:")
+    manager = PlaylistManager(library)
+    playlist = manager.create("Mix")
+    expected = []
+    for step in range(400):
+        action = rng.random()
+        if action < 0.3 or not expected:
+            ids = [rng.randrange(1000) for _ in range(rng.randint(1, 9))]
+            playlist.append(ids)
+            expected.extend(ids)
+        elif action < 0.5:
+            position = rng.randrange(len(expected) + 1)
+            playlist.insert(position, step)
+            expected.insert(position, step)
+        elif action < 0.7:
+            position = rng.randrange(len(expected))
+            assert playlist.pop(position) == expected.pop(position)
+        elif action < 0.9:
+            old, new = rng.randrange(len(expected)), rng.randrange(len(expected))
+            playlist.move(old, new)
+            expected.insert(new, expected.pop(old))
+        else:
+            gone = set(rng.sample(expected, min(3, len(expected))))
+            playlist.remove_tracks(gone)
+            expected = [track_id for track_id in expected if track_id not in gone]
+        assert list(playlist.ids()) == expected
+        assert all(0 < len(ids) <= 8 for _, ids in playlist.chunks)
+        if step % 7 == 0:
+            manager.save(playlist)
+            assert reloaded(library, playlist) == expected
+    manager.save(playlist)
+    assert reloaded(library, playlist) == expected
+
+
+def test_reorder_rewrites_only_the_touched_chunks(monkeypatch):
+    monkeypatch.setattr("playlists.CHUNK_SIZE", 4)
+    library = LibraryStore(":memory:")
+    manager = PlaylistManager(library)
+    playlist = manager.create("Long")
+    playlist.append(range(40))
+    manager.save(playlist)
+    playlist.move(1, 2)
+    dirty, deleted, order_changed = playlist.take_changes()
+    assert len(dirty) == 1 and not deleted and not order_changed
+    playlist.move(0, 30)
+    playlist.pop(5)
+    dirty, deleted, order_changed = playlist.take_changes()
+    assert len(dirty) == 3 and not deleted and not order_changed
+    # Emptying a chunk drops its row
+    for _ in range(len(playlist.chunks[-1][1])):
+        playlist.pop(len(playlist) - 1)
+    dirty, deleted, order_changed = playlist.take_changes()
+    assert len(deleted) == 1 and order_changed
+
+
+def test_load_drops_tracks_no_longer_in_the_library():
+    library = LibraryStore(":memory:")
+    manager = PlaylistManager(library)
+    playlist = manager.create("Old")
+    playlist.append([1, 2, 3, 4])
+    manager.save(playlist)
+    manager = PlaylistManager(library)
+    manager.restore()
+    loaded = manager.load(manager.playlists[playlist.id], lambda track_id: track_id % 2)
+    assert list(loaded.ids()) == [1, 3]
+    assert reloaded(library, playlist) == [1, 3]
+
+
+def core_with_playlist(paths, entries):
+    core = PlayerCore(LibraryStore(":memory:"))
+    core.add_tracks([{"path": path, "size": 1, "mtime": 1.0, "duration": 60.0,
+                      "title": None, "artist": None, "album": None} for path in paths])
+    ids = [core.registry.id_for(path) for path in paths]
+    playlist = core.playlists.create("Twice")
+    core.add_to_playlist(playlist, [ids[i] for i in entries])
+    core.open_playlist(playlist)
+    return core, playlist, ids
+
+
+def test_repeated_track_follows_the_played_entry():
+    core, playlist, (a, b, c) = core_with_playlist(["/a.mp3", "/b.mp3", "/c.mp3"], [0, 1, 0, 2])
+    core.set_gapless(False)
+    core.play_index(2)
+    assert core.current_view_row() == 2
+    core.next_track()
+    assert core.current_track.id == c
+    core.prev_track()
+    assert (core.current_track.id, core.current_view_row()) == (a, 2)
+
+    # Moving and removing act on the entry that is playing
+    core.move_in_playlist(playlist, core.current_view_row(), 3)
+    assert list(playlist.ids()) == [a, b, c, a] and core.current_view_row() == 3
+    core.move_in_playlist(playlist, 0, 1)
+    assert list(playlist.ids()) == [b, a, c, a] and core.current_view_row() == 3
+    core.remove_from_playlist(playlist, core.current_view_row())
+    assert list(playlist.ids()) == [b, a, c]
+    assert core.current_track.id == a and core.current_view_row() is None
+    # Next plays the entry after the removed one, wrapping to the start
+    core.next_track()
+    assert (core.current_track.id, core.current_view_row()) == (b, 0)
+
+
+def test_removed_entry_is_followed_by_the_next_one():
+    core, playlist, (a, b, c) = core_with_playlist(["/a.mp3", "/b.mp3", "/c.mp3"], [0, 1, 0, 2])
+    core.set_gapless(False)
+    core.play_index(0)
+    core.remove_from_playlist(playlist, 0)
+    core.next_track()
+    assert (core.current_track.id, core.current_view_row()) == (b, 0)
+    core.remove_from_playlist(playlist, 0)
+    core.prev_track()
+    assert (core.current_track.id, core.current_view_row()) == (c, 1)
+
+
+def test_gapless_queue_keeps_the_row():
+    core, playlist, (a, b, c) = core_with_playlist(["/a.mp3", "/b.mp3", "/c.mp3"], [0, 1, 0, 2])
+    core.play_index(1)
+    deadline = time.monotonic() + 5
+    while core.queued_track is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+        core.poll()
+    assert core.queued_track.id == a
+    core.audio.finish()
+    core.poll()
+    assert (core.current_track.id, core.current_view_row()) == (a, 2)
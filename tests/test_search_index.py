@@ -0,0 +1,68 @@
+import random
+
+from search_index import SearchIndex, normalize
+
+SYLLABLES = ["ka", "lo", "mi", "ra", "su", "te", "no", "ve", "é", "b"]
+
+
+def random_text(rng):
+    return " ".join("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4)))
+                    for _ in range(rng.randint(1, 4)))
+
+
+def brute_force(texts, query):
+    # Every token must occur in the text, one-letter tokens at a word
+    # start; matches where every token starts a word come first
+    tokens = normalize(query).split()
+    matches, strong = [], []
+    for key, text in texts.items():
+        padded = " " + text
+        if not all(token in text if len(token) > 1 else " " + token in padded for token in tokens):
+            continue
+        if all(" " + token in padded for token in tokens):
+            strong.append(key)
+        else:
+            matches.append(key)
+    return sorted(strong, key=texts.get) + sorted(matches, key=texts.get)
+
+
+def test_search_matches_brute_force():
+    rng = random.Random(4)
+    index = SearchIndex()
+    texts = {}
+    for step in range(300):
+        key = rng.randrange(120)
+        if key in texts and rng.random() < 0.3:
+            index.remove(key)
+            del texts[key]
+        else:
+            fields = random_text(rng), random_text(rng)
+            index.add(key, *fields)
+            texts[key] = " ".join(normalize(field) for field in fields)
+        # Type a query a letter at a time, as the search box does
+        query = random_text(rng)[:rng.randint(1, 8)]
+        for end in range(1, len(query) + 1):
+            expected = brute_force(texts, query[:end])
+            top, total = index.search(query[:end], limit=1000)
+            assert not index.approximate
+            assert total == len(expected)
+            assert [texts[key] for key in top] == [texts[key] for key in expected]
+
+
+def test_limit_keeps_strong_matches_first():
+    index = SearchIndex()
+    for key in range(50):
+        index.add(key, f"song {key}", "takalo" if key % 2 else "kalo")
+    top, total = index.search("kalo", limit=10)
+    assert total == 50
+    assert len(top) == 10 and all(key % 2 == 0 for key in top)
+
+
+def test_approximate_total_above_limit(monkeypatch):
+    monkeypatch.setattr("search_index.EXACT_COUNT_LIMIT", 10)
+    index = SearchIndex()
+    for key in range(40):
+        index.add(key, f"lora {key}" if key % 4 else f"milora {key}")
+    top, total = index.search("lora", limit=5)
+    assert index.approximate and total >= 40
+    assert len(top) == 5 and all(key % 4 for key in top)
@@ -0,0 +1,157 @@
+import random
+import struct
+import time
+
+from library_store import LibraryStore
+from player_core import PlayerCore
+from seek_index import SeekIndex, mpeg_frame, scan_mp3, scan_ogg
+from streaming import FileSource
+
+
+def ogg_page(granule, packet, serial=1, sequence=0):
+    # One page holding one packet (no CRC: the scanner doesn't check it)
+    lacing = bytes([255] * (len(packet) // 255) + [len(packet) % 255])
+    header = b"OggS" + struct.pack("<BBqIIIB", 0, 0, granule, serial, sequence, 0, len(lacing))
+    return header + lacing + packet
+
+
+def write_ogg(path, head, granules):
+    pages = [ogg_page(0, head), ogg_page(0, b"OpusTags" if head.startswith(b"Opus") else
+                                         b"\x03vorbis")]
+    pages += [ogg_page(granule, bytes(300)) for granule in granules]
+    path.write_bytes(b"".join(pages))
+    offsets = []
+    offset = 0
+    for page in pages:
+        offsets.append(offset)
+        offset += len(page)
+    return offsets
+
+
+def scan(path, scanner=scan_ogg, **kwargs):
+    source = FileSource(str(path))
+    try:
+        return scanner(source, **kwargs)
+    finally:
+        source.close()
+
+
+# MPEG-1 layer III, 44.1 kHz, no CRC: 128 and 64 kbit/s frame headers
+MP3_HEADERS = (b"\xff\xfb\x90\x00", b"\xff\xfb\x50\x00")
+
+
+def mp3_frame(header, body=b""):
+    length = mpeg_frame(header)[0]
+    return header + body + bytes(length - 4 - len(body))
+
+
+def write_mp3(path, count, xing=None, seed=0):
+    # ID3v2 tag, an optional Xing frame, count audio frames of mixed
+    # bitrates and an ID3v1 tag; returns the audio frame offsets
+    rng = random.Random(seed)
+    data = b"ID3\x04\x00\x00\x00\x00\x00\x20" + bytes(32)
+    if xing:
+        data += mp3_frame(MP3_HEADERS[0], bytes(32) + xing)
+    offsets = []
+    for _ in range(count):
+        offsets.append(len(data))
+        data += mp3_frame(rng.choice(MP3_HEADERS))
+    path.write_bytes(data + b"TAG" + bytes(125))
+    return offsets
+
+
+def test_mp3_points_are_the_last_frame_before_each_step(tmp_path):
+    path = tmp_path / "a.mp3"
+    offsets = write_mp3(path, 400)
+    index = scan(path, scan_mp3)
+    frame_time = 1152 / 44100
+    assert (len(index) - 1) * index.spacing >= 399 * frame_time
+    for i in range(len(index)):
+        # Brute force: the last frame starting at or before the point
+        frame = max(k for k in range(400) if k * frame_time <= i * index.spacing + 1e-9)
+        assert index.offsets[i] == offsets[frame]
+        assert abs(index.times[i] - frame * frame_time) < 1e-9
+    for seconds in (0.0, 0.05, 1.0, 5.5):
+        time, offset = index.locate(seconds)
+        assert time <= seconds + 1e-9 < time + index.spacing + frame_time
+
+
+def test_mp3_xing_toc_index(tmp_path):
+    path = tmp_path / "a.mp3"
+    toc = bytes(range(0, 250, 2)[:100])
+    xing = b"Xing" + struct.pack(">III", 7, 300, 0) + toc
+    offsets = write_mp3(path, 300, xing)
+    size = path.stat().st_size
+    duration = 300 * 1152 / 44100
+
+    # The full scan skips the Xing frame, which carries no audio
+    full = scan(path, scan_mp3)
+    assert full.locate(0.0) == (0.0, offsets[0])
+
+    index = scan(path, scan_mp3, full_scan=False)
+    assert len(index) == 100
+    for percent in (0, 1, 37, 99):
+        time, offset = index.locate(duration * percent / 100)
+        assert abs(time - duration * percent / 100) < 1e-9
+        assert offset == offsets[0] + toc[percent] * (size - offsets[0]) // 256
+
+
+def test_mp3_without_xing_has_no_remote_index(tmp_path):
+    path = tmp_path / "a.mp3"
+    write_mp3(path, 20)
+    assert scan(path, scan_mp3, full_scan=False) is None
+
+
+def test_opus_times_leave_out_pre_skip(tmp_path):
+    path = tmp_path / "a.opus"
+    head = b"OpusHead" + struct.pack("<BBHIhB", 1, 2, 312, 48000, 0, 0)
+    offsets = write_ogg(path, head, [312 + 48000 * k for k in range(1, 5)])
+    index = scan(path)
+    assert index.head_end == offsets[2]
+    # Each audio page starts where the previous one ended, pre-skip excluded
+    assert sorted(set(index.times)) == [0.0, 1.0, 2.0, 3.0]
+    assert index.locate(2.5) == (2.0, offsets[4])
+    assert index.locate(0.0) == (0.0, offsets[2])
+
+
+def test_vorbis_seeks_land_on_the_page_before(tmp_path):
+    path = tmp_path / "a.ogg"
+    head = b"\x01vorbis" + struct.pack("<IBI", 0, 2, 44100) + bytes(14)
+    granules = [22050 * k for k in range(1, 9)]
+    offsets = write_ogg(path, head, granules)
+    index = scan(path)
+    for seconds in (0.0, 0.3, 1.0, 1.26, 3.9):
+        time, offset = index.locate(seconds)
+        page = offsets.index(offset) - 2
+        # The page that holds the target, and its exact start time
+        assert time == (granules[page - 1] if page else 0) / 44100
+        assert time <= seconds + 1e-9 < time + 0.5 + index.spacing
+
+
+def test_blob_round_trip(tmp_path):
+    path = tmp_path / "a.ogg"
+    head = b"\x01vorbis" + struct.pack("<IBI", 0, 2, 44100) + bytes(14)
+    write_ogg(path, head, [44100 * k for k in range(1, 4)])
+    index = scan(path)
+    copy = SeekIndex.from_blob(index.to_blob())
+    assert (copy.spacing, copy.head_end) == (index.spacing, index.head_end)
+    assert copy.offsets == index.offsets and copy.times == index.times
+
+
+def test_index_is_requested_when_a_track_starts(tmp_path):
+    path = tmp_path / "a.mp3"
+    offsets = write_mp3(path, 400)
+    core = PlayerCore(LibraryStore(":memory:"))
+    core.add_tracks([{"path": str(path), "size": path.stat().st_size, "mtime": 1.0,
+                      "duration": 400 * 1152 / 44100, "title": None, "artist": None, "album": None}])
+    track = core.current_track
+    assert track is not None and not core.stopped
+    deadline = time.monotonic() + 5
+    while core.seek_indexes.cache.get((track.id, track.mtime)) is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+        core.poll()
+    # The first seek already lands on an indexed frame
+    core.seek(5.0)
+    assert abs(core.position_base - 5.0) < 0.1
+    frame = round(core.position_base * 44100 / 1152)
+    assert core.seek_indexes.get(track).locate(5.0)[1] == offsets[frame]
@@ -0,0 +1,92 @@
+import random
+
+from shuffle import ShuffleQueue
+
+
+def play_next(queue):
+    track_id = queue.peek()
+    queue.played(track_id)
+    return track_id
+
+
+def check_slots(queue):
+    assert queue.slots == {track_id: i for i, track_id in enumerate(queue.pool)}
+
+
+def test_every_cycle_is_a_permutation():
+    queue = ShuffleQueue(random.Random(1))
+    queue.reset(range(25))
+    previous = None
+    for _ in range(4):
+        cycle = [play_next(queue) for _ in range(25)]
+        assert sorted(cycle) == list(range(25))
+        assert cycle[0] != previous  # No repeat across the cycle boundary
+        previous = cycle[-1]
+        check_slots(queue)
+
+
+def test_weighted_artist_spread_still_plays_everything():
+    queue = ShuffleQueue(random.Random(2), artist=lambda t: t % 3, weight=lambda t: 0.2 if t % 2 else 1.0)
+    queue.reset(range(30))
+    assert sorted(play_next(queue) for _ in range(30)) == list(range(30))
+
+
+def test_previous_and_next_retrace_the_order():
+    queue = ShuffleQueue(random.Random(3))
+    queue.reset(range(10))
+    order = [play_next(queue) for _ in range(6)]
+    for expected in reversed(order[2:5]):
+        track_id = queue.previous()
+        assert track_id == expected
+        queue.played(track_id)
+    assert [play_next(queue) for _ in range(3)] == order[3:]
+    # A track picked by hand clears the forward stack
+    queue.previous()
+    queue.played(min(set(range(10)) - set(order)))
+    assert not queue.forward
+
+
+def test_previous_skips_removed_tracks():
+    queue = ShuffleQueue(random.Random(4))
+    queue.reset(range(5))
+    order = [play_next(queue) for _ in range(3)]
+    queue.remove(order[1])
+    assert queue.previous() == order[0]
+
+
+def test_add_and_remove_mid_cycle():
+    rng = random.Random(5)
+    queue = ShuffleQueue(random.Random(6))
+    live = set(range(40))
+    queue.reset(sorted(live))
+    played = set()
+    next_id = 40
+    while len(played) < len(live):
+        action = rng.random()
+        if action < 0.2:
+            queue.add(next_id)
+            live.add(next_id)
+            next_id += 1
+        elif action < 0.4:
+            track_id = rng.choice(sorted(live))
+            queue.remove(track_id)
+            live.discard(track_id)
+            played.discard(track_id)
+        else:
+            track_id = play_next(queue)
+            assert track_id in live and track_id not in played
+            played.add(track_id)
+        check_slots(queue)
+        assert set(queue.pool) == live
+        assert set(queue.pool[:queue.cursor]) == played
+
+
+def test_set_items_keeps_played_state():
+    queue = ShuffleQueue(random.Random(7))
+    queue.reset(range(20))
+    played = {play_next(queue) for _ in range(8)}
+    view = [track_id for track_id in range(20) if track_id % 2]
+    queue.set_items(view)
+    check_slots(queue)
+    rest = [play_next(queue) for _ in range(len(set(view) - played))]
+    assert sorted(rest) == sorted(set(view) - played)
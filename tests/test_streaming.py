@@ -0,0 +1,107 @@
+import os
+import time
+
+import pytest
+
+from audio_backend import NullAudioBackend
+from library_store import LibraryStore
+from player_core import PlayerCore
+from streaming import CHUNK_SIZE, HttpSource, StreamOpener, open_stream, stream_info
+
+DATA = os.urandom(3 * CHUNK_SIZE + 1234)
+
+
+@pytest.fixture(params=[True, False], ids=["ranges", "sequential"])
+def served(request, tmp_path, http_server):
+    (tmp_path / "track.bin").write_bytes(DATA)
+    (tmp_path / "sub").mkdir()
+    return http_server(tmp_path, ranges=request.param), request.param
+
+
+def wait_for(poll, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = poll()
+        if result is not None:
+            return result
+        time.sleep(0.01)
+    raise AssertionError("timed out")
+
+
+def test_probe_reports_size_and_range_support(served):
+    base, ranges = served
+    source = HttpSource(f"{base}/track.bin")
+    assert source.ranges is ranges
+    assert source.size == len(DATA)
+    source.close()
+
+
+def test_read_at(served):
+    base, _ = served
+    source = HttpSource(f"{base}/track.bin")
+    # Forward, then backwards (a restart without ranges)
+    for offset, length in [(0, 100), (CHUNK_SIZE + 7, 5000), (50, 10), (len(DATA) - 10, 100)]:
+        assert source.read_at(offset, length) == DATA[offset:offset + length]
+    source.close()
+
+
+def test_read_past_end(served):
+    # With ranges the server answers 416; without, the body just ends
+    base, _ = served
+    source = HttpSource(f"{base}/track.bin")
+    assert source.read_at(len(DATA) + 10, 100) == b""
+    source.close()
+
+
+def test_redirect_is_followed(served):
+    # The server redirects a folder without its trailing slash
+    base, _ = served
+    source = HttpSource(f"{base}/sub")
+    assert source.target == "/sub/"
+    assert source.read_at(0, 15).lower() == b"<!doctype html>"
+    source.close()
+
+
+def test_http_error_raises(served):
+    base, _ = served
+    with pytest.raises(OSError):
+        HttpSource(f"{base}/missing.bin")
+
+
+def test_buffered_stream(served):
+    base, _ = served
+    stream = open_stream(f"{base}/track.bin")
+    assert stream.read() == DATA
+    stream.seek(CHUNK_SIZE - 3)
+    assert stream.read(10) == DATA[CHUNK_SIZE - 3:CHUNK_SIZE + 7]
+    stream.close()
+
+
+def test_opener_hands_over_the_latest_stream(served):
+    base, _ = served
+    opener = StreamOpener()
+    opener.open("old", f"{base}/track.bin")
+    opener.open("new", f"{base}/track.bin")
+    tag, stream, error = wait_for(opener.poll)
+    assert (tag, error) == ("new", None)
+    assert stream.read(100) == DATA[:100]
+    stream.close()
+    opener.open("missing", f"{base}/missing.bin")
+    tag, stream, error = wait_for(opener.poll)
+    assert stream is None and isinstance(error, OSError)
+
+
+def test_core_plays_remote_tracks_from_poll(served):
+    base, _ = served
+    core = PlayerCore(LibraryStore(":memory:"), NullAudioBackend())
+    errors = []
+    core.add_listener(lambda event, track: event == "error" and errors.append(track))
+    core.add_tracks([stream_info(f"{base}/track.bin"), stream_info("http://127.0.0.1:1/none.mp3")])
+    good, bad = (core.registry.tracks[track_id] for track_id in core.registry.order)
+    # add_tracks() starts the first track; it is current but waits for its stream
+    assert core.current_track is good and core.stopped
+    wait_for(lambda: core.poll() or (True if not core.stopped else None))
+    assert core.audio.path == good.path
+    core.play_track(bad.id)
+    wait_for(lambda: core.poll() or (errors or None))
+    assert errors == [bad] and core.stopped
@@ -0,0 +1,39 @@
+import time
+import wave
+
+import numpy as np
+
+from visualizer import BANDS, SpectrumAnalyzer
+
+
+def test_spectrum_of_a_wav(tmp_path):
+    path = str(tmp_path / "tone.wav")
+    samples = (np.sin(np.arange(44100 * 2) * 2 * np.pi * 1000 / 44100) * 16000).astype("<i2")
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(44100)
+        f.writeframes(samples.tobytes())
+    analyzer = SpectrumAnalyzer()
+    levels = None
+    deadline = time.monotonic() + 5
+    while levels is None and time.monotonic() < deadline:
+        levels = analyzer.levels(path, 0.5)
+        time.sleep(0.01)
+    analyzer.close()
+    assert levels is not None and levels.shape == (BANDS,)
+    # A 1 kHz tone: the loudest band is in the middle of the range
+    assert 0 < levels.argmax() < BANDS - 1
+    assert not analyzer.unavailable
+
+
+def test_no_incremental_decoder_marks_unavailable(tmp_path, monkeypatch):
+    monkeypatch.setattr("loudness.soundfile", None)
+    path = str(tmp_path / "a.mp3")
+    open(path, "wb").close()
+    analyzer = SpectrumAnalyzer()
+    assert analyzer.levels(path, 0.0) is None
+    analyzer.thread.join(5)
+    assert analyzer.unavailable
+    analyzer.close()
+    assert not analyzer.unavailable
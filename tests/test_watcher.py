@@ -0,0 +1,94 @@
+import ctypes
+import errno
+import time
+
+import pytest
+
+import watcher
+from watcher import InotifyBackend, LibraryWatcher
+
+
+@pytest.fixture(autouse=True)
+def quick(monkeypatch):
+    monkeypatch.setattr(watcher, "DEBOUNCE_SECONDS", 0.05)
+    monkeypatch.setattr(watcher, "MAX_DELAY_SECONDS", 0.2)
+
+
+def inotify_available():
+    try:
+        InotifyBackend().close()
+        return True
+    except (OSError, AttributeError):
+        return False
+
+
+def changes(lib_watcher, timeout=5.0):
+    # Paths reported as added, once any arrive
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        found = [info["path"] for infos, _, _ in lib_watcher.poll() for info in infos]
+        if found:
+            return found
+        time.sleep(0.02)
+    return []
+
+
+def write(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"\0" * 128)
+    return str(path)
+
+
+@pytest.mark.parametrize("use_inotify", [True, False], ids=["inotify", "polling"])
+def test_root_added_before_start_is_watched(tmp_path, use_inotify):
+    if use_inotify and not inotify_available():
+        pytest.skip("no inotify")
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    lib_watcher = LibraryWatcher([str(tmp_path / "a")], use_inotify, poll_interval=0.1)
+    lib_watcher.add_root(str(tmp_path / "b"))  # Before the backend exists
+    lib_watcher.start()
+    time.sleep(0.2)
+    path = write(tmp_path / "b" / "new.mp3")
+    assert changes(lib_watcher) == [path]
+    lib_watcher.stop()
+
+
+class LimitedLibc:
+    # libc whose inotify runs out of watches after limit of them
+    def __init__(self, libc, limit):
+        self.libc = libc
+        self.limit = limit
+
+    def __getattr__(self, name):
+        return getattr(self.libc, name)
+
+    def inotify_add_watch(self, fd, path, mask):
+        if self.limit <= 0:
+            ctypes.set_errno(errno.ENOSPC)
+            return -1
+        self.limit -= 1
+        return self.libc.inotify_add_watch(fd, path, mask)
+
+
+def test_folders_past_the_watch_limit_are_polled(tmp_path, monkeypatch):
+    if not inotify_available():
+        pytest.skip("no inotify")
+    real_cdll = ctypes.CDLL
+    monkeypatch.setattr(ctypes, "CDLL", lambda name, use_errno=False:
+                        LimitedLibc(real_cdll(name, use_errno=use_errno), 1))
+    (tmp_path / "deep" / "deeper").mkdir(parents=True)
+    lib_watcher = LibraryWatcher([str(tmp_path)], poll_interval=0.1)
+    lib_watcher.start()
+    time.sleep(0.2)
+    backend = lib_watcher.backend
+    assert isinstance(backend, InotifyBackend)
+    assert list(backend.watches.values()) == [str(tmp_path)]
+    assert sorted(backend.polling.folders) == [str(tmp_path / "deep"), str(tmp_path / "deep" / "deeper")]
+    # Inotify still covers the root; polling the folders below it
+    path = write(tmp_path / "top.mp3")
+    assert changes(lib_watcher) == [path]
+    path = write(tmp_path / "deep" / "deeper" / "low.mp3")
+    assert changes(lib_watcher) == [path]
+    assert not lib_watcher.overflowed
+    lib_watcher.stop()
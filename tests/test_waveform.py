@@ -0,0 +1,44 @@
+import wave
+
+import numpy as np
+
+from waveform import PEAKS, WaveformCache, build, summarize
+
+
+def write_ramp(path, seconds=2.0, rate=22050):
+    # Amplitude rising from silence to full scale over the file
+    t = np.arange(int(seconds * rate))
+    samples = (np.sin(2 * np.pi * 440 * t / rate) * t / len(t) * 32767).astype("<i2")
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(samples.tobytes())
+
+
+def test_summary_follows_the_signal(tmp_path):
+    write_ramp(tmp_path / "ramp.wav")
+    peaks = np.array(summarize(str(tmp_path / "ramp.wav"))).reshape(PEAKS, 3)
+    lows, highs, rms = peaks.T
+    assert (lows <= 0).all() and (highs >= 0).all()
+    # Fewer segments than columns here: the first column is a whole segment
+    assert highs[0] < 1000 and highs[-1] > 32000
+    assert (rms <= highs).all() and rms[-1] > rms[PEAKS // 2] > rms[0]
+
+
+def test_undecodable_files_have_no_waveform(tmp_path):
+    (tmp_path / "broken.wav").write_bytes(b"not audio")
+    assert len(summarize(str(tmp_path / "broken.wav"))) == 0
+    assert len(summarize(str(tmp_path / "missing.wav"))) == 0
+
+
+def test_cache_reads_built_files(tmp_path):
+    path = str(tmp_path / "ramp.wav")
+    write_ramp(path, seconds=0.5)
+    cache = WaveformCache(str(tmp_path / "cache"), workers=1)
+    assert cache.read(path, 1.0) is None
+    peaks = build(path, cache.cache_file(path, 1.0))
+    assert cache.read(path, 1.0) == peaks and len(peaks) == PEAKS * 3
+    # A new mtime is a different file
+    assert cache.cache_file(path, 2.0) != cache.cache_file(path, 1.0)
+    assert cache.read(path, 2.0) is None
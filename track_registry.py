@@ -0,0 +1,113 @@
+from array import array
+from itertools import chain
+
+
+class Track:
+    # Compact per-track record; __slots__ keeps it to a few dozen bytes
+    # plus the path string
+    __slots__ = ("id", "path", "size", "mtime", "duration", "title", "artist", "album", "liked",
+                 "gain", "peak")
+
+    def __init__(self, track_id, path, size=None, mtime=None, duration=None,
+                 title=None, artist=None, album=None, liked=False, gain=None, peak=None):
+        self.id = track_id
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.duration = duration
+        self.title = title
+        self.artist = artist
+        self.album = album
+        self.liked = bool(liked)
+        # ReplayGain track gain (dB) and sample peak; None until analysed
+        self.gain = gain
+        self.peak = peak
+
+    def update(self, info):
+        if info["mtime"] != self.mtime:
+            self.gain = self.peak = None  # The file changed; analysed again
+        self.size = info["size"]
+        self.mtime = info["mtime"]
+        self.duration = info["duration"]
+        self.title = info.get("title")
+        self.artist = info.get("artist")
+        self.album = info.get("album")
+
+
+class TrackRegistry:
+    # Owns every track record, keyed by a stable integer id (the library
+    # store's row id). The playlist order is an array of ids; the path -> id
+    # and id -> position maps are kept in sync on add/remove so that
+    # lookups never scan the playlist.
+    def __init__(self):
+        self.tracks = {}
+        self.ids = {}
+        self.order = array('q')
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.order)
+
+    def __contains__(self, track_id):
+        return track_id in self.tracks
+
+    def get(self, track_id):
+        return self.tracks.get(track_id)
+
+    def id_for(self, path):
+        return self.ids.get(path)
+
+    def position(self, track_id):
+        return self.positions.get(track_id)
+
+    def load_rows(self, rows):
+        # Bulk restore from the library store, a batch at a time. The rows
+        # get their positions from load_order(); tracks added meanwhile
+        # are already up to date and are kept.
+        tracks = self.tracks
+        for row in rows:
+            if row["id"] in tracks:
+                continue
+            tracks[row["id"]] = Track(
+                row["id"], row["path"], row["size"], row["mtime"], row["duration"],
+                row["title"], row["artist"], row["album"], row["liked"], row["gain"], row["peak"])
+            self.ids[row["path"]] = row["id"]
+
+    def load_order(self, order):
+        # The stored playlist order, once every row is loaded. Tracks
+        # missing from it (including any added during the load) follow in
+        # id order, which is the order they were added in.
+        self.order = array('q')
+        self.positions = {}
+        for track_id in chain(order, sorted(self.tracks)):
+            if track_id in self.tracks and track_id not in self.positions:
+                self.positions[track_id] = len(self.order)
+                self.order.append(track_id)
+
+    def add(self, track_id, info):
+        # Returns True if the track is new; known paths are only updated
+        track = self.tracks.get(track_id)
+        if track is not None:
+            track.update(info)
+            return False
+        track = Track(track_id, info["path"])
+        track.update(info)
+        self.tracks[track_id] = track
+        self.ids[track.path] = track_id
+        self.positions[track_id] = len(self.order)
+        self.order.append(track_id)
+        return True
+
+    def remove(self, track_ids):
+        removed = set(track_ids) & self.tracks.keys()
+        if not removed:
+            return
+        for track_id in removed:
+            track = self.tracks.pop(track_id)
+            del self.ids[track.path]
+        self.order = array('q', (track_id for track_id in self.order if track_id not in removed))
+        self.positions = {track_id: i for i, track_id in enumerate(self.order)}
+
+    def liked_ids(self):
+        tracks = self.tracks
+        return array('q', (track_id for track_id in self.order if tracks[track_id].liked))
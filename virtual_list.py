@@ -0,0 +1,148 @@
+import os
+import tkinter as tk
+from tkinter import ttk
+
+
+class VirtualTrackList(tk.Frame):
+    # A scrollable track list that only keeps widgets for the rows in view.
+    # Rows are a fixed pool that gets recycled while scrolling, so redrawing
+    # costs O(visible rows) no matter how many items are in the list.
+    ROW_HEIGHT = 30
+
+    def __init__(self, parent, on_play, bg="#121212", thumbnail=None):
+        super().__init__(parent, bg=bg)
+        self.on_play = on_play
+        # thumbnail(item) returns a cached image or None (requested in the
+        # background; call refresh_soon() once it arrives)
+        self.thumbnail = thumbnail
+        self.placeholder = None
+        self.refresh_pending = False
+        self.bg = bg
+        self.items = []
+        self.describe = os.path.basename
+        self.first = 0
+        self.rows = []
+
+        self.body = tk.Frame(self, bg=bg)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.yview)
+        self.body.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+
+        self.body.bind("<Configure>", self.on_resize)
+        self.bind_wheel(self.body)
+
+    def bind_wheel(self, widget):
+        widget.bind("<MouseWheel>", self.on_wheel)
+        widget.bind("<Button-4>", lambda e: self.yview("scroll", -3, "units"))
+        widget.bind("<Button-5>", lambda e: self.yview("scroll", 3, "units"))
+
+    def create_row(self, slot):
+        frame = tk.Frame(self.body, bg=self.bg)
+
+        # Track number
+        number = tk.Label(frame, text="", bg=self.bg, fg="white", width=6)
+        number.pack(side="left")
+
+        # Album art thumbnail
+        art = None
+        if self.thumbnail is not None:
+            art = tk.Label(frame, bg=self.bg, image=self.placeholder_image())
+            art.pack(side="left", padx=5)
+
+        # Track name
+        name = tk.Label(frame, text="", bg=self.bg, fg="white", width=40, anchor="w")
+        name.pack(side="left")
+
+        # Play button
+        play_btn = tk.Button(frame, text="▶", font=("Helvetica", 10),
+                             bg=self.bg, fg="white", bd=0,
+                             command=lambda s=slot: self.play_slot(s))
+        play_btn.pack(side="right", padx=10)
+
+        for widget in (frame, number, name, play_btn):
+            self.bind_wheel(widget)
+        return frame, number, name, art
+
+    def placeholder_image(self):
+        if self.placeholder is None:
+            size = self.ROW_HEIGHT - 6
+            self.placeholder = tk.PhotoImage(width=size, height=size)
+            self.placeholder.put("#535353", to=(0, 0, size, size))
+        return self.placeholder
+
+    def visible_rows(self):
+        height = self.body.winfo_height()
+        return max(1, height // self.ROW_HEIGHT + 1)
+
+    def on_resize(self, event=None):
+        needed = self.visible_rows()
+        while len(self.rows) < needed:
+            self.rows.append(self.create_row(len(self.rows)))
+        self.refresh()
+
+    def on_wheel(self, event):
+        step = -1 if event.delta > 0 else 1
+        # Windows reports multiples of 120 per notch, macOS small deltas
+        if abs(event.delta) >= 120:
+            step *= abs(event.delta) // 120
+        self.yview("scroll", step * 3, "units")
+
+    def set_items(self, items, describe=None):
+        self.items = items
+        if describe is not None:
+            self.describe = describe
+        self.refresh()
+
+    def max_first(self):
+        return max(0, len(self.items) - self.visible_rows() + 1)
+
+    def yview(self, *args):
+        if not args:
+            return
+        if args[0] == "moveto":
+            self.first = int(float(args[1]) * len(self.items))
+        elif args[0] == "scroll":
+            amount = int(args[1])
+            if args[2] == "pages":
+                amount *= max(1, self.visible_rows() - 1)
+            self.first += amount
+        self.refresh()
+
+    def refresh(self):
+        self.first = max(0, min(self.first, self.max_first()))
+        total = len(self.items)
+
+        for slot, (frame, number, name, art) in enumerate(self.rows):
+            index = self.first + slot
+            if index < total:
+                number.config(text=str(index + 1))
+                name.config(text=self.describe(self.items[index]))
+                if art is not None:
+                    image = self.thumbnail(self.items[index]) or self.placeholder_image()
+                    art.config(image=image)
+                    art.image = image
+                frame.place(x=0, y=slot * self.ROW_HEIGHT, relwidth=1,
+                            height=self.ROW_HEIGHT)
+            else:
+                frame.place_forget()
+
+        if total:
+            visible = min(len(self.rows), total - self.first)
+            self.scrollbar.set(self.first / total, (self.first + visible) / total)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def refresh_soon(self):
+        # Coalesces many refresh requests into one redraw when idle
+        if not self.refresh_pending:
+            self.refresh_pending = True
+            self.after_idle(self.refresh_now)
+
+    def refresh_now(self):
+        self.refresh_pending = False
+        self.refresh()
+
+    def play_slot(self, slot):
+        index = self.first + slot
+        if index < len(self.items):
+            self.on_play(index)
@@ -0,0 +1,215 @@
+import threading
+import tkinter as tk
+
+import numpy as np
+
+from loudness import decode_blocks
+from streaming import is_url
+
+FPS = 30
+# Spectrum frames per second of audio; a multiple of FPS so every drawn
+# frame has one
+FRAME_RATE = 60
+FFT_SIZE = 2048
+BANDS = 32
+LOWEST_FREQUENCY = 40
+FLOOR_DB = -60.0
+
+# Audio decoded per step, and how far the decoder may run ahead of playback
+DECODE_SECONDS = 0.25
+AHEAD_SECONDS = 1.0
+RING_SECONDS = 3.0
+
+# Bar fall per drawn frame (fraction of full height), for a smoother decay
+FALL = 0.06
+
+# Redraw interval while nothing is playing
+IDLE_MS = 250
+
+
+def band_edges(rate):
+    # FFT bin where each logarithmically spaced band starts
+    edges = np.geomspace(LOWEST_FREQUENCY, rate / 2, BANDS + 1)[:-1]
+    bins = np.round(edges * FFT_SIZE / rate).astype(int)
+    bins[0] = max(bins[0], 1)
+    for i in range(1, BANDS):
+        bins[i] = max(bins[i], bins[i - 1] + 1)  # At least one bin per band
+    return bins
+
+
+class SpectrumAnalyzer:
+    # Decodes the current track on its own thread and turns the PCM into
+    # spectrum frames, FRAME_RATE per second of audio. Each decoded block
+    # is transformed in one batch (Hann-windowed FFTs of all its hops at
+    # once) and its frames land in a ring buffer indexed by frame number. The
+    # decoder stays at most AHEAD_SECONDS ahead of the playhead reported by
+    # levels(), so it uses a small, steady slice of a core. Formats with
+    # only a whole-file decoder (MP3/Ogg without soundfile) get no
+    # spectrum; unavailable is set for them so the view can say so.
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.thread = None
+        self.generation = 0
+        self.path = None
+        self.start = 0.0
+        self.rate = None
+        self.ring = np.zeros((int(RING_SECONDS * FRAME_RATE), BANDS), np.float32)
+        self.written = 0
+        self.playhead = 0
+        self.unavailable = False
+
+    def open(self, path, start=0.0):
+        # Starts decoding path from start seconds, replacing any decoder
+        with self.condition:
+            self.generation += 1
+            self.path = path
+            self.start = start
+            self.rate = None
+            self.written = 0
+            self.playhead = 0
+            self.unavailable = False
+            self.condition.notify_all()
+        if path is None or is_url(path):
+            return
+        self.thread = threading.Thread(target=self.run, args=(self.generation, path, start),
+                                       daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.open(None)
+
+    def levels(self, path, seconds):
+        # Band levels (0..1) at seconds into path, or None if not decoded
+        # yet. A different track or a jump outside the buffered frames
+        # restarts the decoder there.
+        with self.condition:
+            frame = int((seconds - self.start) * FRAME_RATE)
+            oldest = self.written - len(self.ring)
+            # Forward jumps only count once the decoder is producing; the
+            # first block can take a while
+            if path != self.path or frame < max(0, oldest) or \
+                    (self.rate is not None and frame > self.written + len(self.ring)):
+                restart = True
+            else:
+                restart = False
+                self.playhead = frame
+                self.condition.notify_all()
+                if frame < self.written:
+                    return self.ring[frame % len(self.ring)].copy()
+        if restart:
+            self.open(path, max(0.0, seconds))
+        return None
+
+    def run(self, generation, path, start):
+        # Only incremental decoders: decoding a whole file (and opening the
+        # mixer) on every track change or seek is too much for visuals
+        try:
+            blocks = decode_blocks(path, start, int(48000 * DECODE_SECONDS), whole_file=False)
+            rate = next(blocks)
+        except Exception:
+            # Nothing to show for files the decoders can't read
+            with self.condition:
+                if generation == self.generation:
+                    self.unavailable = True
+            return
+        hop = rate / FRAME_RATE
+        window = np.hanning(FFT_SIZE).astype(np.float32)
+        edges = band_edges(rate)
+        # Full-scale sine through the window, for 0 dB
+        reference = (window.sum() / 2) ** 2
+        # Frame n is centred on sample n * hop
+        pcm = np.zeros(FFT_SIZE // 2, np.float32)
+        consumed = 0  # Samples dropped from the front of pcm
+        frame = 0
+        try:
+            for block in blocks:
+                pcm = np.concatenate((pcm, block.mean(axis=1, dtype=np.float32)))
+                starts = np.arange(frame, frame + len(pcm) // hop + 1)
+                starts = (starts * hop).astype(int) - consumed
+                starts = starts[starts + FFT_SIZE <= len(pcm)]
+                if len(starts):
+                    windows = pcm[starts[:, None] + np.arange(FFT_SIZE)] * window
+                    spectrum = np.fft.rfft(windows, axis=1)
+                    power = spectrum.real ** 2 + spectrum.imag ** 2
+                    bands = np.add.reduceat(power, edges, axis=1)
+                    with np.errstate(divide="ignore"):
+                        db = 10 * np.log10(bands / reference)
+                    levels = np.clip(1 - db / FLOOR_DB, 0, 1).astype(np.float32)
+                    if not self.store(generation, frame, levels, rate):
+                        return
+                    frame += len(starts)
+                    drop = int(frame * hop) - consumed
+                    pcm = pcm[drop:]
+                    consumed += drop
+        except Exception:
+            pass  # A decode error ends the visuals for this track
+
+    def store(self, generation, frame, levels, rate):
+        # Writes frames to the ring, waiting while too far ahead of the
+        # playhead; False once this decoder has been replaced
+        ring = self.ring
+        ahead = AHEAD_SECONDS * FRAME_RATE
+        with self.condition:
+            self.rate = rate
+            for row in levels:
+                while generation == self.generation and frame - self.playhead >= ahead:
+                    self.condition.wait()
+                if generation != self.generation:
+                    return False
+                ring[frame % len(ring)] = row
+                frame += 1
+                self.written = frame
+        return True
+
+
+class SpectrumView(tk.Canvas):
+    # Bar spectrum of whatever is playing. The bars are created once and
+    # only their coordinates change per frame. Drawing runs at FPS while
+    # active; set_active(False) cancels the timer and stops the decoder.
+    # source() returns (path, seconds, playing) for the current track.
+    def __init__(self, parent, source, width=300, height=80, bg="#121212", color="#1DB954"):
+        super().__init__(parent, width=width, height=height, bg=bg, highlightthickness=0)
+        self.source = source
+        self.analyzer = SpectrumAnalyzer()
+        self.heights = np.zeros(BANDS, np.float32)
+        self.bars = [self.create_rectangle(0, 0, 0, 0, fill=color, width=0) for _ in range(BANDS)]
+        self.message = self.create_text(0, 0, text="Visualizer unavailable for this track",
+                                        fill="#b3b3b3", state="hidden")
+        self.after_id = None
+        self.bind("<Configure>", lambda e: self.draw())
+
+    def set_active(self, active):
+        if active and self.after_id is None:
+            self.tick()
+        elif not active and self.after_id is not None:
+            self.after_cancel(self.after_id)
+            self.after_id = None
+            self.analyzer.close()
+            self.heights[:] = 0
+            self.itemconfig(self.message, state="hidden")
+            self.draw()
+
+    def tick(self):
+        path, seconds, playing = self.source()
+        levels = self.analyzer.levels(path, seconds) if playing and path else None
+        if levels is not None:
+            self.heights = np.maximum(levels, self.heights - FALL)
+        else:
+            self.heights = np.maximum(self.heights - FALL, 0)
+        unavailable = playing and self.analyzer.unavailable and self.analyzer.path == path
+        self.itemconfig(self.message, state="normal" if unavailable else "hidden")
+        self.draw()
+        idle = not playing and not self.heights.any()
+        if idle and self.analyzer.path is not None:
+            self.analyzer.close()
+        self.after_id = self.after(IDLE_MS if idle else 1000 // FPS, self.tick)
+
+    def draw(self):
+        width = self.winfo_width()
+        height = self.winfo_height()
+        step = width / BANDS
+        gap = max(1, step // 5)
+        tops = height - self.heights * height
+        self.coords(self.message, width / 2, height / 2)
+        for i, (bar, top) in enumerate(zip(self.bars, tops.tolist())):
+            self.coords(bar, i * step, top, (i + 1) * step - gap, height)
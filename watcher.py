@@ -0,0 +1,368 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import queue
+import select
+import struct
+import threading
+import time
+
+from importer import AUDIO_EXTENSIONS, BATCH_SIZE, probe_track
+
+# Changes are applied once events stop for DEBOUNCE_SECONDS, or at the
+# latest MAX_DELAY_SECONDS after the first one of a burst
+DEBOUNCE_SECONDS = 1.0
+MAX_DELAY_SECONDS = 5.0
+
+# Polling fallback: how often directory mtimes are compared
+POLL_SECONDS = 10.0
+
+# inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE |
+              IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def walk_tree(root):
+    # Yields (directory, audio file paths) for root and every folder below
+    pending = [root]
+    while pending:
+        directory = pending.pop()
+        files = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif entry.name.lower().endswith(AUDIO_EXTENSIONS):
+                            files.append(entry.path)
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+        yield directory, files
+
+
+def inside(path, directory):
+    return path.startswith(directory.rstrip(os.sep) + os.sep)
+
+
+class InotifyBackend:
+    # One inotify watch per directory, read on the watcher thread with
+    # select(); nothing runs while the folders are quiet. Folders past the
+    # watch limit are handed to a PollingBackend, whose changes read()
+    # merges in. Raises OSError if inotify is unavailable.
+    def __init__(self, poll_interval=POLL_SECONDS):
+        name = ctypes.util.find_library("c")
+        self.libc = ctypes.CDLL(name, use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}
+        self.wake_read, self.wake_write = os.pipe()
+        self.polling = PollingBackend(poll_interval)
+
+    def close(self):
+        for fd in (self.fd, self.wake_read, self.wake_write):
+            os.close(fd)
+
+    def wake(self):
+        os.write(self.wake_write, b"\0")
+
+    def watch_tree(self, root):
+        # Watches root and its subfolders; returns the audio files in them
+        found = []
+        for directory, files in walk_tree(root):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                if ctypes.get_errno() != errno.ENOSPC:
+                    continue  # Vanished or unreadable
+                # Watch limit reached: this folder is polled instead
+                self.polling.watch_folder(directory)
+            else:
+                self.watches[wd] = directory
+            found.extend(files)
+        return found
+
+    def forget(self, directory):
+        for wd, path in list(self.watches.items()):
+            if path == directory or inside(path, directory):
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.watches[wd]
+        self.polling.forget(directory)
+
+    def read(self, timeout):
+        # Returns [(kind, path)]: "file" for a file to re-check, "dir" for
+        # a new folder, "gone" for a removed one and "overflow" if events
+        # were lost
+        polling = self.polling.folders
+        if polling:
+            wait = max(0.0, self.polling.next_poll - time.monotonic())
+            timeout = wait if timeout is None else min(timeout, wait)
+        readable, _, _ = select.select([self.fd, self.wake_read], [], [], timeout)
+        if self.wake_read in readable:
+            os.read(self.wake_read, 4096)
+        events = self.polling.read(0) if polling else []
+        if self.fd not in readable:
+            return events
+        try:
+            data = os.read(self.fd, 256 * 1024)
+        except BlockingIOError:
+            return events
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                events.append(("overflow", None))
+                continue
+            directory = self.watches.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                del self.watches[wd]
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                events.append(("gone", directory))
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    events.append(("dir", path))
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    events.append(("gone", path))
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO | IN_DELETE | IN_MOVED_FROM) and \
+                    path.lower().endswith(AUDIO_EXTENSIONS):
+                # Creation alone is ignored: the write that follows reports it
+                events.append(("file", path))
+        return events
+
+
+class PollingBackend:
+    # Fallback without inotify: every POLL_SECONDS, stat each known folder
+    # and list only the ones whose mtime changed. A folder's mtime changes
+    # when files are added, removed or renamed in it (not when a file is
+    # rewritten in place).
+    def __init__(self, interval=POLL_SECONDS):
+        self.interval = interval
+        self.folders = {}  # directory -> (mtime, audio file names, subfolders)
+        self.next_poll = time.monotonic() + interval
+        self.woken = threading.Event()
+
+    def close(self):
+        pass
+
+    def wake(self):
+        self.woken.set()
+
+    def watch_tree(self, root):
+        found = []
+        pending = [root]
+        while pending:
+            directory = pending.pop()
+            state = self.watch_folder(directory)
+            if state is None:
+                continue
+            found.extend(os.path.join(directory, name) for name in state[1])
+            pending.extend(os.path.join(directory, name) for name in state[2])
+        return found
+
+    def watch_folder(self, directory):
+        # Just this folder, not its subfolders; returns its state
+        state = self.folder_state(directory)
+        if state is not None:
+            self.folders[directory] = state
+        return state
+
+    def folder_state(self, directory):
+        files = set()
+        folders = set()
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            folders.add(entry.name)
+                        elif entry.name.lower().endswith(AUDIO_EXTENSIONS):
+                            files.add(entry.name)
+                    except OSError:
+                        continue
+        except OSError:
+            return None
+        return mtime, files, folders
+
+    def forget(self, directory):
+        for path in list(self.folders):
+            if path == directory or inside(path, directory):
+                del self.folders[path]
+
+    def read(self, timeout):
+        wait = self.next_poll - time.monotonic()
+        if timeout is not None:
+            wait = min(wait, timeout)
+        if self.woken.wait(max(0.0, wait)):
+            self.woken.clear()
+        if time.monotonic() < self.next_poll:
+            return []
+        self.next_poll = time.monotonic() + self.interval
+        events = []
+        for directory, state in list(self.folders.items()):
+            if directory not in self.folders:
+                continue  # Forgotten with a parent during this pass
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                events.append(("gone", directory))
+                self.forget(directory)
+                continue
+            if mtime == state[0]:
+                continue
+            new_state = self.folder_state(directory)
+            if new_state is None:
+                continue
+            _, old_files, old_folders = state
+            _, files, folders = new_state
+            self.folders[directory] = new_state
+            for name in files ^ old_files:
+                events.append(("file", os.path.join(directory, name)))
+            for name in folders - old_folders:
+                events.append(("dir", os.path.join(directory, name)))
+            for name in old_folders - folders:
+                events.append(("gone", os.path.join(directory, name)))
+        return events
+
+
+class LibraryWatcher:
+    # Keeps the library in step with its root folders. A worker thread
+    # collects change events (inotify, else directory polling), coalesces
+    # them per path and, once they settle, checks each path once: files
+    # that exist are probed, the rest reported as removed. Batches reach
+    # the UI thread through poll() as (track infos, removed paths, removed
+    # folders). overflowed is set when events were lost and a rescan is
+    # needed.
+    def __init__(self, roots, use_inotify=True, poll_interval=POLL_SECONDS):
+        self.roots = list(roots)
+        self.use_inotify = use_inotify
+        self.poll_interval = poll_interval
+        self.backend = None
+        self.new_roots = queue.Queue()
+        self.results = queue.Queue()
+        self.stopped = threading.Event()
+        self.overflowed = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.backend is not None:
+            self.backend.wake()
+
+    def add_root(self, root):
+        # run() looks at new_roots after creating the backend and before
+        # each read(), so a root queued before the backend exists is
+        # still picked up; later ones wake the read
+        self.new_roots.put(root)
+        if self.backend is not None:
+            self.backend.wake()
+
+    def open_backend(self):
+        if self.use_inotify:
+            try:
+                backend = InotifyBackend(self.poll_interval)
+            except (OSError, AttributeError):
+                pass
+            else:
+                for root in self.roots:
+                    backend.watch_tree(root)
+                return backend
+        backend = PollingBackend(self.poll_interval)
+        for root in self.roots:
+            backend.watch_tree(root)
+        return backend
+
+    def run(self):
+        self.backend = backend = self.open_backend()
+        changed = set()
+        gone = set()
+        first = last = None
+        try:
+            while not self.stopped.is_set():
+                timeout = None
+                if first is not None:
+                    now = time.monotonic()
+                    timeout = max(0.0, min(last + DEBOUNCE_SECONDS, first + MAX_DELAY_SECONDS) - now)
+                while not self.new_roots.empty():
+                    root = self.new_roots.get()
+                    if root not in self.roots:
+                        self.roots.append(root)
+                        backend.watch_tree(root)  # Its files come from the import
+                events = backend.read(timeout)
+                for kind, path in events:
+                    if kind == "file":
+                        changed.add(path)
+                    elif kind == "dir":
+                        changed.update(backend.watch_tree(path))
+                    elif kind == "gone":
+                        backend.forget(path)
+                        gone.add(path)
+                    elif kind == "overflow":
+                        self.overflowed = True
+                if events:
+                    last = time.monotonic()
+                    if first is None:
+                        first = last
+                if first is not None and time.monotonic() >= min(last + DEBOUNCE_SECONDS,
+                                                                 first + MAX_DELAY_SECONDS):
+                    self.flush(changed, gone)
+                    changed = set()
+                    gone = set()
+                    first = last = None
+        finally:
+            backend.close()
+
+    def flush(self, changed, gone):
+        # A folder that was removed and recreated (or renamed back) within
+        # the window is still there and its files are in changed
+        gone = [path for path in gone if not os.path.isdir(path)]
+        infos = []
+        removed = []
+        for path in changed:
+            try:
+                stat = os.stat(path)
+                infos.append(probe_track(path, stat))
+            except OSError:
+                removed.append(path)
+            if len(infos) >= BATCH_SIZE:
+                self.results.put((infos, [], []))
+                infos = []
+        self.results.put((infos, removed, gone))
+
+    def poll(self):
+        batches = []
+        while True:
+            try:
+                batches.append(self.results.get_nowait())
+            except queue.Empty:
+                return batches
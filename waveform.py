@@ -0,0 +1,259 @@
+import hashlib
+import multiprocessing
+import os
+import queue
+import threading
+import tkinter as tk
+from array import array
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from metadata import LRUCache
+from streaming import is_url
+
+DEFAULT_WAVEFORM_DIR = os.path.join(os.path.expanduser("~"), ".spotifypy", "waveforms")
+
+# Columns per waveform; each is a (min, max, rms) triple of int16
+PEAKS = 400
+# Samples per fine segment summarised while decoding
+SEGMENT = 1024
+
+# Shown without a waveform: no peaks, RMS at 0.15
+FLAT_PEAKS = (0, 0, 4915) * PEAKS
+
+PLAYED = ("#168d40", "#1DB954")
+UNPLAYED = ("#404040", "#6a6a6a")
+
+
+def summarize(path):
+    # Worker process: returns the waveform as array('h') of PEAKS
+    # interleaved (min, max, rms) values, or an empty array if the file
+    # can't be decoded. Blocks are reduced to per-segment min/max/sum of
+    # squares as they arrive; the segments are grouped into columns at
+    # the end, so the length needn't be known up front.
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    # Imported in the worker; the UI doesn't need numpy for waveforms
+    import numpy as np
+    from loudness import decode_blocks
+    lows, highs, squares = [], [], []
+    pending = np.zeros(0, np.float32)
+    try:
+        blocks = decode_blocks(path)
+        next(blocks)  # Sample rate
+        for block in blocks:
+            mono = np.concatenate((pending, block.mean(axis=1, dtype=np.float32)))
+            whole = len(mono) // SEGMENT * SEGMENT
+            pending = mono[whole:]
+            segments = mono[:whole].reshape(-1, SEGMENT)
+            lows.append(segments.min(axis=1))
+            highs.append(segments.max(axis=1))
+            squares.append(np.einsum("ij,ij->i", segments, segments))
+    except Exception:
+        return array('h')
+    if len(pending):
+        lows.append(pending.min(keepdims=True))
+        highs.append(pending.max(keepdims=True))
+        squares.append(np.array([pending @ pending]) * (SEGMENT / len(pending)))
+    if not lows:
+        return array('h')
+    lows, highs, squares = (np.concatenate(parts) for parts in (lows, highs, squares))
+    edges = np.linspace(0, len(lows), PEAKS + 1).astype(int)[:-1]
+    edges = np.minimum(edges, len(lows) - 1)
+    counts = np.diff(np.append(edges, len(lows))).clip(1)
+    columns = np.empty((PEAKS, 3), np.float32)
+    columns[:, 0] = np.minimum.reduceat(lows, edges)
+    columns[:, 1] = np.maximum.reduceat(highs, edges)
+    columns[:, 2] = np.sqrt(np.add.reduceat(squares, edges) / (counts * SEGMENT))
+    peaks = array('h')
+    peaks.frombytes(np.round(columns.clip(-1, 1) * 32767).astype("<i2").tobytes())
+    return peaks
+
+
+def build(path, cache_file):
+    # Worker process: summarises path into cache_file (empty for files
+    # that can't be decoded) and returns the peaks
+    peaks = summarize(path)
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    temp = f"{cache_file}.{os.getpid()}.tmp"
+    with open(temp, "wb") as f:
+        peaks.tofile(f)
+    os.replace(temp, cache_file)
+    return peaks
+
+
+class WaveformCache:
+    # Waveform summaries of tracks, generated in a process pool and kept on
+    # disk as one small file of packed int16 per (path, mtime), so work done
+    # is never repeated and a library-wide build picks up where it stopped.
+    # request() is for the track that's playing; build_all() works through
+    # a list of tracks in the background. Results reach the Tk thread
+    # through deliver().
+    def __init__(self, cache_dir=DEFAULT_WAVEFORM_DIR, workers=None, memory_budget=64):
+        self.cache_dir = cache_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = None
+        self.memory = LRUCache(memory_budget)
+        self.results = queue.Queue()
+        self.pending = {}
+        self.building = None
+        self.cancelled = threading.Event()
+
+    def shutdown(self):
+        self.cancelled.set()
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def get_pool(self):
+        if self.pool is None:
+            # spawn: forking a process that runs Tk and audio threads is unsafe
+            context = multiprocessing.get_context("spawn")
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        return self.pool
+
+    def cache_file(self, path, mtime):
+        digest = hashlib.sha1(f"{path}|{mtime}".encode("utf-8", "surrogateescape")).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.peaks")
+
+    def read(self, path, mtime):
+        # Cached peaks, an empty array for files that can't be decoded, or
+        # None if not generated yet
+        key = (path, mtime)
+        peaks = self.memory.get(key)
+        if peaks is not None:
+            return peaks
+        peaks = array('h')
+        try:
+            with open(self.cache_file(path, mtime), "rb") as f:
+                peaks.frombytes(f.read())
+        except OSError:
+            return None
+        self.memory.put(key, peaks)
+        return peaks
+
+    def request(self, path, mtime, callback):
+        # callback(peaks) runs on the Tk thread; peaks is empty without a
+        # waveform (undecodable files, streams)
+        if is_url(path):
+            callback(array('h'))
+            return
+        peaks = self.read(path, mtime)
+        if peaks is not None:
+            callback(peaks)
+            return
+        key = (path, mtime)
+        if key in self.pending:
+            self.pending[key].append(callback)
+            return
+        self.pending[key] = [callback]
+        try:
+            future = self.get_pool().submit(build, path, self.cache_file(path, mtime))
+        except (BrokenProcessPool, RuntimeError):
+            self.pool = None
+            self.results.put((key, array('h')))
+            return
+        future.add_done_callback(lambda f: self.results.put((key, self.outcome(f))))
+
+    def outcome(self, future):
+        try:
+            return future.result()
+        except Exception:
+            return array('h')
+
+    def deliver(self):
+        # Tk thread: hand finished waveforms to their callbacks
+        while True:
+            try:
+                key, peaks = self.results.get_nowait()
+            except queue.Empty:
+                return
+            self.memory.put(key, peaks)
+            for callback in self.pending.pop(key, []):
+                callback(peaks)
+
+    def build_all(self, tracks):
+        # Generates the missing waveforms of tracks ((path, mtime) pairs)
+        # with every worker busy; returns False if a build is running
+        if self.building is not None and self.building.is_alive():
+            return False
+        self.cancelled.clear()
+        self.building = threading.Thread(target=self.run_build, args=(list(tracks),), daemon=True)
+        self.building.start()
+        return True
+
+    def run_build(self, tracks):
+        pool = self.get_pool()
+        running = set()
+        remaining = iter(tracks)
+        try:
+            while not self.cancelled.is_set():
+                while len(running) < 2 * self.workers:
+                    track = next(remaining, None)
+                    if track is None:
+                        break
+                    path, mtime = track
+                    cache_file = self.cache_file(path, mtime)
+                    if is_url(path) or os.path.exists(cache_file):
+                        continue
+                    running.add(pool.submit(build, path, cache_file))
+                if not running:
+                    return
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+        except (BrokenProcessPool, RuntimeError):
+            self.pool = None  # Rebuilt on next use; finished files are kept
+        finally:
+            for future in running:
+                future.cancel()
+
+
+class WaveformBar(tk.Canvas):
+    # Seek bar drawn as a waveform: per column a thin min..max line with
+    # the RMS level over it. The column items are created once; new peaks
+    # move them all in one pass and playback only recolours the columns
+    # it crossed. Without peaks it shows flat bars, like a plain progress
+    # bar.
+    def __init__(self, parent, height=48, bg="#121212"):
+        super().__init__(parent, height=height, bg=bg, highlightthickness=0)
+        self.peaks = None
+        self.peak_items = [self.create_line(0, 0, 0, 0, fill=UNPLAYED[0]) for _ in range(PEAKS)]
+        self.rms_items = [self.create_line(0, 0, 0, 0, fill=UNPLAYED[1]) for _ in range(PEAKS)]
+        self.played = 0
+        self.fraction = 0.0
+        self.bind("<Configure>", lambda e: self.layout())
+
+    def set_peaks(self, peaks):
+        # peaks: array('h') from WaveformCache; None or empty for flat bars
+        peaks = peaks if peaks else None
+        if peaks is not self.peaks:
+            self.peaks = peaks
+            self.layout()
+
+    def layout(self):
+        width = max(1, self.winfo_width())
+        height = max(1, self.winfo_height())
+        middle = height / 2
+        scale = middle / 32767
+        peaks = self.peaks if self.peaks is not None else FLAT_PEAKS
+        line_width = max(1, width / PEAKS * 0.7)
+        for i, (peak_item, rms_item) in enumerate(zip(self.peak_items, self.rms_items)):
+            low, high, rms = peaks[3 * i:3 * i + 3]
+            x = (i + 0.5) * width / PEAKS
+            # Peak lines reach at least one pixel so silence still shows
+            self.coords(peak_item, x, min(middle - high * scale, middle - 1),
+                        x, max(middle - low * scale, middle + 1))
+            self.coords(rms_item, x, middle - rms * scale, x, middle + rms * scale)
+            self.itemconfigure(peak_item, width=line_width)
+            self.itemconfigure(rms_item, width=line_width)
+
+    def set_fraction(self, fraction):
+        # Colours the columns before fraction (0..1) as played; only the
+        # columns that changed are touched
+        self.fraction = fraction
+        played = int(max(0.0, min(1.0, fraction)) * PEAKS)
+        if played == self.played:
+            return
+        low, high = sorted((played, self.played))
+        colors = PLAYED if played > self.played else UNPLAYED
+        for i in range(low, high):
+            self.itemconfigure(self.peak_items[i], fill=colors[0])
+            self.itemconfigure(self.rms_items[i], fill=colors[1])
+        self.played = played